@@ -12,22 +12,45 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
 import signal
 import sys
+import threading
 from types import FrameType
+from typing import Iterator, Optional
 
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 
 import utils.ask_gemini as ask_gemini
+import utils.async_runner as async_runner
 import utils.connect_firestore as connect_firestore
+import utils.llm as llm
 import utils.merge_text as merge_text
-from utils.logging import logger
+import utils.minutes_store as minutes_store
+import utils.transcript_store as transcript_store
+from utils.glossary import glossaries
+from utils.jobs import JOB_BACKEND, JobQueueFull, jobs, verify_task_token
+from utils.logging import log_payload, logger
+from utils.meeting_session import meeting_locks, meeting_sessions
 from utils.meeting_summarizer import MeetingSummarizer
+from utils.meeting_summarizer import MODEL_NAME as SUMMARY_MODEL_NAME
+from utils.model_calls import ModelUnavailable
+from utils.rolling_summary import RollingSummarizer
+from utils.supplement_cursor import supplement_cursors, SupplementCursor
+from utils.transcript_writer import transcript_writer
 
 app = Flask(__name__)
 # gemini_helper = dict()
 meeting_summarizer = MeetingSummarizer()
+# 会議中に確定した文字起こしを随時要約に反映する
+rolling_summarizer = RollingSummarizer(meeting_summarizer)
+# Meetings of one /save_transcript batch are merged concurrently on this pool
+SAVE_TRANSCRIPT_WORKERS = int(os.getenv("SAVE_TRANSCRIPT_WORKERS", "4"))
+save_transcript_executor = ThreadPoolExecutor(max_workers=SAVE_TRANSCRIPT_WORKERS, thread_name_prefix="save-transcript")
 
 CORS(
     app,
@@ -36,7 +59,8 @@ CORS(
             "origins": ["*"],
             # "origins": ["chrome-extension://bnkfhjcmogddbdjkaapffkimpflkdamc", "https://meet.google.com"],
             "methods": ["GET", "POST", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
+            "allow_headers": ["Content-Type", "Authorization", "Prefer"],
+            "expose_headers": ["Location"],
             "supports_credentials": False,
             # "supports_credentials": True,
         }
@@ -44,6 +68,23 @@ CORS(
 )
 
 
+def warm_up() -> None:
+    """
+    warm_up: Import and initialise the storage (Firestore) and LLM (Vertex AI) clients ahead of the first request
+    """
+    try:
+        connect_firestore.warm_up()
+        llm.warm_up(ask_gemini.MODEL_NAME, SUMMARY_MODEL_NAME)
+        logger.info("Warmed up")
+    except Exception as e:
+        logger.error(f"Error warming up: {e}")
+
+
+# WARM_UP=true: warm up in the background as soon as the app is loaded, without delaying the start
+if os.getenv("WARM_UP", "false").lower() == "true":
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
 @app.route("/")
 def hello() -> str:
     # Use basic logging with custom fields
@@ -55,44 +96,150 @@ def hello() -> str:
     return "Hello, World!"
 
 
-@app.route("/summarize_meeting", methods=["POST"])
-def summarize_meeting() -> str:
-    try:
-        # リクエストボディからuserNameを取得
-        request_data = request.get_json()
-        if "userName" not in request_data:
-            return jsonify({"status": "error", "message": "userNameが必要です"}), 400
+def log_request(chatdata_json: object) -> None:
+    """
+    log_request: Log the meetIds, item count and size of a request body; the body itself only at DEBUG level
+    """
+    items = chatdata_json if isinstance(chatdata_json, list) else [chatdata_json]
+    meet_ids = sorted({str(item["meetId"]) for item in items if isinstance(item, dict) and "meetId" in item})
+    logger.info("Received data", path=request.path, meet_ids=meet_ids, items=len(items), size=request.content_length)
+    log_payload("Received data", chatdata_json, path=request.path)
 
-        user_name = request_data["userName"]
 
-        # 特定のユーザーの全てのミーティングデータを取得
-        all_meetings = connect_firestore.get_data("minutes", user_name)
-        if not all_meetings:
-            return jsonify({"status": "error", "message": "ミーティングデータが見つかりませんでした"}), 404
+# Answered (503) when the summary model is busy, too slow or failing
+MODEL_UNAVAILABLE_MESSAGE = "要約モデルが混雑しています。しばらくしてから再度お試しください"
+# Answered (503) when too many jobs are waiting
+JOB_QUEUE_FULL_MESSAGE = "処理待ちのリクエストが多すぎます。しばらくしてから再度お試しください"
 
-        # ユーザーの最新のミーティングを探す
-        latest_timestamp = None
-        latest_content = None
 
-        for doc_id, meeting_data in all_meetings.items():
-            if "timestamp" in meeting_data:
-                current_timestamp = meeting_data["timestamp"]
-                if latest_timestamp is None or current_timestamp > latest_timestamp:
-                    latest_timestamp = current_timestamp
-                    latest_content = meeting_data.get("content")
+class SummarizeRequestError(Exception):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
 
-        if latest_content is None:
-            return jsonify({"status": "error", "message": "ユーザーのミーティングデータが見つかりませんでした"}), 404
+
+def find_meeting_to_summarize(request_data: dict) -> tuple[Optional[dict], Optional[str]]:
+    """
+    find_meeting_to_summarize: Find the summary or the text to summarize for a summarize request
+    :param request_data: dict (meetId or userName)
+    :return: (summary made during the meeting, None) or (None, meeting text to summarize)
+    """
+    # meetIdが指定された場合は、会議中に作成しておいた要約を返す
+    if "meetId" in request_data:
+        summary = rolling_summarizer.finalize(request_data["meetId"])
+        if summary is not None:
+            return summary, None
+        # 要約がこのインスタンスにない場合は、保存済みの文字起こしを要約する
+        session, confirmed_text, _ = transcript_store.read_delta(request_data["meetId"])
+        transcript_text = confirmed_text + (session.archive_text if session is not None else "")
+        if transcript_text:
+            return None, transcript_text
+
+    # リクエストボディからuserNameを取得
+    if "userName" not in request_data:
+        raise SummarizeRequestError("userNameが必要です", 400)
+
+    user_name = request_data["userName"]
+
+    # ユーザーの最新のミーティングを取得
+    latest_meeting = minutes_store.get_latest_minutes(user_name)
+    if latest_meeting is None:
+        raise SummarizeRequestError("ミーティングデータが見つかりませんでした", 404)
+
+    latest_content = latest_meeting.get("content")
+    if latest_content is None:
+        raise SummarizeRequestError("ユーザーのミーティングデータが見つかりませんでした", 404)
+
+    return None, latest_content
+
+
+def summarize_meeting_result(request_data: dict) -> tuple[int, dict]:
+    """
+    summarize_meeting_result: Summarize the meeting of a /summarize_meeting request
+    :param request_data: dict (meetId or userName)
+    :return: (HTTP status, response body)
+    """
+    try:
+        summary, meeting_text = find_meeting_to_summarize(request_data)
 
         # 会議内容を要約
-        summary = meeting_summarizer.summarize(latest_content)
+        if summary is None:
+            summary = meeting_summarizer.summarize(meeting_text)
 
-        return jsonify({"status": "success", "data": summary})
+        return 200, {"status": "success", "data": summary}
 
+    except SummarizeRequestError as e:
+        return e.status_code, {"status": "error", "message": e.message}
+    except ModelUnavailable as e:
+        logger.warning(f"Summary model unavailable: {str(e)}")
+        return 503, {"status": "error", "message": MODEL_UNAVAILABLE_MESSAGE}
+    except Exception as e:
+        logger.error(f"Error summarizing meeting: {str(e)}")
+        return 500, {"status": "error", "message": "会議の要約中にエラーが発生しました"}
+
+
+@app.route("/summarize_meeting", methods=["POST"])
+def summarize_meeting() -> str:
+    """
+    summarize_meeting: Summarize the meeting (meetId) or the latest minutes of the user (userName)
+    With "Prefer: respond-async", answer 202 with the job id at once (see /jobs/<job_id>)
+    """
+    if respond_async():
+        return submit_job("summarize_meeting", request.get_json())
+    status_code, body = summarize_meeting_result(request.get_json())
+    return jsonify(body), status_code
+
+
+# Names of the Server-Sent Events sent for the items of a summary
+SUMMARY_EVENTS = {"bullet_points": "bullet_point", "action_items": "action_item", "summary": "summary"}
+
+
+def server_sent_event(event: str, data: object) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route("/summarize_meeting/stream", methods=["POST"])
+def summarize_meeting_stream() -> Response:
+    """
+    summarize_meeting_stream: Same as /summarize_meeting, streamed as Server-Sent Events
+    :param: meetId: str (optional)
+    :param: userName: str
+    :return: text/event-stream with a "bullet_point" / "action_item" event ({"text"}) per item as soon as
+        it is generated, then a "summary" event with the whole summary, or an "error" event ({"message"})
+    """
+    try:
+        summary, meeting_text = find_meeting_to_summarize(request.get_json())
+    except SummarizeRequestError as e:
+        return jsonify({"status": "error", "message": e.message}), e.status_code
     except Exception as e:
         logger.error(f"Error summarizing meeting: {str(e)}")
         return jsonify({"status": "error", "message": "会議の要約中にエラーが発生しました"}), 500
 
+    def generate() -> Iterator[str]:
+        if summary is not None:
+            items = [(name, item) for name in ("bullet_points", "action_items") for item in summary[name]]
+            events = iter(items + [("summary", summary)])
+        else:
+            events = meeting_summarizer.summarize_stream(meeting_text)
+        try:
+            for name, value in events:
+                yield server_sent_event(SUMMARY_EVENTS[name], value if name == "summary" else {"text": value})
+        except ModelUnavailable as e:
+            logger.warning(f"Summary model unavailable: {str(e)}")
+            yield server_sent_event("error", {"message": MODEL_UNAVAILABLE_MESSAGE})
+        except Exception as e:
+            # The status line is already sent: report the error as an event
+            logger.error(f"Error summarizing meeting: {str(e)}")
+            yield server_sent_event("error", {"message": "会議の要約中にエラーが発生しました"})
+
+    # X-Accel-Buffering: keep proxies from buffering the events
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @app.route("/start_meet", methods=["POST"])
 def start_meet() -> str:
@@ -103,7 +250,7 @@ def start_meet() -> str:
     """
     # Get JSON data from POST request
     chatdata_json = request.get_json()
-    logger.info(f"Received data: {chatdata_json}")
+    log_request(chatdata_json)
     # Start a new meet with a new meetId
     try:
         if "meetId" in chatdata_json:
@@ -131,40 +278,34 @@ def save_transcript() -> str:
     """
     # Get JSON data from POST request
     chatdata_json = request.get_json()
-    logger.info(f"Received data: {chatdata_json}")
+    log_request(chatdata_json)
+
+    # Check if the json data has the required keys
+    required_keys = ("meetId", "userName", "transcript", "timestamp")
+    if not isinstance(chatdata_json, list) or not all(
+        isinstance(chatdata, dict) and all(key in chatdata for key in required_keys) for chatdata in chatdata_json
+    ):
+        # If the json data does not have the required keys, return error message
+        jsondata_save = {"result": False, "message": "missing required keys"}
+        response = jsonify(jsondata_save)
+        return response
 
     # Store the text date to the Firestrore
     try:
-        chatdata_array = sorted(chatdata_json, key=lambda x: x["timestamp"], reverse=False)
-        for chatdata in chatdata_array:
-            # Check if the json data has the required keys
-            if "meetId" in chatdata and "userName" in chatdata and "transcript" in chatdata and "timestamp" in chatdata:
-                # Load the archive text from Firestore
-                firestore_data = connect_firestore.get_data("meeting", chatdata["meetId"])
-                # If the archive text exists, save the archive text to the comparison text
-                if firestore_data:
-                    comparison_text = firestore_data["archive_text"]
-                    # Merge the new text with the archive text
-                    confirmed_text, archive_text = merge_text.merge(comparison_text, chatdata["transcript"])
-                    # Save the merged text to Firestore
-                    connect_firestore.update_data(
-                        "meeting",
-                        chatdata["meetId"],
-                        {"archive_text": archive_text, "transcript": firestore_data["transcript"] + confirmed_text},
-                    )
-                    logger.debug(f"Confirmed text: {confirmed_text}, Archive text: {archive_text}")
-                # If the archive text does not exist, save the new text to the comparison text
-                else:
-                    connect_firestore.add_data(
-                        "meeting", chatdata["meetId"], {"archive_text": chatdata["transcript"], "transcript": ""}
-                    )
-            else:
-                # If the json data does not have the required keys, return error message
-                jsondata_save = {"result": False, "message": "missing required keys"}
-                response = jsonify(jsondata_save)
-                return response
+        # Group the caption windows by meeting, keeping the timestamp order within each meeting
+        transcripts_by_meeting = {}
+        for chatdata in sorted(chatdata_json, key=lambda x: x["timestamp"], reverse=False):
+            transcripts_by_meeting.setdefault(chatdata["meetId"], []).append(chatdata["transcript"])
 
-            logger.info(f"Transcript saved: {chatdata['transcript']}")
+        if len(transcripts_by_meeting) == 1:
+            save_meeting_transcripts(*next(iter(transcripts_by_meeting.items())))
+        else:
+            futures = [
+                save_transcript_executor.submit(save_meeting_transcripts, meet_id, transcripts)
+                for meet_id, transcripts in transcripts_by_meeting.items()
+            ]
+            for future in futures:
+                future.result()
         jsondata_save = {"result": True, "message": ""}
     except Exception as e:
         logger.error(f"Error saving transcript: {e}")
@@ -174,53 +315,124 @@ def save_transcript() -> str:
     return response
 
 
-@app.route("/get_supplement", methods=["POST"])
-def get_supplement() -> str:
+def save_meeting_transcripts(meet_id: str, transcripts: list[str]) -> None:
     """
-    get_supplement: Get supplement data from Gemini API
-    :param: meetId: str
-    :param: userName: str
+    save_meeting_transcripts: Merge the caption windows of one meeting in memory and save them at once
+    :param: meet_id: str
+    :param: transcripts: list[str] (caption windows in timestamp order)
+    """
+    # Requests of the same meeting merge one at a time; other meetings are not blocked
+    with meeting_locks.lock(meet_id):
+        for attempt in range(transcript_store.COMMIT_ATTEMPTS):
+            # Load the archive text from the session cache, or from Firestore on a cache miss
+            session = meeting_sessions.get(meet_id)
+            if session is None:
+                session = transcript_store.load_session(meet_id)
+            # If the archive text does not exist, the first window becomes the comparison text
+            if session is None:
+                archive_text, windows = transcripts[0], transcripts[1:]
+            else:
+                archive_text, windows = session.archive_text, transcripts
+
+            # Merge the new texts with the archive text one after the other
+            confirmed_texts = []
+            for transcript in windows:
+                confirmed_text, archive_text = merge_text.merge(archive_text, transcript)
+                confirmed_texts.append(confirmed_text)
+            confirmed_text = "".join(confirmed_texts)
+
+            # Append the confirmed text as one new segment
+            try:
+                session = transcript_store.save(meet_id, session, confirmed_text, archive_text)
+                break
+            except connect_firestore.WriteConflict:
+                # Another instance saved the meeting since it was read: reload it and merge again
+                meeting_sessions.invalidate(meet_id)
+                if attempt + 1 == transcript_store.COMMIT_ATTEMPTS:
+                    raise
+                logger.info(f"Transcript save conflicted: {meet_id}", attempt=attempt + 1)
+                transcript_store.backoff(attempt)
+        meeting_sessions.put(meet_id, session)
+        # Fold the confirmed text into the running summary in the background (in merge order);
+        # a summary of an earlier meeting with this meetId is dropped
+        rolling_summarizer.feed(meet_id, confirmed_text, session.generation)
+
+    log_payload("Transcript merged", {"confirmed_text": confirmed_text, "archive_text": archive_text}, meet_id=meet_id)
+    logger.info(f"Transcript saved: {meet_id}", confirmed_segments=session.segment_count)
+
+
+async def collect_supplements(meet_id: str, user_name: str, role: str) -> list[dict]:
+    """
+    collect_supplements: Extract the supplements of a meeting that the user has not saved yet
+    :param: meet_id: str
+    :param: user_name: str
     :param: role: str
-    :return: response: dict
+    :return: supplements: list[dict]
+    """
+    # Read the user's saved words (cached) while the transcript is read and sent to Gemini
+    saved_words = glossaries.cached_words(user_name)
+    if saved_words is None:
+        saved_words_task = asyncio.create_task(asyncio.to_thread(glossaries.words, user_name))
+
+    # Get only the transcript confirmed since the last analysis for this user and role
+    cursor = supplement_cursors.get(meet_id, user_name, role)
+    session, delta_text, next_seq = await asyncio.to_thread(transcript_store.read_delta, meet_id, cursor.next_seq)
+    if session is not None and session.generation != cursor.generation:
+        if cursor.next_seq is not None:
+            # A new meeting reuses the meetId (ended on another instance): analyse it from its start
+            session, delta_text, next_seq = await asyncio.to_thread(transcript_store.read_delta, meet_id)
+        cursor = SupplementCursor(generation=session.generation if session is not None else None)
+    # If there is no new transcript, return empty supplement data
+    if not delta_text:
+        if saved_words is None:
+            await saved_words_task
+        return []
+
+    # Get the supplement data from the Gemini API, with the tail of the analysed transcript as context
+    try:
+        supplements = await ask_gemini.word_extraction_async(role, cursor.context_text + delta_text)
+    except ModelUnavailable as e:
+        # Fail fast with no supplements; the cursor is not advanced, so this text is analysed on a later request
+        logger.warning(f"Supplements skipped: {e}", meet_id=meet_id)
+        if saved_words is None:
+            saved_words_task.cancel()
+        return []
+    log_payload("Supplements", supplements, meet_id=meet_id)
+
+    if saved_words is None:
+        saved_words = await saved_words_task
+    logger.debug(f"Saved words: {len(saved_words)}")
+
+    # Match the document list and the words extracted so far with the word list
+    supplements_data = []
+    new_words = {}
+    for supplement in supplements:
+        word = supplement["word"]
+        if word not in saved_words and word not in cursor.supplements and word not in new_words:
+            # Add the supplement data to the supplement list
+            supplements_data.append(supplement)
+            new_words[word] = supplement["description"]
+
+    # Add all the new supplement data to Firestore in a single merged write (and to the cached glossary)
+    if new_words:
+        await asyncio.to_thread(glossaries.add, user_name, new_words)
+    extracted_words = {supplement["word"]: supplement["description"] for supplement in supplements}
+    supplement_cursors.put(meet_id, user_name, role, cursor.advance(next_seq, delta_text, extracted_words))
+    return supplements_data
+
+
+def supplement_result(chatdata_json: dict) -> tuple[int, dict]:
+    """
+    supplement_result: Get the supplements of a /get_supplement request
+    :param chatdata_json: dict (meetId, userName, role)
+    :return: (HTTP status, response body)
     """
-    # Get JSON data from POST request
-    chatdata_json = request.get_json()
-    logger.info(f"Received data: {chatdata_json}")
-
-    # Store the supplement data and return it
-    supplements_data = list(dict())
-
     try:
         # Check if the json data has the required keys
         if "meetId" in chatdata_json and "userName" in chatdata_json and "role" in chatdata_json:
-            # Get the transcript data from Firestore
-            transcript_data = connect_firestore.get_data("meeting", chatdata_json["meetId"])
-            if transcript_data and transcript_data["transcript"]:
-                # Get the transcript text from the transcript data
-                transcript_text = transcript_data["transcript"]
-                # Get the supplement data from the Gemini API
-                supplements = ask_gemini.word_extraction(chatdata_json["role"], transcript_text)
-                logger.debug(f"Supplements: {supplements}")
-
-                # Get the document list from Firestore
-                saved_words = connect_firestore.get_word_list("users", chatdata_json["userName"])
-                logger.debug(f"Saved words: {saved_words}")
-
-                # Match the document list with the word list
-                for supplement in supplements:
-                    logger.debug(f"Supplement: {supplement}")
-                    if supplement["word"] not in saved_words:
-                        # Add the supplement data to the supplement list
-                        supplements_data.append(supplement)
-                        # Add the supplement data to Firestore
-                        connect_firestore.add_data(
-                            "users", chatdata_json["userName"], {supplement["word"]: supplement["description"]}
-                        )
-                    else:
-                        pass
-            # If the transcript data does not exist, return empty supplement data
-            else:
-                supplements_data = []
+            supplements_data = async_runner.run(
+                collect_supplements(chatdata_json["meetId"], chatdata_json["userName"], chatdata_json["role"])
+            )
 
             jsondata_supplement = {"supplement": supplements_data, "result": True, "message": ""}
         else:
@@ -230,6 +442,26 @@ def get_supplement() -> str:
         logger.error(f"Error getting supplement: {e}")
         jsondata_supplement = {"supplement": [], "result": False, "message": "error getting supplement"}
 
+    return 200, jsondata_supplement
+
+
+@app.route("/get_supplement", methods=["POST"])
+def get_supplement() -> str:
+    """
+    get_supplement: Get supplement data from Gemini API
+    With "Prefer: respond-async", answer 202 with the job id at once (see /jobs/<job_id>)
+    :param: meetId: str
+    :param: userName: str
+    :param: role: str
+    :return: response: dict
+    """
+    # Get JSON data from POST request
+    chatdata_json = request.get_json()
+    log_request(chatdata_json)
+
+    if respond_async():
+        return submit_job("get_supplement", chatdata_json)
+    _, jsondata_supplement = supplement_result(chatdata_json)
     response = jsonify(jsondata_supplement)
     return response
 
@@ -243,13 +475,16 @@ def end_meet() -> str:
     """
     # Get JSON data from POST request
     chatdata_json = request.get_json()
-    logger.info(f"Received data: {chatdata_json}")
+    log_request(chatdata_json)
 
     try:
         # Check if the json data has the required keys
         if "meetId" in chatdata_json:
-            # Delete the transcript data from Firestore
-            connect_firestore.delete_data("meeting", chatdata_json["meetId"])
+            # Drop the cached session and delete the transcript data from Firestore
+            meeting_sessions.invalidate(chatdata_json["meetId"])
+            # Meet codes are reused: a new meeting must not resume the analysis of this one
+            supplement_cursors.invalidate(chatdata_json["meetId"])
+            transcript_store.delete(chatdata_json["meetId"])
             jsondata_end = {"result": True, "message": ""}
         else:
             # If the json data does not have the required keys, return error message
@@ -262,9 +497,69 @@ def end_meet() -> str:
     return response
 
 
+jobs.register("summarize_meeting", summarize_meeting_result)
+jobs.register("get_supplement", supplement_result)
+
+
+def respond_async() -> bool:
+    """respond_async: Whether the client asked for a job instead of waiting for the result (RFC 7240)"""
+    return "respond-async" in request.headers.get("Prefer", "")
+
+
+def submit_job(kind: str, params: dict) -> Response:
+    """
+    submit_job: Queue a job and answer 202 with its id, or 503 if the queue is full
+    """
+    try:
+        record = jobs.submit(kind, params)
+    except JobQueueFull as e:
+        logger.warning(f"Job queue full: {str(e)}")
+        return jsonify({"status": "error", "message": JOB_QUEUE_FULL_MESSAGE}), 503
+    response = jsonify({"jobId": record["jobId"], "status": record["status"]})
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{record['jobId']}"
+    return response
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id: str) -> str:
+    """
+    get_job: Status of a job queued with "Prefer: respond-async"
+    :param: job_id: str
+    :return: {"jobId", "kind", "status" (queued, running, done or failed), "statusCode", "result"}:
+        result is the response body of the request once the job is done, 404 if the job is unknown or expired
+    """
+    record = jobs.get(job_id)
+    if record is None:
+        return jsonify({"status": "error", "message": "job not found"}), 404
+    return jsonify(record)
+
+
+def run_job() -> str:
+    """
+    run_job: Run a job delivered by Cloud Tasks (POST /jobs/run, only with JOB_BACKEND=cloud_tasks)
+    Cloud Tasks retries the task unless it is answered with 2xx
+    """
+    if not verify_task_token(request.headers.get("Authorization", "")):
+        return jsonify({"status": "error", "message": "forbidden"}), 403
+    jobs.run(request.get_json())
+    return jsonify({"status": "success"})
+
+
+# Local jobs run on the worker threads: nothing else may run them
+if JOB_BACKEND == "cloud_tasks":
+    app.route("/jobs/run", methods=["POST"])(run_job)
+
+
 def shutdown_handler(signal_int: int, frame: FrameType) -> None:
     logger.info(f"Caught Signal {signal.strsignal(signal_int)}")
 
+    # Commit transcripts still waiting for the write-behind flush
+    try:
+        transcript_writer.flush()
+    except Exception as e:
+        logger.error(f"Error flushing transcript: {e}")
+
     from utils.logging import flush
 
     flush()
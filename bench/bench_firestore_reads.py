@@ -0,0 +1,81 @@
+"""
+Per-call cost of Firestore document reads in utils.connect_firestore, without network.
+
+    python -m bench.bench_firestore_reads [--size 200000] [--number 200]
+
+Compares the previous read path (two to_dict() copies and an f-string print of
+the whole document) against FirestoreRepository.get_data on the same snapshot.
+"""
+
+import argparse
+import contextlib
+import os
+import timeit
+
+from google.cloud.firestore_v1.base_document import DocumentSnapshot
+
+from utils.connect_firestore import FirestoreRepository
+
+
+class _FakeDocument:
+    def __init__(self, snapshot: DocumentSnapshot):
+        self._snapshot = snapshot
+
+    def get(self) -> DocumentSnapshot:
+        return self._snapshot
+
+
+class _FakeCollection:
+    def __init__(self, snapshot: DocumentSnapshot):
+        self._snapshot = snapshot
+
+    def document(self, document_id: str) -> _FakeDocument:
+        return _FakeDocument(self._snapshot)
+
+
+class FakeClient:
+    """Serves the same snapshot for every document"""
+
+    def __init__(self, snapshot: DocumentSnapshot):
+        self._snapshot = snapshot
+
+    def collection(self, collection_name: str) -> _FakeCollection:
+        return _FakeCollection(self._snapshot)
+
+
+def legacy_get_data(db: FakeClient, collection_name: str, document_id: str) -> dict:
+    doc = db.collection(collection_name).document(document_id).get()
+    if doc.exists:
+        print(f"Data from {collection_name}/{document_id}: {doc.to_dict()}")
+        return doc.to_dict()
+    else:
+        print(f"No such document: {collection_name}/{document_id}")
+        return None
+
+
+def make_snapshot(size: int) -> DocumentSnapshot:
+    data = {"archive_text": "語尾だけ変更されました変更後の文字列です", "transcript": "会議の文字起こしです" * (size // 10)}
+    return DocumentSnapshot(None, data, True, None, None, None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=200_000, help="transcript length in characters")
+    parser.add_argument("--number", type=int, default=200, help="reads per measurement")
+    args = parser.parse_args()
+
+    client = FakeClient(make_snapshot(args.size))
+    repository = FirestoreRepository(client)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        legacy = min(timeit.repeat(lambda: legacy_get_data(client, "meeting", "m1"), number=args.number, repeat=5))
+        current = min(timeit.repeat(lambda: repository.get_data("meeting", "m1"), number=args.number, repeat=5))
+
+    print(f"document size: {args.size} chars")
+    print(f"legacy get_data:  {legacy / args.number * 1e6:10.1f} us/call")
+    print(f"current get_data: {current / args.number * 1e6:10.1f} us/call")
+    print(f"saving:           {(legacy - current) / args.number * 1e6:10.1f} us/call ({legacy / current:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Cold-start import time of the app, from python -X importtime.
+
+    python -m bench.bench_import [--repeat 5] [--top 10] [--max-ms 1000]
+
+Imports app in fresh interpreters and reports the best cumulative import time,
+the slowest modules it pulls in, and the cost of the SDKs that are only imported
+on first use (Vertex AI, Firestore). Exits with status 1 when --max-ms is exceeded,
+so that it can guard against import-time regressions.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Imported on first use (or by app.warm_up), not when the app is loaded
+DEFERRED_MODULES = ["vertexai.generative_models", "firebase_admin.firestore"]
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_times(statement: str) -> list[tuple[str, int, int]]:
+    """
+    (module, cumulative import time in us, nesting depth) of every module imported by statement,
+    in the order of the report: a module comes after the modules it imports
+    """
+    env = {key: value for key, value in os.environ.items() if key != "WARM_UP"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, env=env, check=True
+    )
+    return [
+        (module, int(cumulative), len(indent) // 2)
+        for _, cumulative, indent, module in (match.groups() for match in LINE.finditer(result.stderr))
+    ]
+
+
+def subtree(times: list[tuple[str, int, int]], root: str) -> tuple[int, list[tuple[str, int, int]]]:
+    """
+    Cumulative import time of root, and the modules imported while importing it
+    """
+    index = next(i for i, (module, _, depth) in enumerate(times) if module == root and depth == 0)
+    start = index
+    while start > 0 and times[start - 1][2] > 0:
+        start -= 1
+    return times[index][1], times[start:index]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters to import app in")
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to show")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail above this import time of app")
+    args = parser.parse_args()
+
+    total, imported = min(subtree(import_times("import app"), "app") for _ in range(args.repeat))
+    total_ms = total / 1000
+
+    print(f"import app: {total_ms:8.1f} ms (best of {args.repeat})")
+    print("slowest modules imported by app (cumulative, two levels deep):")
+    for module, cumulative, _ in sorted(
+        (entry for entry in imported if entry[2] <= 2), key=lambda entry: entry[1], reverse=True
+    )[: args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+    print("deferred until first use:")
+    imported_modules = {module for module, _, _ in imported}
+    # Modules imported at interpreter startup, not by the statement
+    startup_modules = {module for module, _, _ in import_times("pass")}
+    for module in DEFERRED_MODULES:
+        cumulative = sum(
+            time
+            for name, time, depth in import_times(f"import {module}")
+            if depth == 0 and name not in startup_modules
+        )
+        warning = " (imported by app!)" if module in imported_modules else ""
+        print(f"  {cumulative / 1000:8.1f} ms  {module}{warning}")
+
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"import app took {total_ms:.1f} ms, more than {args.max_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Throughput, latency and allocations of transcript ingestion through /save_transcript, without network.
+
+    python -m bench.bench_ingest [--meetings 8] [--chunks 200] [--clients 4] [--batch 1] [--stream FILE]
+                                 [--storage memory|sqlite]
+
+Replays Google Meet-like caption streams (overlapping windows of a Japanese
+meeting whose tail is re-punctuated or rewritten by the next window) through the
+Flask test client. Gemini is replaced by utils.llm.FakeGenerativeModel without
+latency, and Firestore by a local storage backend (--storage), whose reads and
+writes are counted. Each client posts the chunks of its meetings in order, batch
+chunks per request. A second, tracemalloc-enabled replay reports allocations.
+
+--stream replays a recorded stream instead: a JSON list of caption windows,
+replayed for every meeting.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Optional
+
+import app as app_module
+from bench.counting_repository import CountingRepository
+import utils.connect_firestore as connect_firestore
+import utils.llm as llm
+from utils.local_repository import MemoryRepository, SQLiteRepository
+import utils.logging as app_logging
+import utils.merge_text as merge_text
+from utils.transcript_writer import transcript_writer
+
+SAMPLE_MEETING = os.path.join(os.path.dirname(merge_text.__file__), "sample_meeting.txt")
+# Mis-recognised tails that the next caption window corrects
+REWRITES = ["えー", "あの", "ます", "した"]
+
+
+def caption_stream(chunks: int, window: int, step: int, seed: int) -> list[str]:
+    """
+    Synthetic caption windows over the sample meeting: each window slides step
+    characters further, drops its trailing punctuation or rewrites its tail at random
+    """
+    with open(SAMPLE_MEETING, encoding="utf-8") as f:
+        text = re.sub(r"[#*\-|>`\s]+", "", f.read())
+    rng = random.Random(seed)
+    windows = []
+    end = step
+    for _ in range(chunks):
+        if end > len(text):
+            end = step
+        caption = text[max(0, end - window) : end]
+        roll = rng.random()
+        if roll < 0.3:
+            caption = caption.rstrip("。、")
+        elif roll < 0.4:
+            caption = caption[:-2] + rng.choice(REWRITES)
+        windows.append(caption)
+        end += step
+    return windows
+
+
+def install_fakes(storage: str, directory: str) -> CountingRepository:
+    """
+    :return: CountingRepository (the storage backend used by the app)
+    """
+    if storage == "sqlite":
+        repository = CountingRepository(SQLiteRepository(os.path.join(directory, "storage.db")))
+    else:
+        repository = CountingRepository(MemoryRepository())
+    connect_firestore.repository = repository
+    app_module.meeting_summarizer.model = llm.FakeGenerativeModel(
+        app_module.SUMMARY_MODEL_NAME, latency_seconds=0, jitter_seconds=0
+    )
+    return repository
+
+
+def replay(streams: dict[str, list[str]], clients: int, batch: int) -> tuple[float, list[float]]:
+    """
+    Post every stream through /save_transcript from concurrent clients
+    :return: (wall time, per-chunk latencies)
+    """
+    meet_ids = list(streams)
+    latencies: list[float] = []
+    lock = threading.Lock()
+    errors: list[Exception] = []
+
+    def run_client(index: int) -> None:
+        client = app_module.app.test_client()
+        own = []
+        try:
+            for meet_id in meet_ids[index::clients]:
+                windows = streams[meet_id]
+                for start in range(0, len(windows), batch):
+                    items = [
+                        {"meetId": meet_id, "userName": "bench", "transcript": caption, "timestamp": f"{seq:08d}"}
+                        for seq, caption in enumerate(windows[start : start + batch], start)
+                    ]
+                    began = time.perf_counter()
+                    result = client.post("/save_transcript", json=items).get_json()
+                    elapsed = time.perf_counter() - began
+                    if not result["result"]:
+                        raise RuntimeError(f"/save_transcript failed: {result['message']}")
+                    own.extend([elapsed / len(items)] * len(items))
+        except Exception as e:
+            errors.append(e)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=run_client, args=(i,)) for i in range(clients)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    transcript_writer.flush()
+    wall = time.perf_counter() - began
+    if errors:
+        raise errors[0]
+    return wall, latencies
+
+
+def merge_only(windows: list[str], repeat: int = 3) -> float:
+    """Best time per chunk of merge_text.merge alone over a stream"""
+    best = float("inf")
+    for _ in range(repeat):
+        archive = ""
+        began = time.perf_counter()
+        for caption in windows:
+            _, archive = merge_text.merge(archive, caption)
+        best = min(best, (time.perf_counter() - began) / len(windows))
+    return best
+
+
+def make_streams(args: argparse.Namespace, prefix: str, recorded: Optional[list[str]]) -> dict[str, list[str]]:
+    return {
+        f"{prefix}{i}": recorded or caption_stream(args.chunks, args.window, args.step, seed=i)
+        for i in range(args.meetings)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--meetings", type=int, default=8, help="concurrent meetings")
+    parser.add_argument("--chunks", type=int, default=200, help="caption windows per meeting")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent clients (threads)")
+    parser.add_argument("--batch", type=int, default=1, help="caption windows per request")
+    parser.add_argument("--window", type=int, default=60, help="characters per caption window")
+    parser.add_argument("--step", type=int, default=15, help="new characters per caption window")
+    parser.add_argument("--stream", help="JSON list of recorded caption windows")
+    parser.add_argument("--storage", choices=["memory", "sqlite"], default="memory", help="storage backend")
+    parser.add_argument("--log-level", default="WARNING", help="log level of the app during the replay")
+    args = parser.parse_args()
+
+    app_logging.LOG_LEVEL = logging.getLevelName(args.log_level.upper())
+    recorded = None
+    if args.stream:
+        with open(args.stream, encoding="utf-8") as f:
+            recorded = json.load(f)
+    directory = tempfile.TemporaryDirectory()
+    repository = install_fakes(args.storage, directory.name)
+
+    streams = make_streams(args, "bench-", recorded)
+    wall, latencies = replay(streams, args.clients, args.batch)
+    chunks = len(latencies)
+    percentiles = statistics.quantiles(latencies, n=100)
+
+    # Allocations of a second replay on new meetings
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    replay(make_streams(args, "bench-alloc-", recorded), args.clients, args.batch)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    growth = after.compare_to(before, "lineno")
+
+    print(
+        f"meetings: {args.meetings}, chunks: {chunks}, clients: {args.clients}, batch: {args.batch}, "
+        f"storage: {args.storage}"
+    )
+    print(f"throughput:  {chunks / wall:10.1f} chunks/s")
+    print(
+        "latency/chunk: "
+        f"p50 {percentiles[49] * 1e3:.3f} ms, p90 {percentiles[89] * 1e3:.3f} ms, "
+        f"p99 {percentiles[98] * 1e3:.3f} ms, max {max(latencies) * 1e3:.3f} ms"
+    )
+    print(f"merge only:  {merge_only(next(iter(streams.values()))) * 1e6:10.1f} us/chunk")
+    print(f"storage:     {repository.reads} reads, {repository.writes} writes")
+    print(f"allocations: peak {peak / 1024:.0f} KiB traced, retained after the replay:")
+    for stat in growth[:5]:
+        print(f"  {stat.size_diff / 1024:8.1f} KiB {stat.count_diff:+7d} blocks  {stat.traceback}")
+    directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Latency and throughput of /get_supplement and /summarize_meeting under a given model latency, without network.
+
+    python -m bench.bench_llm [--endpoint both] [--requests 100] [--clients 16] [--latency 0.5] [--jitter 0.1]
+                              [--failure-rate 0] [--max-concurrency 0] [--seed 0] [--respond-async]
+
+The models are utils.llm.FakeGenerativeModel (what LLM_PROVIDER=fake runs), so the
+model latency, jitter, failure rate and concurrency limit (a quota: calls beyond it
+fail with 429) can be set. Storage is the in-memory backend. Every request asks
+about a different user, role and text, so that none is answered from the response cache.
+With --respond-async, requests are sent with "Prefer: respond-async" and their jobs are
+polled: the latencies are then the time to the 202 and the time to the result.
+"""
+
+import argparse
+import logging
+import statistics
+import threading
+import time
+
+from flask.testing import FlaskClient
+
+import app as app_module
+import utils.ask_gemini as ask_gemini
+import utils.connect_firestore as connect_firestore
+import utils.jobs as jobs
+import utils.llm as llm
+from utils.local_repository import MemoryRepository
+import utils.logging as app_logging
+from utils.meeting_summarizer import MODEL_NAME as SUMMARY_MODEL_NAME
+import utils.minutes_store as minutes_store
+import utils.model_calls as model_calls
+import utils.transcript_store as transcript_store
+
+# Interval of the job status requests (--respond-async)
+POLL_SECONDS = 0.05
+
+TRANSCRIPT = "来週のリリースに向けてKubernetesのマニフェストとデプロイ手順を見直し、監視のダッシュボードを更新します。"
+
+
+def make_model(name: str, args: argparse.Namespace) -> llm.FakeGenerativeModel:
+    return llm.FakeGenerativeModel(
+        name, args.latency, args.jitter, args.failure_rate, args.max_concurrency, args.seed
+    )
+
+
+def prepare(endpoint: str, index: int) -> dict:
+    """Store the data a request reads and return its body"""
+    text = f"{TRANSCRIPT}（議題{index}）"
+    if endpoint == "get_supplement":
+        meet_id = f"bench-meeting-{index}"
+        connect_firestore.add_data(transcript_store.MEETING_COLLECTION, meet_id, {"archive_text": "", "segment_count": 1})
+        connect_firestore.add_data(
+            transcript_store.segment_collection(meet_id), transcript_store.segment_id(0), {"seq": 0, "text": text}
+        )
+        return {"meetId": meet_id, "userName": f"bench-user-{index}", "role": f"役割{index}"}
+    user_name = f"bench-user-{index}"
+    minutes_store.add_minutes(user_name, "meeting", text, index)
+    return {"userName": user_name}
+
+
+def succeeded(endpoint: str, status: int, body: dict) -> bool:
+    if endpoint == "get_supplement":
+        return bool(body["result"])
+    return status == 200 and body["status"] == "success"
+
+
+def post(client: FlaskClient, endpoint: str, body: dict, respond_async: bool) -> tuple[int, dict, float]:
+    """
+    Post a request, and poll its job with respond_async
+    :return: (status, body, seconds to the 202 response or to the response)
+    """
+    if not respond_async:
+        began = time.perf_counter()
+        response = client.post(f"/{endpoint}", json=body)
+        return response.status_code, response.get_json(), time.perf_counter() - began
+    began = time.perf_counter()
+    response = client.post(f"/{endpoint}", json=body, headers={"Prefer": "respond-async"})
+    accepted = time.perf_counter() - began
+    if response.status_code != 202:
+        return response.status_code, response.get_json(), accepted
+    while (record := client.get(response.headers["Location"]).get_json())["status"] not in ("done", "failed"):
+        time.sleep(POLL_SECONDS)
+    return record["statusCode"], record["result"], accepted
+
+
+def run(endpoint: str, requests: int, clients: int, respond_async: bool = False) -> tuple[float, list[float], int]:
+    """
+    Post requests to /{endpoint} from concurrent clients
+    :return: (wall time, latencies (to the result, or to the 202 with respond_async), failed requests)
+    """
+    bodies = [prepare(endpoint, i) for i in range(requests)]
+    latencies: list[float] = []
+    failures = 0
+    lock = threading.Lock()
+
+    def run_client(index: int) -> None:
+        nonlocal failures
+        client = app_module.app.test_client()
+        for body in bodies[index::clients]:
+            status, response_body, elapsed = post(client, endpoint, body, respond_async)
+            with lock:
+                latencies.append(elapsed)
+                failures += not succeeded(endpoint, status, response_body)
+
+    threads = [threading.Thread(target=run_client, args=(i,)) for i in range(clients)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - began, latencies, failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoint", choices=["get_supplement", "summarize_meeting", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients (threads)")
+    parser.add_argument("--latency", type=float, default=0.5, help="model latency per call (s)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="model latency jitter (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of model calls failing (429/503)")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="model calls in flight before 429 (0: no limit)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--respond-async", action="store_true", help="run the requests as jobs and poll them")
+    parser.add_argument("--log-level", default="CRITICAL", help="log level of the app during the run")
+    args = parser.parse_args()
+
+    app_logging.LOG_LEVEL = logging.getLevelName(args.log_level.upper())
+    connect_firestore.repository = MemoryRepository()
+    ask_gemini.model = make_model(ask_gemini.MODEL_NAME, args)
+    app_module.meeting_summarizer.model = make_model(SUMMARY_MODEL_NAME, args)
+    models = {"get_supplement": ask_gemini.model, "summarize_meeting": app_module.meeting_summarizer.model}
+
+    endpoints = list(models) if args.endpoint == "both" else [args.endpoint]
+    print(
+        f"model latency {args.latency:.2f} +/- {args.jitter:.2f} s, failure rate {args.failure_rate:.0%}, "
+        f"max concurrency {args.max_concurrency or 'unlimited'}; {args.clients} clients, "
+        f"{model_calls.MAX_CONCURRENCY} call slots per model (LLM_MAX_CONCURRENCY)"
+        + (f", {jobs.JOB_WORKERS} job workers (JOB_WORKERS)" if args.respond_async else "")
+    )
+    for endpoint in endpoints:
+        wall, latencies, failures = run(endpoint, args.requests, args.clients, args.respond_async)
+        percentiles = statistics.quantiles(latencies, n=100)
+        print(
+            f"/{endpoint}: {len(latencies) / wall:6.1f} req/s, "
+            f"p50 {percentiles[49]:.3f} s, p90 {percentiles[89]:.3f} s, p99 {percentiles[98]:.3f} s, "
+            f"failed {failures}/{len(latencies)}, model calls {models[endpoint].calls}"
+        )
+
+
+if __name__ == "__main__":
+    main()
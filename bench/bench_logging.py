@@ -0,0 +1,107 @@
+"""
+Per-line cost of the structured logger inside a traced request, without I/O.
+
+    python -m bench.bench_logging [--number 20000] [--legacy-number 3]
+
+Compares the previous trace_modifier (a project id lookup through
+google.auth.default() on every line carrying X-Cloud-Trace-Context) against the
+current one, plus the same line without a trace header as a baseline. Lines are
+rendered to os.devnull. Without Application Default Credentials the legacy lookup
+fails after the discovery; its cost is still what every log line paid.
+
+Also compares rendering on the calling thread (LOG_ASYNC=false) with handing the
+event to the log writer thread, as seen by the calling thread.
+"""
+
+import argparse
+import os
+import timeit
+
+from flask import Flask, request
+import structlog
+
+from utils import logging as app_logging
+from utils import metadata
+from utils.log_writer import AsyncLogWriter, QueueLogger
+
+
+def legacy_trace_modifier(logger: structlog.PrintLogger, log_method: str, event_dict: dict) -> dict:
+    if request:
+        trace_header = request.headers.get("X-Cloud-Trace-Context")
+        if trace_header:
+            trace = trace_header.split("/")
+            try:
+                project = metadata.get_project_id()
+            except Exception:
+                project = None
+            event_dict["logging.googleapis.com/trace"] = f"projects/{project}/traces/{trace[0]}"
+    return event_dict
+
+
+def make_logger(
+    devnull: object, legacy: bool = False, writer: AsyncLogWriter = None
+) -> structlog.stdlib.BoundLogger:
+    # Processors up to the rendering, which depends on LOG_ASYNC
+    processors = [
+        p
+        for p in structlog.get_config()["processors"]
+        if p is not app_logging.field_truncator and not isinstance(p, structlog.processors.JSONRenderer)
+    ]
+    if legacy:
+        processors = [legacy_trace_modifier if p is app_logging.trace_modifier else p for p in processors]
+    if writer is not None:
+        return structlog.wrap_logger(
+            QueueLogger(writer), processors=processors, wrapper_class=structlog.stdlib.BoundLogger
+        )
+    return structlog.wrap_logger(
+        structlog.PrintLogger(devnull),
+        processors=processors + [app_logging.field_truncator, structlog.processors.JSONRenderer()],
+        wrapper_class=structlog.stdlib.BoundLogger,
+    )
+
+
+def per_line(logger: structlog.stdlib.BoundLogger, number: int, message: str = "Transcript saved: m1") -> float:
+    def log() -> None:
+        logger.info(message, confirmed_segments=12)
+
+    return min(timeit.repeat(log, number=number, repeat=3)) / number
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20_000, help="log lines per measurement")
+    parser.add_argument("--legacy-number", type=int, default=3, help="log lines per measurement of the legacy path")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    trace_headers = {"X-Cloud-Trace-Context": "105445aa7843bc8bf206b12000100000/1;o=1"}
+    with open(os.devnull, "w") as devnull:
+        current_logger = make_logger(devnull)
+        with app.test_request_context("/save_transcript"):
+            untraced = per_line(current_logger, args.number)
+        with app.test_request_context("/save_transcript", headers=trace_headers):
+            # The first line resolves the project id, later lines reuse it
+            current_logger.info("warm up")
+            current = per_line(current_logger, args.number)
+            legacy = per_line(make_logger(devnull, legacy=True), args.legacy_number)
+            # Room for every line, so that none is dropped
+            writer = AsyncLogWriter(max_queue=args.number * 4, stream=devnull)
+            queued = per_line(make_logger(devnull, writer=writer), args.number)
+            writer.flush(timeout=60)
+            # A request body logged whole, as in "Received data: ..."
+            received = f"Received data: {[{'meetId': 'm1', 'transcript': '会議の文字起こしです' * 100}] * 10}"
+            current_received = per_line(current_logger, args.number, received)
+            queued_received = per_line(make_logger(devnull, writer=writer), args.number, received)
+            writer.flush(timeout=60)
+
+    print(f"project id: {app_logging.trace_prefix()}")
+    print(f"no trace header:        {untraced * 1e6:12.1f} us/line")
+    print(f"legacy trace_modifier:  {legacy * 1e6:12.1f} us/line")
+    print(f"current trace_modifier: {current * 1e6:12.1f} us/line ({legacy / current:.0f}x faster)")
+    print(f"queued to log writer:   {queued * 1e6:12.1f} us/line on the calling thread")
+    print(f"request body, rendered: {current_received * 1e6:12.1f} us/line")
+    print(f"request body, queued:   {queued_received * 1e6:12.1f} us/line on the calling thread")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Wall-clock time of MeetingSummarizer.summarize against a local fake model, without network.
+
+    python -m bench.bench_summarize [--chars 60000] [--chunk-size 8000] [--max-workers 4]
+
+The fake model sleeps base + per-character latency, roughly like a generation
+call whose cost grows with the prompt, so the single-prompt and map-reduce
+modes can be compared.
+"""
+
+import argparse
+import json
+import time
+
+from utils.llm_cache import llm_cache
+from utils.meeting_summarizer import MeetingSummarizer
+
+
+class LatencyFakeModel:
+    def __init__(self, base_seconds: float, seconds_per_char: float):
+        self.base_seconds = base_seconds
+        self.seconds_per_char = seconds_per_char
+        self.calls = 0
+
+    name = "latency-fake-model"
+
+    def generate_json(self, prompt: str, response_schema: dict) -> str:
+        self.calls += 1
+        time.sleep(self.base_seconds + self.seconds_per_char * len(prompt))
+        summary = {"bullet_points": [f"ポイント{self.calls}"], "action_items": [f"タスク{self.calls}"]}
+        return json.dumps(summary, ensure_ascii=False)
+
+
+def make_meeting(chars: int) -> str:
+    sentences = []
+    while sum(map(len, sentences)) < chars:
+        sentences.append(f"議題{len(sentences)}について担当者から進捗の報告がありました。")
+    return "".join(sentences)
+
+
+def run(meeting_text: str, chunk_size: int, max_workers: int, args: argparse.Namespace) -> tuple[float, int]:
+    llm_cache.clear()
+    summarizer = MeetingSummarizer(chunk_size=chunk_size, max_workers=max_workers)
+    summarizer.model = LatencyFakeModel(args.base_latency, args.latency_per_char)
+    start = time.perf_counter()
+    summarizer.summarize(meeting_text)
+    return time.perf_counter() - start, summarizer.model.calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chars", type=int, default=60_000, help="meeting length in characters")
+    parser.add_argument("--chunk-size", type=int, default=8_000)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--base-latency", type=float, default=0.5, help="fake model latency per call (s)")
+    parser.add_argument("--latency-per-char", type=float, default=0.00005, help="fake model latency per char (s)")
+    args = parser.parse_args()
+
+    meeting_text = make_meeting(args.chars)
+    single, _ = run(meeting_text, len(meeting_text), 1, args)
+    chunked, calls = run(meeting_text, args.chunk_size, args.max_workers, args)
+
+    print(f"meeting: {len(meeting_text)} chars")
+    print(f"single prompt: {single:6.2f} s (1 call)")
+    print(f"map-reduce:    {chunked:6.2f} s ({calls} calls, chunk {args.chunk_size}, {args.max_workers} workers)")
+
+
+if __name__ == "__main__":
+    main()
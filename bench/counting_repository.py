@@ -0,0 +1,87 @@
+"""
+Storage instrumentation for the benchmarks and the tests: CountingRepository wraps
+a storage backend to count its reads and writes as Firestore bills them.
+"""
+
+import threading
+from typing import Any, Iterable, Iterator, Optional
+
+from utils.local_repository import MemoryRepository
+from utils.repository import Repository, Write
+
+
+class CountingRepository(Repository):
+    """
+    Counts the read requests and the written documents of a repository, as Firestore bills them
+    (a query is counted as one read)
+    :param repository: Repository (MemoryRepository if None)
+    """
+
+    def __init__(self, repository: Optional[Repository] = None) -> None:
+        self.repository = repository or MemoryRepository()
+        self.reads = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def _count(self, reads: int = 0, writes: int = 0) -> None:
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+
+    def warm_up(self) -> None:
+        self.repository.warm_up()
+
+    def add_data(self, collection_name: str, document_id: str, data: dict) -> None:
+        self._count(writes=1)
+        self.repository.add_data(collection_name, document_id, data)
+
+    def get_data(self, collection_name: str, document_id: str) -> Optional[dict]:
+        self._count(reads=1)
+        return self.repository.get_data(collection_name, document_id)
+
+    def get_data_with_update_time(self, collection_name: str, document_id: str) -> tuple[Optional[dict], Any]:
+        self._count(reads=1)
+        return self.repository.get_data_with_update_time(collection_name, document_id)
+
+    def set_if_unchanged(
+        self, collection_name: str, document_id: str, data: dict, update_time: Any, writes: Iterable[Write] = ()
+    ) -> Any:
+        writes = list(writes)
+        self._count(writes=len(writes) + 1)
+        return self.repository.set_if_unchanged(collection_name, document_id, data, update_time, writes)
+
+    def update_data(self, collection_name: str, document_id: str, data: dict) -> None:
+        self._count(writes=1)
+        self.repository.update_data(collection_name, document_id, data)
+
+    def batch_set(self, writes: list[Write]) -> None:
+        self._count(writes=len(writes))
+        self.repository.batch_set(writes)
+
+    def stream_data(self, collection_name: str, order_by: str, start_at: Any = None) -> Iterator[dict]:
+        self._count(reads=1)
+        return self.repository.stream_data(collection_name, order_by, start_at)
+
+    def get_latest_data(self, collection_name: str, order_by: str) -> Optional[dict]:
+        self._count(reads=1)
+        return self.repository.get_latest_data(collection_name, order_by)
+
+    def delete_fields(self, collection_name: str, document_id: str, field_names: list[str]) -> None:
+        self._count(writes=1)
+        self.repository.delete_fields(collection_name, document_id, field_names)
+
+    def delete_collection(self, collection_name: str) -> None:
+        self._count(writes=1)
+        self.repository.delete_collection(collection_name)
+
+    def get_document_list(self, collection_name: str) -> list[str]:
+        self._count(reads=1)
+        return self.repository.get_document_list(collection_name)
+
+    def get_word_list(self, collection_name: str, document_id: str) -> list[str]:
+        self._count(reads=1)
+        return self.repository.get_word_list(collection_name, document_id)
+
+    def delete_data(self, collection_name: str, document_id: str) -> None:
+        self._count(writes=1)
+        self.repository.delete_data(collection_name, document_id)
@@ -138,7 +138,15 @@ def deploy(c):  # noqa: ANN001, ANN201
 def test(c):  # noqa: ANN001, ANN201
     """Run unit tests"""
     with c.prefix(venv):
-        c.run("pytest test/test_app.py")
+        c.run("pytest test --ignore=test/test_system.py")
+
+
+@task(pre=[require_venv_test])
+def bench(c):  # noqa: ANN001, ANN201
+    """Run the offline benchmarks (transcript ingestion, cold-start imports)"""
+    with c.prefix(venv):
+        c.run("python -m bench.bench_ingest")
+        c.run("python -m bench.bench_import")
 
 
 @task(pre=[require_venv_test])
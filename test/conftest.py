@@ -12,11 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+from typing import Iterator
+
 import flask
 from flask.testing import FlaskClient
 import pytest
 
 from app import app as flask_app
+from bench.counting_repository import CountingRepository
+from utils.llm_cache import LLMResponseCache
+from utils.local_repository import MemoryRepository
 
 
 @pytest.fixture
@@ -27,3 +33,74 @@ def app() -> None:
 @pytest.fixture
 def client(app: flask.app.Flask) -> FlaskClient:
     return app.test_client()
+
+
+def seed(repository: CountingRepository, collections: dict[str, dict[str, dict]]) -> None:
+    """Store {collection name: {document id: data}} without counting the writes"""
+    repository.repository.batch_set(
+        [
+            (collection_name, document_id, data)
+            for collection_name, documents in collections.items()
+            for document_id, data in documents.items()
+        ]
+    )
+
+
+def documents(repository: CountingRepository, collection_name: str) -> dict[str, dict]:
+    """{document id: data} of a collection, without counting the reads"""
+    return {
+        document_id: repository.repository.get_data(collection_name, document_id)
+        for document_id in repository.repository.get_document_list(collection_name)
+    }
+
+
+@pytest.fixture
+def firestore(monkeypatch: pytest.MonkeyPatch) -> CountingRepository:
+    import utils.connect_firestore as connect_firestore
+    from utils.glossary import glossaries
+    from utils.meeting_session import meeting_sessions
+    from utils.supplement_cursor import supplement_cursors
+    from utils.transcript_writer import transcript_writer
+
+    repository = CountingRepository(MemoryRepository())
+    monkeypatch.setattr(connect_firestore, "repository", repository)
+    # Tests flush explicitly
+    monkeypatch.setattr(transcript_writer, "flush_interval", 3600)
+    meeting_sessions._cache.clear()
+    supplement_cursors._cache.clear()
+    supplement_cursors._meetings.clear()
+    glossaries._cache.clear()
+    yield repository
+    transcript_writer.flush()
+    meeting_sessions._cache.clear()
+
+
+class FakeModel:
+    """Local stand-in for a utils.llm.LLMModel returning a fixed JSON response"""
+
+    name = "fake-model"
+
+    def __init__(self, response: object) -> None:
+        self.response_text = json.dumps(response, ensure_ascii=False)
+        self.prompts = []
+
+    def generate_json(self, prompt: str, response_schema: dict) -> str:
+        self.prompts.append(prompt)
+        return self.response_text
+
+    async def generate_json_async(self, prompt: str, response_schema: dict) -> str:
+        return self.generate_json(prompt, response_schema)
+
+    def generate_json_stream(self, prompt: str, response_schema: dict) -> Iterator[str]:
+        # Split the response into small chunks like a streamed response
+        text = self.generate_json(prompt, response_schema)
+        return iter([text[i:i + 5] for i in range(0, len(text), 5)])
+
+
+@pytest.fixture
+def llm_cache() -> LLMResponseCache:
+    from utils.llm_cache import llm_cache
+
+    llm_cache.clear()
+    yield llm_cache
+    llm_cache.clear()
@@ -12,8 +12,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import threading
+import time
+
 import flask
 from flask.testing import FlaskClient
+import pytest
+
+import app as app_module
+from bench.counting_repository import CountingRepository
+from test.conftest import documents, FakeModel, seed
+import utils.ask_gemini as ask_gemini
+import utils.llm as llm
+import utils.logging as app_logging
+import utils.minutes_store as minutes_store
+from utils.model_calls import CircuitOpen, model_calls
+import utils.supplement_cursor as supplement_cursor
+import utils.transcript_store as transcript_store
+from utils.transcript_writer import transcript_writer
 
 
 def test_get_index(app: flask.app.Flask, client: FlaskClient) -> None:
@@ -24,3 +43,417 @@ def test_get_index(app: flask.app.Flask, client: FlaskClient) -> None:
 def test_post_index(app: flask.app.Flask, client: FlaskClient) -> None:
     res = client.post("/")
     assert res.status_code == 405
+
+
+def test_save_transcript_reads_firestore_only_on_cache_miss(client: FlaskClient, firestore: CountingRepository) -> None:
+    windows = ["変更前の文字列です。この文字列は", "文字列です。この文字列は語尾だけ変更されました", "語尾だけ変更されました。以上"]
+    for timestamp, window in enumerate(windows):
+        res = client.post(
+            "/save_transcript",
+            json=[{"meetId": "m1", "userName": "u1", "transcript": window, "timestamp": str(timestamp)}],
+        )
+        assert res.get_json()["result"] is True
+
+    assert firestore.reads == 1
+    transcript_writer.flush()
+    # The meeting document is coalesced into a single write, confirmed texts are appended as segments
+    meeting = firestore.repository.get_data("meeting", "m1")
+    assert meeting.pop("generation")
+    assert meeting == {"archive_text": "語尾だけ変更されました以上", "segment_count": 2}
+    assert documents(firestore, "meeting/m1/segments") == {
+        "00000000": {"seq": 0, "text": "変更前の"},
+        "00000001": {"seq": 1, "text": "文字列ですこの文字列は"},
+    }
+    assert transcript_store.read_transcript("m1") == "変更前の文字列ですこの文字列は"
+
+    client.post("/end_meet", json={"meetId": "m1"})
+    assert "m1" not in documents(firestore, "meeting")
+    assert not documents(firestore, "meeting/m1/segments")
+
+
+def test_request_bodies_are_logged_only_at_debug_level(
+    client: FlaskClient, firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    logged = []
+
+    class RecordingLogger:
+        def __getattr__(self, level: str) -> object:
+            return lambda message, **fields: logged.append((level, message, fields))
+
+    monkeypatch.setattr(app_module, "logger", RecordingLogger())
+    monkeypatch.setattr(app_logging, "logger", RecordingLogger())
+    monkeypatch.setattr(app_logging, "LOG_LEVEL", logging.INFO)
+    body = [{"meetId": "m1", "userName": "u1", "transcript": "長い文字起こし" * 100, "timestamp": i} for i in range(3)]
+
+    client.post("/save_transcript", json=body)
+    assert ("info", "Received data") == logged[0][:2]
+    assert {key: logged[0][2][key] for key in ("meet_ids", "items")} == {"meet_ids": ["m1"], "items": 3}
+    assert "長い文字起こし" not in repr(logged)
+
+    monkeypatch.setattr(app_logging, "LOG_LEVEL", logging.DEBUG)
+    client.post("/save_transcript", json=body)
+    assert any(level == "debug" and "長い文字起こし" in fields["payload"] for level, _, fields in logged)
+
+
+def test_trace_prefix_retries_a_failed_project_lookup(monkeypatch: pytest.MonkeyPatch) -> None:
+    projects = iter([None, "my-project"])
+    monkeypatch.setattr(app_logging, "_lookup_project", lambda: next(projects))
+    monkeypatch.setattr(app_logging, "_trace_prefix", None)
+    monkeypatch.setattr(app_logging, "_trace_prefix_retry_at", 0.0)
+    monkeypatch.setattr(app_logging, "TRACE_PROJECT_RETRY_SECONDS", 0.05)
+
+    assert app_logging.trace_prefix() is None
+    # Not looked up again before the retry delay
+    assert app_logging.trace_prefix() is None
+    time.sleep(0.05)
+    assert app_logging.trace_prefix() == "projects/my-project/traces/"
+    # Kept once found
+    assert app_logging.trace_prefix() == "projects/my-project/traces/"
+
+
+def test_save_transcript_merges_a_batch_per_meeting(client: FlaskClient, firestore: CountingRepository) -> None:
+    windows = ["変更前の文字列です。この文字列は", "文字列です。この文字列は語尾だけ変更されました", "語尾だけ変更されました。以上"]
+    # A backlog of two meetings, out of order
+    batch = [
+        {"meetId": meet_id, "userName": "u1", "transcript": window, "timestamp": f"{timestamp}{meet_id}"}
+        for meet_id in ("m1", "m2")
+        for timestamp, window in enumerate(windows)
+    ]
+    res = client.post("/save_transcript", json=batch[::-1])
+    assert res.get_json()["result"] is True
+
+    # One read per meeting, and one segment per meeting
+    assert firestore.reads == 2
+    transcript_writer.flush()
+    for meet_id in ("m1", "m2"):
+        meeting = firestore.repository.get_data("meeting", meet_id)
+        assert meeting.pop("generation")
+        assert meeting == {"archive_text": "語尾だけ変更されました以上", "segment_count": 1}
+        assert transcript_store.read_transcript(meet_id) == "変更前の文字列ですこの文字列は"
+
+    res = client.post("/save_transcript", json=[{"meetId": "m3", "transcript": "a", "timestamp": "0"}])
+    assert res.get_json()["result"] is False
+    assert "m3" not in documents(firestore, "meeting")
+
+
+def test_get_supplement_saves_new_words_in_one_write(
+    client: FlaskClient, firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def word_extraction_async(role: str, text: str) -> list[dict]:
+        assert text == "変更前の文字列です"
+        return [
+            {"word": "文字列", "description": "文字の並び"},
+            {"word": "変更", "description": "変えること"},
+            {"word": "変更", "description": "変えること"},
+        ]
+
+    monkeypatch.setattr(ask_gemini, "word_extraction_async", word_extraction_async)
+    seed(
+        firestore,
+        {
+            "meeting": {"m1": {"archive_text": "", "segment_count": 1}},
+            "meeting/m1/segments": {"00000000": {"seq": 0, "text": "変更前の文字列です"}},
+            "users": {"u1": {"文字列": "saved"}},
+        },
+    )
+
+    res = client.post("/get_supplement", json={"meetId": "m1", "userName": "u1", "role": "主婦"})
+
+    assert res.get_json()["supplement"] == [{"word": "変更", "description": "変えること"}]
+    assert firestore.repository.get_data("users", "u1") == {"文字列": "saved", "変更": "変えること"}
+    assert firestore.writes == 1
+
+
+def test_get_supplement_caches_the_saved_words(
+    client: FlaskClient, firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def word_extraction_async(role: str, text: str) -> list[dict]:
+        return [{"word": "文字列", "description": "文字の並び"}, {"word": "変更", "description": "変えること"}]
+
+    monkeypatch.setattr(ask_gemini, "word_extraction_async", word_extraction_async)
+    seed(
+        firestore,
+        {
+            "meeting": {meet_id: {"archive_text": "", "segment_count": 1} for meet_id in ("m1", "m2")},
+            "meeting/m1/segments": {"00000000": {"seq": 0, "text": "変更前の文字列です"}},
+            "meeting/m2/segments": {"00000000": {"seq": 0, "text": "文字列を変更します"}},
+            "users": {"u1": {"文字列": "saved"}},
+        },
+    )
+
+    res = client.post("/get_supplement", json={"meetId": "m1", "userName": "u1", "role": "主婦"})
+    assert res.get_json()["supplement"] == [{"word": "変更", "description": "変えること"}]
+    glossary_reads = firestore.reads
+
+    # The word saved by the first poll is known without reading the glossary again
+    res = client.post("/get_supplement", json={"meetId": "m2", "userName": "u1", "role": "主婦"})
+    assert res.get_json()["supplement"] == []
+    assert firestore.reads - glossary_reads == 2  # the meeting and its segments only
+
+
+def test_get_supplement_sends_only_unseen_transcript(
+    client: FlaskClient, firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    sent_texts = []
+
+    async def word_extraction_async(role: str, text: str) -> list[dict]:
+        sent_texts.append(text)
+        return [{"word": "議題", "description": "話し合う題目"}]
+
+    monkeypatch.setattr(ask_gemini, "word_extraction_async", word_extraction_async)
+    monkeypatch.setattr(supplement_cursor, "CONTEXT_CHARS", 3)
+    seed(
+        firestore,
+        {
+            "meeting": {"m1": {"archive_text": "", "segment_count": 1}},
+            "meeting/m1/segments": {"00000000": {"seq": 0, "text": "最初の議題です"}},
+        },
+    )
+    request = {"meetId": "m1", "userName": "u1", "role": "主婦"}
+
+    assert client.post("/get_supplement", json=request).get_json()["supplement"] == [
+        {"word": "議題", "description": "話し合う題目"}
+    ]
+    # Nothing new: Gemini is not called
+    assert client.post("/get_supplement", json=request).get_json()["supplement"] == []
+    firestore.repository.add_data("meeting/m1/segments", "00000001", {"seq": 1, "text": "次の議題に移ります"})
+    # The already extracted word is not returned again
+    assert client.post("/get_supplement", json=request).get_json()["supplement"] == []
+
+    assert sent_texts == ["最初の議題です", "題です次の議題に移ります"]
+
+
+def test_end_meet_drops_the_supplement_cursors_of_the_meeting(
+    client: FlaskClient, firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    sent_texts = []
+
+    async def word_extraction_async(role: str, text: str) -> list[dict]:
+        sent_texts.append(text)
+        return []
+
+    monkeypatch.setattr(ask_gemini, "word_extraction_async", word_extraction_async)
+    monkeypatch.setattr(supplement_cursor, "CONTEXT_CHARS", 0)
+    request = {"meetId": "m1", "userName": "u1", "role": "主婦"}
+    client.post("/save_transcript", json=[{**request, "transcript": "前回の会議", "timestamp": 1}])
+    # A window without overlap confirms the previous one
+    client.post("/save_transcript", json=[{**request, "transcript": "ABC", "timestamp": 2}])
+    client.post("/get_supplement", json=request)
+
+    # The meet code is reused for the next meeting
+    client.post("/end_meet", json={"meetId": "m1"})
+    client.post("/save_transcript", json=[{**request, "transcript": "今回の会議", "timestamp": 3}])
+    client.post("/save_transcript", json=[{**request, "transcript": "ABC", "timestamp": 4}])
+    client.post("/get_supplement", json=request)
+
+    assert sent_texts == ["前回の会議", "今回の会議"]
+
+
+def test_get_supplement_analyses_a_new_meeting_after_another_instance_ended_the_earlier_one(
+    client: FlaskClient, firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    sent_texts = []
+
+    async def word_extraction_async(role: str, text: str) -> list[dict]:
+        sent_texts.append(text)
+        return []
+
+    monkeypatch.setattr(ask_gemini, "word_extraction_async", word_extraction_async)
+    monkeypatch.setattr(supplement_cursor, "CONTEXT_CHARS", 0)
+    seed(
+        firestore,
+        {
+            "meeting": {"m1": {"archive_text": "", "segment_count": 2, "generation": "earlier"}},
+            "meeting/m1/segments": {
+                "00000000": {"seq": 0, "text": "前回の会議"},
+                "00000001": {"seq": 1, "text": "の続き"},
+            },
+        },
+    )
+    request = {"meetId": "m1", "userName": "u1", "role": "主婦"}
+    client.post("/get_supplement", json=request)
+
+    # Another instance ends the meeting, and saves the start of a new meeting with the same meetId
+    transcript_store.delete("m1")
+    transcript_store.commit("m1", None, "今回の会議", "")
+    client.post("/get_supplement", json=request)
+    client.post("/get_supplement", json=request)
+
+    assert sent_texts == ["前回の会議の続き", "今回の会議"]
+
+
+def test_get_supplement_gets_a_call_slot_while_summaries_take_all_of_theirs(
+    client: FlaskClient, firestore: CountingRepository, llm_cache: object, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    release = threading.Event()
+
+    class SlowSummaryModel(FakeModel):
+        name = "summary-model"
+
+        def generate_json(self, prompt: str, response_schema: dict) -> str:
+            response_text = super().generate_json(prompt, response_schema)
+            release.wait(5)
+            return response_text
+
+    summary_model = SlowSummaryModel({"bullet_points": ["議題"], "action_items": []})
+    monkeypatch.setattr(app_module.meeting_summarizer, "model", summary_model)
+    monkeypatch.setattr(ask_gemini, "model", FakeModel([{"word": "議題", "description": "話し合う題目"}]))
+    monkeypatch.setattr(llm, "WORD_EXTRACTION_TIMEOUT_SECONDS", 0.5)
+    seed(
+        firestore,
+        {
+            "meeting": {"m1": {"archive_text": "", "segment_count": 1}},
+            "meeting/m1/segments": {"00000000": {"seq": 0, "text": "最初の議題です"}},
+        },
+    )
+
+    # Summaries (e.g. background folds) take every call slot of the summary model
+    with ThreadPoolExecutor(max_workers=model_calls.max_concurrency) as summaries:
+        futures = [
+            summaries.submit(app_module.meeting_summarizer.summarize, f"議題{i}")
+            for i in range(model_calls.max_concurrency)
+        ]
+        while len(summary_model.prompts) < model_calls.max_concurrency:
+            time.sleep(0.01)
+
+        request = {"meetId": "m1", "userName": "u1", "role": "主婦"}
+        assert client.post("/get_supplement", json=request).get_json()["supplement"] == [
+            {"word": "議題", "description": "話し合う題目"}
+        ]
+        release.set()
+        for future in futures:
+            future.result()
+
+
+def test_get_supplement_answers_empty_while_the_model_is_unavailable(
+    client: FlaskClient, firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    available = False
+
+    async def word_extraction_async(role: str, text: str) -> list[dict]:
+        if not available:
+            raise CircuitOpen("model: circuit open")
+        return [{"word": "議題", "description": "話し合う題目"}]
+
+    monkeypatch.setattr(ask_gemini, "word_extraction_async", word_extraction_async)
+    seed(
+        firestore,
+        {
+            "meeting": {"m1": {"archive_text": "", "segment_count": 1}},
+            "meeting/m1/segments": {"00000000": {"seq": 0, "text": "最初の議題です"}},
+        },
+    )
+    request = {"meetId": "m1", "userName": "u1", "role": "主婦"}
+
+    assert client.post("/get_supplement", json=request).get_json() == {"supplement": [], "result": True, "message": ""}
+    # The transcript was not consumed: it is analysed once the model is back
+    available = True
+    assert client.post("/get_supplement", json=request).get_json()["supplement"] == [
+        {"word": "議題", "description": "話し合う題目"}
+    ]
+
+
+def test_summarize_meeting_summarizes_latest_minutes_of_either_layout(
+    client: FlaskClient, firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    summary = {"bullet_points": ["二回目"], "action_items": []}
+    monkeypatch.setattr(app_module.meeting_summarizer, "summarize", lambda text: summary if text == "二回目" else None)
+    legacy_meetings = {"a": {"timestamp": 1, "content": "一回目"}, "b": {"timestamp": 2, "content": "二回目"}}
+    seed(firestore, {"minutes": {"u1": dict(legacy_meetings)}})
+
+    res = client.post("/summarize_meeting", json={"userName": "u1"})
+    assert res.get_json() == {"status": "success", "data": summary}
+    # The legacy document is read, not migrated
+    assert firestore.repository.get_data("minutes", "u1") == legacy_meetings
+
+    assert minutes_store.migrate_minutes("u1") == 2
+    firestore.reads = 0
+    assert client.post("/summarize_meeting", json={"userName": "u1"}).get_json()["data"] == summary
+    # The latest migrated meeting and the legacy document
+    assert firestore.reads == 2
+    assert client.post("/summarize_meeting", json={"userName": "u2"}).status_code == 404
+
+
+def test_latest_minutes_include_meetings_written_in_the_legacy_layout_after_migration(
+    firestore: CountingRepository,
+) -> None:
+    seed(firestore, {"minutes": {"u1": {"a": {"timestamp": 1, "content": "一回目"}}}})
+    assert minutes_store.migrate_minutes("u1") == 1
+    # The writer of the minutes still uses the legacy layout
+    seed(firestore, {"minutes": {"u1": {"b": {"timestamp": 2, "content": "二回目"}}}})
+    assert minutes_store.get_latest_minutes("u1") == {"timestamp": 2, "content": "二回目"}
+
+    minutes_store.add_minutes("u1", "c", "三回目", 3)
+    assert minutes_store.get_latest_minutes("u1") == {"timestamp": 3, "content": "三回目"}
+
+
+def test_summarize_meeting_covers_only_the_current_meeting_of_a_reused_meet_id(
+    client: FlaskClient, firestore: CountingRepository, llm_cache: object, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    summary = {"bullet_points": ["今回の議題"], "action_items": []}
+    model = FakeModel(summary)
+    monkeypatch.setattr(app_module.meeting_summarizer, "model", model)
+    monkeypatch.setattr(app_module.rolling_summarizer, "fold_chars", 1)
+    request = {"meetId": "m1", "userName": "u1"}
+    client.post("/save_transcript", json=[{**request, "transcript": "前回の会議", "timestamp": 1}])
+    client.post("/save_transcript", json=[{**request, "transcript": "ABC", "timestamp": 2}])
+    # Folded into a running summary of the earlier meeting
+    state = app_module.rolling_summarizer._states.get("m1")
+    while state.folding is not None:
+        time.sleep(0.01)
+    assert len(model.prompts) == 1
+    client.post("/end_meet", json={"meetId": "m1"})
+    client.post("/save_transcript", json=[{**request, "transcript": "今回の会議", "timestamp": 3}])
+
+    assert client.post("/summarize_meeting", json={"meetId": "m1"}).get_json()["data"] == summary
+    # Only the unconfirmed window of this meeting is summarized, without the summary of the earlier meeting
+    assert "今回の会議" in model.prompts[-1] and "これまでの要約" not in model.prompts[-1]
+
+
+def test_summarize_meeting_drops_the_summary_of_a_meeting_ended_on_another_instance(
+    client: FlaskClient, firestore: CountingRepository, llm_cache: object, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    summary = {"bullet_points": ["今回の議題"], "action_items": []}
+    model = FakeModel(summary)
+    monkeypatch.setattr(app_module.meeting_summarizer, "model", model)
+    monkeypatch.setattr(app_module.rolling_summarizer, "fold_chars", 1)
+    request = {"meetId": "m1", "userName": "u1"}
+    client.post("/save_transcript", json=[{**request, "transcript": "前回の会議", "timestamp": 1}])
+    client.post("/save_transcript", json=[{**request, "transcript": "ABC", "timestamp": 2}])
+    state = app_module.rolling_summarizer._states.get("m1")
+    while state.folding is not None:
+        time.sleep(0.01)
+
+    # Another instance ends the meeting, and saves the start of a new meeting with the same meetId
+    transcript_store.delete("m1")
+    transcript_store.commit("m1", None, "今回の会議", "ABC")
+    # The session cached here conflicts and is reloaded
+    client.post("/save_transcript", json=[{**request, "transcript": "DEF", "timestamp": 3}])
+    state = app_module.rolling_summarizer._states.get("m1")
+    while state.folding is not None:
+        time.sleep(0.01)
+
+    assert client.post("/summarize_meeting", json={"meetId": "m1"}).get_json()["data"] == summary
+    # The new meeting is summarized from its start, without the earlier meeting
+    assert "今回の会議ABC" in model.prompts[1]
+    assert not any("前回の会議" in prompt for prompt in model.prompts[1:])
+
+
+def test_summarize_meeting_stream_sends_items_as_events(
+    client: FlaskClient, firestore: CountingRepository, llm_cache: object, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    summary = {"bullet_points": ["議題A", "議題B"], "action_items": ["資料作成"]}
+    monkeypatch.setattr(app_module.meeting_summarizer, "model", FakeModel(summary))
+    seed(firestore, {"minutes/u1/meetings": {"a": {"timestamp": 1, "content": "議題AとBを話しました"}}})
+
+    res = client.post("/summarize_meeting/stream", json={"userName": "u1"})
+    assert res.mimetype == "text/event-stream"
+    events = [event.split("\n") for event in res.get_data(as_text=True).strip().split("\n\n")]
+    assert [(event[0], json.loads(event[1].removeprefix("data: "))) for event in events] == [
+        ("event: bullet_point", {"text": "議題A"}),
+        ("event: bullet_point", {"text": "議題B"}),
+        ("event: action_item", {"text": "資料作成"}),
+        ("event: summary", summary),
+    ]
+
+    assert client.post("/summarize_meeting/stream", json={"userName": "u2"}).status_code == 404
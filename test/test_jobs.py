@@ -0,0 +1,169 @@
+import threading
+import time
+
+from flask.testing import FlaskClient
+import pytest
+
+import app as app_module
+from bench.counting_repository import CountingRepository
+from test.conftest import seed
+from utils.jobs import JobManager, JobQueueFull, LocalTaskQueue, MemoryJobStore, verify_task_token
+
+
+def wait_for(manager: JobManager, job_id: str, timeout: float = 5) -> dict:
+    """Poll a job until it is done or failed"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        record = manager.get(job_id)
+        if record["status"] in ("done", "failed"):
+            return record
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_jobs_run_in_the_background_and_keep_their_result() -> None:
+    manager = JobManager()
+    release = threading.Event()
+
+    def handler(params: dict) -> tuple[int, dict]:
+        release.wait(5)
+        if params["n"] < 0:
+            raise ValueError("negative")
+        return 200, {"double": params["n"] * 2}
+
+    manager.register("double", handler)
+    record = manager.submit("double", {"n": 21})
+    failing = manager.submit("double", {"n": -1})
+    assert record["status"] == "queued"
+    assert manager.get(record["jobId"])["status"] in ("queued", "running")
+
+    release.set()
+    assert wait_for(manager, record["jobId"]) == {
+        "jobId": record["jobId"],
+        "kind": "double",
+        "status": "done",
+        "statusCode": 200,
+        "result": {"double": 42},
+    }
+    assert wait_for(manager, failing["jobId"])["statusCode"] == 500
+    assert manager.get("unknown") is None
+    with pytest.raises(ValueError):
+        manager.submit("unknown", {})
+
+
+def test_finished_jobs_are_not_run_again_and_expire() -> None:
+    manager = JobManager()
+    manager.store = MemoryJobStore(ttl_seconds=0.05)
+    calls = []
+    manager.register("count", lambda params: (200, calls.append(1)))
+
+    record = manager.submit("count", {})
+    wait_for(manager, record["jobId"])
+    # A task delivered twice (Cloud Tasks delivers at least once)
+    manager.run({"jobId": record["jobId"], "kind": "count", "params": {}})
+    assert len(calls) == 1
+
+    time.sleep(0.05)
+    assert manager.get(record["jobId"]) is None
+
+
+def test_local_queue_refuses_jobs_beyond_its_pending_limit() -> None:
+    release = threading.Event()
+    queue = LocalTaskQueue(lambda task: release.wait(5), workers=1, max_pending=2)
+    queue.create_task({})
+    queue.create_task({})
+    with pytest.raises(JobQueueFull):
+        queue.create_task({})
+    release.set()
+    time.sleep(0.05)
+    queue.create_task({})
+
+
+def test_jobs_refused_by_the_queue_are_not_left_queued() -> None:
+    manager = JobManager()
+    manager.register("count", lambda params: (200, None))
+    refused = []
+
+    def create_task(task: dict) -> None:
+        refused.append(task["jobId"])
+        raise JobQueueFull("Too many jobs waiting")
+
+    manager.queue.create_task = create_task
+    with pytest.raises(JobQueueFull):
+        manager.submit("count", {})
+    assert manager.get(refused[0])["status"] == "failed"
+
+
+def test_summarize_meeting_responds_async_with_a_job(
+    client: FlaskClient, firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    summary = {"bullet_points": ["議題A"], "action_items": []}
+    monkeypatch.setattr(app_module.meeting_summarizer, "summarize", lambda text: summary)
+    seed(firestore, {"minutes/u1/meetings": {"a": {"timestamp": 1, "content": "議題Aを話しました"}}})
+    headers = {"Prefer": "respond-async"}
+
+    res = client.post("/summarize_meeting", json={"userName": "u1"}, headers=headers)
+    assert res.status_code == 202
+    job_id = res.get_json()["jobId"]
+    assert res.headers["Location"] == f"/jobs/{job_id}"
+
+    wait_for(app_module.jobs, job_id)
+    record = client.get(f"/jobs/{job_id}").get_json()
+    assert (record["status"], record["statusCode"], record["result"]) == (
+        "done",
+        200,
+        {"status": "success", "data": summary},
+    )
+
+    # Request errors are the result of the job
+    job_id = client.post("/summarize_meeting", json={"userName": "u2"}, headers=headers).get_json()["jobId"]
+    assert wait_for(app_module.jobs, job_id)["statusCode"] == 404
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_get_supplement_responds_async_and_jobs_run_only_from_cloud_tasks(
+    client: FlaskClient, firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(app_module, "supplement_result", lambda data: (200, {"supplement": [], "result": True}))
+    monkeypatch.setattr(app_module.jobs, "_handlers", {"get_supplement": app_module.supplement_result})
+
+    res = client.post("/get_supplement", json={"meetId": "m1"}, headers={"Prefer": "respond-async"})
+    assert res.status_code == 202
+    assert wait_for(app_module.jobs, res.get_json()["jobId"])["result"] == {"supplement": [], "result": True}
+
+    # No POST /jobs/run with local jobs
+    task = {"jobId": "j1", "kind": "get_supplement", "params": {}}
+    assert client.post("/jobs/run", json=task, headers={"X-CloudTasks-TaskName": "j1"}).status_code == 405
+
+    # The Cloud Tasks handler runs tasks with a valid token only
+    monkeypatch.setattr(app_module, "verify_task_token", lambda authorization: authorization == "Bearer valid")
+    with app_module.app.test_request_context("/jobs/run", method="POST", json=task):
+        assert app_module.run_job()[1] == 403
+    assert client.get("/jobs/j1").status_code == 404
+    with app_module.app.test_request_context(
+        "/jobs/run", method="POST", json=task, headers={"Authorization": "Bearer valid"}
+    ):
+        app_module.run_job()
+    assert client.get("/jobs/j1").get_json()["status"] == "done"
+
+
+def test_task_tokens_must_be_issued_to_the_tasks_service_account(monkeypatch: pytest.MonkeyPatch) -> None:
+    from google.oauth2 import id_token
+
+    claims = {"email": "tasks@project.iam.gserviceaccount.com", "email_verified": True}
+
+    def verify_oauth2_token(token: str, request: object, audience: str) -> dict:
+        if token != "signed" or audience != "https://service/jobs/run":
+            raise ValueError("Token verification failed")
+        return claims
+
+    monkeypatch.setattr(id_token, "verify_oauth2_token", verify_oauth2_token)
+    configured = {"service_account": "tasks@project.iam.gserviceaccount.com", "audience": "https://service/jobs/run"}
+
+    assert verify_task_token("Bearer signed", **configured)
+    assert not verify_task_token("Bearer forged", **configured)
+    assert not verify_task_token("", **configured)
+    assert not verify_task_token("Bearer signed", service_account="", audience="https://service/jobs/run")
+    assert not verify_task_token("Bearer signed", **{**configured, "audience": "https://other/jobs/run"})
+    claims["email"] = "someone@example.com"
+    assert not verify_task_token("Bearer signed", **configured)
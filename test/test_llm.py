@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+
+from google.api_core.exceptions import GoogleAPICallError, ResourceExhausted
+import pytest
+
+import utils.ask_gemini as ask_gemini
+import utils.llm as llm
+from utils.llm_cache import LLMResponseCache
+import utils.meeting_summarizer as meeting_summarizer
+
+PROMPT = "来週のリリースに向けてKubernetesのマニフェストとデプロイ手順を見直します。"
+
+
+def test_fake_response_follows_the_schema_and_is_deterministic() -> None:
+    words = llm.fake_response(ask_gemini.response_schema, PROMPT)
+    assert words == llm.fake_response(ask_gemini.response_schema, PROMPT)
+    assert 1 <= len(words) <= 3
+    assert all(set(word) == {"word", "description"} and isinstance(word["word"], str) for word in words)
+
+    summary = llm.fake_response(meeting_summarizer.response_schema, PROMPT)
+    assert set(summary) == {"bullet_points", "action_items"}
+    assert all(isinstance(point, str) for point in summary["bullet_points"] + summary["action_items"])
+
+
+def test_fake_model_answers_after_its_latency() -> None:
+    model = llm.FakeGenerativeModel("model", latency_seconds=0.05, jitter_seconds=0)
+
+    began = time.perf_counter()
+    text = model.generate_json(PROMPT, ask_gemini.response_schema)
+    assert time.perf_counter() - began >= 0.05
+    assert json.loads(text) == llm.fake_response(ask_gemini.response_schema, PROMPT)
+    assert "".join(model.generate_json_stream(PROMPT, ask_gemini.response_schema)) == text
+    assert asyncio.run(model.generate_json_async(PROMPT, ask_gemini.response_schema)) == text
+    assert model.name == "fake:model"
+
+
+def test_fake_model_failures_are_reproducible() -> None:
+    def outcomes(seed: int) -> list[bool]:
+        model = llm.FakeGenerativeModel("model", latency_seconds=0, jitter_seconds=0, failure_rate=0.5, seed=seed)
+        results = []
+        for _ in range(20):
+            try:
+                model.generate_json(PROMPT, ask_gemini.response_schema)
+                results.append(True)
+            except GoogleAPICallError as e:
+                assert e.code in (429, 503)
+                results.append(False)
+        return results
+
+    assert outcomes(1) == outcomes(1)
+    assert 0 < outcomes(1).count(False) < 20
+
+
+def test_fake_model_rejects_calls_beyond_its_concurrency() -> None:
+    model = llm.FakeGenerativeModel("model", latency_seconds=0, jitter_seconds=0, max_concurrency=1)
+    stream = model.generate_json_stream(PROMPT, ask_gemini.response_schema)
+    next(stream)
+    with pytest.raises(ResourceExhausted):
+        model.generate_json(PROMPT, ask_gemini.response_schema)
+    list(stream)
+    assert model.generate_json(PROMPT, ask_gemini.response_schema)
+
+
+def test_word_extraction_runs_on_the_fake_provider(
+    monkeypatch: pytest.MonkeyPatch, llm_cache: LLMResponseCache
+) -> None:
+    monkeypatch.setattr(llm, "PROVIDER", "fake")
+    monkeypatch.setattr(llm, "_models", {})
+    monkeypatch.setattr(ask_gemini, "model", None)
+    monkeypatch.setattr(llm, "FAKE_LATENCY_SECONDS", 0)
+
+    words = ask_gemini.word_extraction("エンジニア", PROMPT)
+    assert isinstance(ask_gemini.model, llm.FakeGenerativeModel)
+    assert words and all("word" in word and "description" in word for word in words)
+    with pytest.raises(ValueError):
+        llm.create_model("model", "openai")
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from bench.counting_repository import CountingRepository
+from test.conftest import FakeModel
+import utils.ask_gemini as ask_gemini
+from utils.llm_cache import cache_key, LLMResponseCache
+from utils.meeting_summarizer import MeetingSummarizer
+
+SUPPLEMENTS = [{"word": "議題", "description": "話し合う題目"}]
+SUMMARY = {"bullet_points": ["議題を決めた"], "action_items": []}
+
+
+def test_cache_key_depends_on_every_input() -> None:
+    key = cache_key("model", "1", {"type": "array"}, "主婦", "文章")
+    assert key == cache_key("model", "1", {"type": "array"}, "主婦", "文章")
+    assert key != cache_key("model", "2", {"type": "array"}, "主婦", "文章")
+    assert key != cache_key("other", "1", {"type": "array"}, "主婦", "文章")
+    assert key != cache_key("model", "1", {"type": "array"}, "学生", "文章")
+
+
+def test_word_extraction_is_cached(monkeypatch: pytest.MonkeyPatch, llm_cache: LLMResponseCache) -> None:
+    model = FakeModel(SUPPLEMENTS)
+    monkeypatch.setattr(ask_gemini, "model", model)
+
+    assert ask_gemini.word_extraction("主婦", "議題です") == SUPPLEMENTS
+    assert ask_gemini.word_extraction("主婦", "議題です") == SUPPLEMENTS
+    assert asyncio.run(ask_gemini.word_extraction_async("主婦", "議題です")) == SUPPLEMENTS
+    assert ask_gemini.word_extraction("学生", "議題です") == SUPPLEMENTS
+
+    assert len(model.prompts) == 2
+    assert llm_cache.stats() == {"memory_hits": 2, "firestore_hits": 0, "misses": 2}
+
+
+def test_summarize_is_cached(llm_cache: LLMResponseCache) -> None:
+    summarizer = MeetingSummarizer()
+    summarizer.model = FakeModel(SUMMARY)
+
+    assert summarizer.summarize("議題を決めました") == SUMMARY
+    assert summarizer.summarize("議題を決めました") == SUMMARY
+    assert len(summarizer.model.prompts) == 1
+
+
+def test_firestore_tier_is_shared_between_instances(firestore: CountingRepository) -> None:
+    key = cache_key("model", "1", None, "text")
+    LLMResponseCache(firestore_collection="llm_cache").put(key, "[]")
+
+    other_instance = LLMResponseCache(firestore_collection="llm_cache")
+    assert other_instance.get(key) == "[]"
+    assert other_instance.get(key) == "[]"
+    assert other_instance.stats() == {"memory_hits": 1, "firestore_hits": 1, "misses": 0}
+
+
+def test_expired_entries_are_misses(firestore: CountingRepository) -> None:
+    cache = LLMResponseCache(ttl_seconds=-1, firestore_collection="llm_cache")
+    cache.put("key", "[]")
+    assert cache.get("key") is None
@@ -0,0 +1,51 @@
+import io
+import json
+import threading
+
+from utils.log_writer import AsyncLogWriter
+
+
+class BlockingStream(io.StringIO):
+    """Stream whose writes wait until released, like a stalled stdout"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.released = threading.Event()
+
+    def write(self, text: str) -> int:
+        self.released.wait()
+        return super().write(text)
+
+
+def _lines(stream: io.StringIO) -> list[dict]:
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_flush_writes_queued_events() -> None:
+    stream = io.StringIO()
+    writer = AsyncLogWriter(stream=stream)
+    for i in range(100):
+        writer.submit({"severity": "info", "message": f"line {i}", "transcript": "あ" * 5000})
+
+    assert writer.flush()
+    lines = _lines(stream)
+    assert [line["message"] for line in lines] == [f"line {i}" for i in range(100)]
+    assert lines[0]["transcript"].endswith("... (5000 chars)")
+
+
+def test_info_events_are_dropped_under_pressure() -> None:
+    stream = BlockingStream()
+    writer = AsyncLogWriter(max_queue=10, sample_every=1000, pressure_ratio=0.5, block_seconds=0.01, stream=stream)
+    writer.submit({"severity": "info", "message": "first"})
+    for i in range(20):
+        writer.submit({"severity": "info", "message": f"line {i}"})
+    writer.submit({"severity": "error", "message": "failure"})
+    stream.released.set()
+
+    assert writer.flush()
+    lines = _lines(stream)
+    messages = [line["message"] for line in lines]
+    assert "failure" in messages
+    assert writer.dropped() > 0
+    assert sum(line["dropped"] for line in lines if line["message"] == "Log events dropped") == writer.dropped()
+    assert len([m for m in messages if m.startswith("line")]) + writer.dropped() == 20
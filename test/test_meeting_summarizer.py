@@ -0,0 +1,113 @@
+import time
+from typing import Callable
+
+from bench.counting_repository import CountingRepository
+from test.conftest import FakeModel
+import utils.connect_firestore as connect_firestore
+from utils.llm_cache import LLMResponseCache
+from utils.meeting_summarizer import MeetingSummarizer, split_sentences, SummaryStreamParser
+from utils.rolling_summary import RollingSummarizer
+import utils.transcript_store as transcript_store
+
+SUMMARY = {"bullet_points": ["議題を決めた"], "action_items": []}
+
+
+def _wait_for(condition: Callable[[], bool], timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_split_sentences() -> None:
+    assert split_sentences("あいう。えお。かきくけこさしす。た", 5) == ["あいう。", "えお。", "かきくけこ", "さしす。た"]
+    assert split_sentences("", 5) == []
+
+
+def test_long_meetings_are_summarized_by_chunks(llm_cache: LLMResponseCache) -> None:
+    summarizer = MeetingSummarizer(chunk_size=20, max_workers=2)
+    summarizer.model = FakeModel(SUMMARY)
+
+    assert summarizer.summarize("一つ目の議題を話しました。" * 2 + "二つ目の議題を話しました。" * 2) == SUMMARY
+    # Two distinct chunk summaries (the repeated chunk is a cache hit), then one reduce
+    assert len(summarizer.model.prompts) == 3
+    assert "部分要約" in summarizer.model.prompts[-1]
+
+
+def test_stream_parser_yields_items_as_they_complete() -> None:
+    parser = SummaryStreamParser()
+
+    assert list(parser.feed('{"bullet_points": ["一つ目", "二つ')) == [("bullet_points", "一つ目")]
+    assert list(parser.feed('目 \\"引用\\""], "action_items": [')) == [("bullet_points", '二つ目 "引用"')]
+    assert list(parser.feed('"やること"]}')) == [("action_items", "やること")]
+
+
+def test_summarize_stream_caches_the_completed_summary(llm_cache: LLMResponseCache) -> None:
+    summarizer = MeetingSummarizer()
+    summarizer.model = FakeModel(SUMMARY)
+    expected = [("bullet_points", item) for item in SUMMARY["bullet_points"]]
+    expected += [("action_items", item) for item in SUMMARY["action_items"]]
+    expected.append(("summary", SUMMARY))
+
+    assert list(summarizer.summarize_stream("議題を話しました。")) == expected
+    # Replayed from the cache, and shared with summarize
+    assert list(summarizer.summarize_stream("議題を話しました。")) == expected
+    assert summarizer.summarize("議題を話しました。") == SUMMARY
+    assert len(summarizer.model.prompts) == 1
+
+
+def _confirm(meet_id: str, texts: list[str], archive_text: str = "") -> None:
+    """Store the confirmed segments and the archive text of a meeting, as a save does"""
+    for seq, text in enumerate(texts):
+        connect_firestore.add_data(
+            transcript_store.segment_collection(meet_id), transcript_store.segment_id(seq), {"seq": seq, "text": text}
+        )
+    connect_firestore.add_data(
+        transcript_store.MEETING_COLLECTION, meet_id, {"archive_text": archive_text, "segment_count": len(texts)}
+    )
+
+
+def test_rolling_summary_folds_in_background(firestore: CountingRepository, llm_cache: LLMResponseCache) -> None:
+    summarizer = MeetingSummarizer()
+    summarizer.model = FakeModel(SUMMARY)
+    rolling_summarizer = RollingSummarizer(summarizer, fold_chars=10, fold_seconds=3600)
+
+    _confirm("m1", ["議題を"])
+    rolling_summarizer.feed("m1", "議題を")
+    assert summarizer.model.prompts == []
+    _confirm("m1", ["議題を", "決めました次は"])
+    rolling_summarizer.feed("m1", "決めました次は")
+    _wait_for(lambda: rolling_summarizer._states.get("m1").folding is None)
+    assert len(summarizer.model.prompts) == 1
+    _confirm("m1", ["議題を", "決めました次は", "担当を決めます"])
+    rolling_summarizer.feed("m1", "担当を決めます")
+
+    assert rolling_summarizer.finalize("m1") == SUMMARY
+    # The tail is folded into the running summary
+    assert len(summarizer.model.prompts) == 2
+    assert "これまでの要約" in summarizer.model.prompts[1]
+    assert "担当を決めます" in summarizer.model.prompts[1]
+    assert "決めました次は" not in summarizer.model.prompts[1]
+    assert rolling_summarizer.finalize("other") is None
+
+
+def test_rolling_summary_covers_segments_saved_elsewhere_and_the_archive(
+    firestore: CountingRepository, llm_cache: LLMResponseCache
+) -> None:
+    summarizer = MeetingSummarizer()
+    summarizer.model = FakeModel(SUMMARY)
+    rolling_summarizer = RollingSummarizer(summarizer, fold_chars=1000, fold_seconds=3600)
+
+    # Segments saved by another instance, or by this one before a restart
+    _confirm("m1", ["最初の議題です", "次の議題です"], archive_text="まだ確定していない発言")
+    rolling_summarizer.feed("m1", "次の議題です")
+
+    assert rolling_summarizer.finalize("m1") == SUMMARY
+    assert "最初の議題です次の議題ですまだ確定していない発言" in summarizer.model.prompts[0]
+    # The unconfirmed window is not kept in the running summary
+    assert rolling_summarizer._states.get("m1").summary is None
+
+    # Another instance ended the meeting, and a new meeting reuses the meetId
+    connect_firestore.update_data(transcript_store.MEETING_COLLECTION, "m1", {"generation": "next"})
+    assert rolling_summarizer.finalize("m1") is None
+    assert rolling_summarizer._states.get("m1") is None
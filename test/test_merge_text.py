@@ -0,0 +1,48 @@
+import utils.merge_text as merge_text
+
+
+def _replay(windows: list[str]) -> str:
+    archive_text = ""
+    confirmed_buffer = ""
+    for window in windows:
+        confirmed_text, archive_text = merge_text.merge(archive_text, window)
+        confirmed_buffer += confirmed_text
+    return confirmed_buffer
+
+
+def test_merge_confirms_text_before_overlap() -> None:
+    confirmed_text, archive_text = merge_text.merge(
+        "変更前の文字列です。この文字列は語尾だけ変更されます",
+        "文字列です。この文字列は語尾だけ変更されました。変更後の文字列です",
+    )
+    assert confirmed_text == "変更前の"
+    assert archive_text == "文字列ですこの文字列は語尾だけ変更されました変更後の文字列です"
+
+
+def test_merge_without_overlap_confirms_everything() -> None:
+    assert merge_text.merge("今後ともよろしくお願いいたします。", "。うれしいです。") == (
+        "今後ともよろしくお願いいたします",
+        "うれしいです",
+    )
+    assert merge_text.merge("", "はじめまして") == ("", "はじめまして")
+
+
+def test_merge_stream() -> None:
+    windows = [
+        "変更前の文字列です。この文字列は語尾だけ変更されます",
+        "文字列です。この文字列は語尾だけ変更されました。変更後の文字列です",
+        "文字列です。この文字列は語尾だけ変更されました。変更後の文字列です",
+        "語尾だけ変更されました。変更後の文字列です。このまま文章を終了します。あり",
+        "まま文章を終了します。ありがとうございました。今後",
+        "。今後ともよろしくお願いいたします。",
+        "。うれしいです。",
+        "",
+    ]
+    assert _replay(windows) == (
+        "変更前の文字列ですこの文字列は語尾だけ変更されました変更後の文字列です"
+        "このまま文章を終了しますありがとうございました今後ともよろしくお願いいたしますうれしいです"
+    )
+
+
+def test_find_overlap_prefers_latest_occurrence() -> None:
+    assert merge_text.find_overlap("あいうあいう", "あいうえ") == (3, 3)
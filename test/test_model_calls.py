@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+from google.api_core.exceptions import InvalidArgument, ServiceUnavailable
+import pytest
+
+from utils.model_calls import (
+    CircuitOpen,
+    ModelBusy,
+    ModelCallExecutor,
+    ModelCallTimeout,
+    ModelUnavailable,
+    RetryBudget,
+)
+
+
+def failing(errors: list[Exception], result: str = "ok") -> tuple[list[int], object]:
+    """A call raising errors in turn, then returning result"""
+    calls = []
+
+    def fn() -> str:
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return calls, fn
+
+
+def test_call_retries_server_errors_with_backoff() -> None:
+    executor = ModelCallExecutor(backoff_seconds=0.001)
+    calls, fn = failing([ServiceUnavailable("down"), ServiceUnavailable("down")])
+
+    assert executor.call("model", fn, timeout=5) == "ok"
+    assert len(calls) == 3
+
+    # Client errors are not retried
+    calls, fn = failing([InvalidArgument("bad prompt")])
+    with pytest.raises(InvalidArgument):
+        executor.call("model", fn, timeout=5)
+    assert len(calls) == 1
+
+
+def test_retries_are_limited_by_the_budget() -> None:
+    executor = ModelCallExecutor(max_attempts=5, backoff_seconds=0.001, retry_budget=RetryBudget(0, 1))
+
+    calls, fn = failing([ServiceUnavailable("down")] * 10)
+    with pytest.raises(ModelUnavailable):
+        executor.call("model", fn, timeout=5)
+    assert len(calls) == 2
+
+    calls, fn = failing([ServiceUnavailable("down")] * 10)
+    with pytest.raises(ModelUnavailable):
+        executor.call("model", fn, timeout=5)
+    assert len(calls) == 1
+
+
+def test_slow_calls_time_out_and_keep_their_slot() -> None:
+    executor = ModelCallExecutor(max_concurrency=1)
+
+    began = time.monotonic()
+    with pytest.raises(ModelCallTimeout):
+        executor.call("model", lambda: time.sleep(0.3), timeout=0.05)
+    assert time.monotonic() - began < 0.2
+    # The slow call still runs
+    with pytest.raises(ModelBusy):
+        executor.call("model", lambda: "ok", timeout=0.05)
+    assert executor.call("model", lambda: "ok", timeout=1) == "ok"
+
+
+def test_models_do_not_share_their_call_slots() -> None:
+    executor = ModelCallExecutor(max_concurrency=1)
+
+    with pytest.raises(ModelCallTimeout):
+        executor.call("summary-model", lambda: time.sleep(0.3), timeout=0.05)
+    with pytest.raises(ModelBusy):
+        executor.call("summary-model", lambda: "ok", timeout=0.05)
+    assert executor.call("extraction-model", lambda: "ok", timeout=0.05) == "ok"
+
+
+def test_circuit_opens_after_repeated_failures_and_closes_after_a_trial() -> None:
+    executor = ModelCallExecutor(max_attempts=1, failure_threshold=2, open_seconds=0.1)
+    for _ in range(2):
+        with pytest.raises(ModelUnavailable):
+            executor.call("model", failing([ServiceUnavailable("down")])[1], timeout=1)
+    assert executor.breaker("model").state == "open"
+
+    calls, fn = failing([])
+    with pytest.raises(CircuitOpen):
+        executor.call("model", fn, timeout=1)
+    assert calls == []
+    # Other models are not affected
+    assert executor.call("other", fn, timeout=1) == "ok"
+
+    time.sleep(0.1)
+    assert executor.call("model", fn, timeout=1) == "ok"
+    assert executor.breaker("model").state == "closed"
+
+
+def test_async_calls_are_cancelled_at_the_deadline() -> None:
+    executor = ModelCallExecutor(backoff_seconds=0.001)
+    attempts = []
+
+    async def slow() -> str:
+        await asyncio.sleep(1)
+        return "late"
+
+    async def flaky() -> str:
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ServiceUnavailable("down")
+        return "ok"
+
+    with pytest.raises(ModelCallTimeout):
+        asyncio.run(executor.call_async("model", slow, timeout=0.05))
+    assert asyncio.run(executor.call_async("model", flaky, timeout=1)) == "ok"
+    assert executor.call("model", lambda: "free", timeout=0.1) == "free"
+
+
+def test_stream_is_retried_only_before_its_first_chunk() -> None:
+    executor = ModelCallExecutor(max_concurrency=1, backoff_seconds=0.001)
+    attempts = []
+
+    def stream() -> object:
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ServiceUnavailable("down")
+        yield "a"
+        if len(attempts) == 2:
+            raise ServiceUnavailable("down")
+        yield "b"
+
+    chunks = []
+    with pytest.raises(ServiceUnavailable):
+        for chunk in executor.stream("model", stream, timeout=1):
+            chunks.append(chunk)
+    assert chunks == ["a"] and len(attempts) == 2
+    assert list(executor.stream("model", stream, timeout=1)) == ["a", "b"]
+
+
+def test_stream_frees_its_slot_while_the_consumer_stalls_and_times_out_between_chunks() -> None:
+    executor = ModelCallExecutor(max_concurrency=1, max_attempts=1, chunk_timeout=0.05)
+
+    stalled = executor.stream("model", lambda: iter(["a", "b", "c"]), timeout=5)
+    assert next(stalled) == "a"
+    # The response was read to its end while the consumer stalls: the slot is free
+    assert executor.call("model", lambda: "ok", timeout=1) == "ok"
+    assert list(stalled) == ["b", "c"]
+
+    def slow() -> object:
+        yield "a"
+        time.sleep(0.2)
+        yield "b"
+
+    chunks = []
+    with pytest.raises(ModelCallTimeout):
+        for chunk in executor.stream("model", slow, timeout=5):
+            chunks.append(chunk)
+    assert chunks == ["a"]
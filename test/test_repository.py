@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import os
+
+import pytest
+
+from bench.counting_repository import CountingRepository
+import utils.connect_firestore as connect_firestore
+from utils.local_repository import MemoryRepository, SQLiteRepository
+from utils.repository import Repository, WriteConflict
+
+
+@pytest.fixture(params=["memory", "sqlite", "counting"])
+def repository(request: pytest.FixtureRequest, tmp_path: str) -> Repository:
+    if request.param == "memory":
+        return MemoryRepository()
+    if request.param == "counting":
+        return CountingRepository(MemoryRepository())
+    return SQLiteRepository(os.path.join(tmp_path, "storage.db"))
+
+
+def test_documents_are_merged_and_copied(repository: Repository) -> None:
+    repository.add_data("users", "alice", {"API": "interface", "meta": {"a": 1}})
+    repository.add_data("users", "alice", {"SDK": "kit", "meta": {"b": 2}})
+
+    data = repository.get_data("users", "alice")
+    assert data == {"API": "interface", "SDK": "kit", "meta": {"a": 1, "b": 2}}
+    data["meta"]["a"] = 0
+    assert repository.get_data("users", "alice")["meta"] == {"a": 1, "b": 2}
+    assert sorted(repository.get_word_list("users", "alice")) == ["API", "SDK", "meta"]
+
+    repository.update_data("users", "alice", {"meta": {"c": 3}})
+    repository.delete_fields("users", "alice", ["API"])
+    assert repository.get_data("users", "alice") == {"SDK": "kit", "meta": {"c": 3}}
+    with pytest.raises(KeyError):
+        repository.update_data("users", "bob", {"API": "interface"})
+
+    repository.delete_data("users", "alice")
+    assert repository.get_data("users", "alice") is None
+    assert repository.get_word_list("users", "alice") == []
+
+
+def test_collections_are_ordered_by_a_field(repository: Repository) -> None:
+    segments = "meeting/m1/segments"
+    repository.batch_set([(segments, f"{seq:08d}", {"seq": seq, "text": str(seq)}) for seq in (2, 0, 10, 1)])
+    repository.add_data(segments, "unordered", {"text": "-"})
+
+    assert [segment["seq"] for segment in repository.stream_data(segments, "seq")] == [0, 1, 2, 10]
+    assert [segment["seq"] for segment in repository.stream_data(segments, "seq", start_at=2)] == [2, 10]
+    assert repository.get_latest_data(segments, "seq")["text"] == "10"
+    assert sorted(repository.get_document_list(segments)) == ["00000000", "00000001", "00000002", "00000010", "unordered"]
+
+    now = datetime.now(timezone.utc)
+    for days in (3, 1, 2):
+        repository.add_data("minutes/alice/meetings", f"day{days}", {"timestamp": now - timedelta(days=days)})
+    latest = repository.get_latest_data("minutes/alice/meetings", "timestamp")
+    assert latest["timestamp"] == now - timedelta(days=1)
+
+    repository.delete_collection(segments)
+    assert list(repository.stream_data(segments, "seq")) == []
+    assert repository.get_latest_data("meeting/none/segments", "seq") is None
+
+
+def test_set_if_unchanged_detects_conflicts(repository: Repository) -> None:
+    assert repository.get_data_with_update_time("meeting", "m1") == (None, None)
+    update_time = repository.set_if_unchanged(
+        "meeting", "m1", {"archive_text": "a", "segment_count": 0}, None, [("other", "doc", {"x": 1})]
+    )
+    assert repository.get_data_with_update_time("meeting", "m1") == ({"archive_text": "a", "segment_count": 0}, update_time)
+    assert repository.get_data("other", "doc") == {"x": 1}
+
+    with pytest.raises(WriteConflict):
+        repository.set_if_unchanged("meeting", "m1", {"archive_text": "b"}, None)
+    repository.add_data("meeting", "m1", {"archive_text": "c"})
+    with pytest.raises(WriteConflict):
+        repository.set_if_unchanged("meeting", "m1", {"archive_text": "b"}, update_time, [("other", "doc", {"x": 2})])
+    # Nothing of a conflicting batch is written
+    assert repository.get_data("other", "doc") == {"x": 1}
+
+
+def test_set_if_unchanged_serialises_concurrent_writers(repository: Repository) -> None:
+    def increment(times: int) -> None:
+        for _ in range(times):
+            while True:
+                data, update_time = repository.get_data_with_update_time("counters", "c")
+                try:
+                    repository.set_if_unchanged("counters", "c", {"value": (data or {}).get("value", 0) + 1}, update_time)
+                    break
+                except WriteConflict:
+                    pass
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for future in [executor.submit(increment, 25) for _ in range(8)]:
+            future.result()
+
+    assert repository.get_data("counters", "c") == {"value": 200}
+
+
+def test_counting_repository_counts_reads_and_written_documents() -> None:
+    repository = CountingRepository()
+    repository.batch_set([("users", "alice", {"API": "interface"}), ("users", "bob", {"SDK": "kit"})])
+    repository.set_if_unchanged("meeting", "m1", {"segment_count": 1}, None, [("segments", "0", {"seq": 0})])
+    repository.get_data("users", "alice")
+    list(repository.stream_data("segments", "seq"))
+
+    assert (repository.reads, repository.writes) == (2, 4)
+
+
+def test_storage_backend_is_selected_by_name() -> None:
+    assert isinstance(connect_firestore.create_repository("firestore"), connect_firestore.FirestoreRepository)
+    assert isinstance(connect_firestore.create_repository("memory"), MemoryRepository)
+    with pytest.raises(ValueError):
+        connect_firestore.create_repository("redis")
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+from typing import Callable
+
+import pytest
+
+from utils.single_flight import SingleFlight
+
+
+def _run_concurrently(target: Callable, count: int) -> list:
+    results = [None] * count
+
+    def run(index: int) -> None:
+        try:
+            results[index] = target()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_call() -> None:
+    flight = SingleFlight()
+    calls = []
+
+    def slow_call() -> str:
+        calls.append(1)
+        time.sleep(0.2)
+        return "result"
+
+    assert _run_concurrently(lambda: flight.do("key", slow_call), 8) == ["result"] * 8
+    assert len(calls) == 1
+
+
+def test_errors_are_propagated_to_every_waiter() -> None:
+    flight = SingleFlight()
+
+    def failing_call() -> str:
+        time.sleep(0.2)
+        raise ValueError("quota exceeded")
+
+    results = _run_concurrently(lambda: flight.do("key", failing_call), 4)
+    assert all(isinstance(result, ValueError) for result in results)
+    # The failed call is forgotten: the next caller runs it again
+    assert flight.do("key", lambda: "retried") == "retried"
+
+
+def test_waiters_time_out() -> None:
+    flight = SingleFlight(timeout=0.05)
+    results = _run_concurrently(lambda: flight.do("key", lambda: time.sleep(0.3) or "result"), 2)
+    assert sorted(map(str, results)) == ["Timed out waiting for the in-flight call 'key'", "result"]
+
+
+def test_async_calls_share_one_call() -> None:
+    flight = SingleFlight()
+    calls = []
+
+    async def slow_call() -> str:
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "result"
+
+    async def main() -> list:
+        return await asyncio.gather(*(flight.do_async("key", slow_call) for _ in range(8)))
+
+    assert asyncio.run(main()) == ["result"] * 8
+    assert len(calls) == 1
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(flight.do_async("other", slow_call, timeout=0.01))
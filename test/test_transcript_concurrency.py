@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import os
+import threading
+import uuid
+
+import pytest
+
+import app as app_module
+from bench.counting_repository import CountingRepository
+import utils.connect_firestore as connect_firestore
+from utils.meeting_session import meeting_sessions
+import utils.transcript_store as transcript_store
+from utils.transcript_writer import TranscriptWriter
+
+# Caption windows without any overlap: each save confirms the previous archive text as it is
+WINDOW_CHARS = 3
+
+
+class _NoLocks:
+    """Stands for instances that do not share the in-process meeting locks"""
+
+    def lock(self, key: str) -> contextlib.AbstractContextManager:
+        return contextlib.nullcontext()
+
+
+@pytest.fixture
+def optimistic_commits(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(transcript_store, "OPTIMISTIC_COMMITS", True)
+    monkeypatch.setattr(transcript_store, "COMMIT_ATTEMPTS", 50)
+    monkeypatch.setattr(transcript_store, "COMMIT_BACKOFF_SECONDS", 0.001)
+    monkeypatch.setattr(app_module.rolling_summarizer, "feed", lambda meet_id, text, generation: None)
+    meeting_sessions._cache.clear()
+    yield
+    meeting_sessions._cache.clear()
+
+
+def _stress(meet_ids: list[str], instances: int, windows_per_instance: int) -> None:
+    """
+    Save disjoint windows to every meeting from concurrent "instances", then check that
+    every window ends up exactly once in the transcript or the archive text
+    """
+    windows = [chr(0x4E00 + i) * WINDOW_CHARS for i in range(instances * windows_per_instance)]
+
+    def run_instance(meet_id: str, instance: int) -> None:
+        for window in windows[instance::instances]:
+            app_module.save_meeting_transcripts(meet_id, [window])
+
+    with ThreadPoolExecutor(max_workers=len(meet_ids) * instances) as executor:
+        futures = [executor.submit(run_instance, meet_id, i) for meet_id in meet_ids for i in range(instances)]
+        for future in futures:
+            future.result()
+
+    for meet_id in meet_ids:
+        session = transcript_store.load_session(meet_id)
+        segments = list(connect_firestore.stream_data(transcript_store.segment_collection(meet_id), "seq"))
+        assert [segment["seq"] for segment in segments] == list(range(session.segment_count))
+        text = "".join(segment["text"] for segment in segments) + session.archive_text
+        saved = [text[i : i + WINDOW_CHARS] for i in range(0, len(text), WINDOW_CHARS)]
+        assert sorted(saved) == sorted(windows)
+
+
+def test_save_merges_again_after_a_conflict(firestore: CountingRepository, optimistic_commits: None) -> None:
+    app_module.save_meeting_transcripts("m1", ["一つ目の発言です"])
+    # Another instance confirms the first window meanwhile
+    firestore.add_data("meeting/m1/segments", "00000000", {"seq": 0, "text": "一つ目の発言です"})
+    firestore.add_data("meeting", "m1", {"archive_text": "二つ目の発言です", "segment_count": 1})
+
+    app_module.save_meeting_transcripts("m1", ["三つ目の発言です"])
+
+    assert transcript_store.read_transcript("m1") == "一つ目の発言です二つ目の発言です"
+    meeting = firestore.repository.get_data("meeting", "m1")
+    meeting.pop("generation", None)
+    assert meeting == {"archive_text": "三つ目の発言です", "segment_count": 2}
+
+
+def test_concurrent_saves_lose_no_text(
+    firestore: CountingRepository, optimistic_commits: None, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(app_module, "meeting_locks", _NoLocks())
+    _stress([f"m{i}" for i in range(4)], instances=4, windows_per_instance=10)
+
+
+def test_striped_locks_serialise_saves_of_a_meeting(firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Write-behind: only the in-process locks keep the saves of a meeting in order
+    monkeypatch.setattr(transcript_store, "OPTIMISTIC_COMMITS", False)
+    monkeypatch.setattr(app_module.rolling_summarizer, "feed", lambda meet_id, text, generation: None)
+    _stress(["m1", "m2"], instances=4, windows_per_instance=10)
+
+
+def test_flushing_a_meeting_does_not_wait_for_commits_of_others(
+    firestore: CountingRepository, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    writer = TranscriptWriter(flush_interval=3600)
+    committing, release = threading.Event(), threading.Event()
+    batch_set = connect_firestore.batch_set
+
+    def slow_batch_set(writes: list) -> None:
+        if any(collection_name == "slow" for collection_name, _, _ in writes):
+            committing.set()
+            release.wait(5)
+        batch_set(writes)
+
+    monkeypatch.setattr(connect_firestore, "batch_set", slow_batch_set)
+    writer.enqueue(1, "slow", "d", {"text": "a"})
+    background = threading.Thread(target=writer.flush)
+    background.start()
+    assert committing.wait(5)
+
+    # Nothing pending, then pending writes of another meeting: neither waits for the slow commit
+    writer.flush([2])
+    writer.enqueue(2, "fast", "d", {"text": "b"})
+    writer.flush([2])
+    assert firestore.get_data("fast", "d") == {"text": "b"}
+    assert firestore.get_data("slow", "d") is None
+
+    release.set()
+    background.join()
+    assert firestore.get_data("slow", "d") == {"text": "a"}
+
+
+@pytest.mark.skipif(not os.getenv("FIRESTORE_EMULATOR_HOST"), reason="needs the Firestore emulator")
+def test_concurrent_saves_lose_no_text_on_the_emulator(
+    optimistic_commits: None, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    from google.cloud import firestore
+
+    client = firestore.Client(project=os.getenv("GOOGLE_CLOUD_PROJECT", "test"))
+    monkeypatch.setattr(connect_firestore, "repository", connect_firestore.FirestoreRepository(client))
+    monkeypatch.setattr(app_module, "meeting_locks", _NoLocks())
+    meet_ids = [f"stress-{uuid.uuid4().hex}" for _ in range(8)]
+    try:
+        _stress(meet_ids, instances=4, windows_per_instance=25)
+    finally:
+        for meet_id in meet_ids:
+            transcript_store.delete(meet_id)
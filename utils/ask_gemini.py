@@ -1,34 +1,31 @@
 import json
-import os
 import sys
 
-import vertexai
-from vertexai.generative_models import GenerationConfig, GenerativeModel
+import utils.llm as llm
+from utils.llm_cache import cache_key, llm_cache
+from utils.model_calls import model_calls
+from utils.single_flight import llm_flight
 
-# Set the project and location
-project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
-location = os.getenv("GOOGLE_CLOUD_REGION")
+MODEL_NAME = llm.WORD_EXTRACTION_MODEL
+# Model of the configured LLM provider, created on first use
+model = None
 
-# Initialize Vertex AI
-vertexai.init(project=project_id, location=location)
-model = GenerativeModel("gemini-1.5-flash-002")
+# Bump when the prompt template changes so that cached responses are not reused
+PROMPT_VERSION = "1"
 
 
-def word_extraction(role: str, text: str) -> list[dict]:
-    """
-    Ask Gemini to extract words that need additional information
-    :param text: str
-    :return: response: list[dict]
-    """
-    response_schema = {
-        "type": "array",
-        "items": {
-            "type": "object",
-            "properties": {"word": {"type": "string"}, "description": {"type": "string"}},
-            "required": ["word", "description"],
-        },
-    }
-    ask_sentence = f"""
+response_schema = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"word": {"type": "string"}, "description": {"type": "string"}},
+        "required": ["word", "description"],
+    },
+}
+
+
+def _build_prompt(role: str, text: str) -> str:
+    return f"""
         下記の日本語の文章から、{role}にとって本当に補足説明が必要な専門用語や重要な概念を抽出してください。
         
         ルール：
@@ -44,16 +41,63 @@ def word_extraction(role: str, text: str) -> list[dict]:
         {text}
     """
 
+
+def get_model() -> llm.LLMModel:
+    global model
+    if model is None:
+        model = llm.get_model(MODEL_NAME)
+    return model
+
+
+def word_extraction(role: str, text: str) -> list[dict]:
+    """
+    Ask Gemini to extract words that need additional information
+    :param text: str
+    :return: response: list[dict]
+    :raises utils.model_calls.ModelUnavailable: if Gemini did not answer in time
+    """
+    ask_sentence = _build_prompt(role, text)
+    model = get_model()
+
     # This function should call the Gemini API to get the words that need additional information
-    generation_config = GenerationConfig(response_mime_type="application/json", response_schema=response_schema)
-    response = model.generate_content(ask_sentence, generation_config=generation_config)
+    def generate() -> str:
+        return model_calls.call(
+            model.name, lambda: model.generate_json(ask_sentence, response_schema), llm.WORD_EXTRACTION_TIMEOUT_SECONDS
+        )
+
+    # Identical calls (same role and text) are answered from the response cache,
+    # or share the call already in flight
+    key = cache_key(model.name, PROMPT_VERSION, response_schema, role, text)
+    response_text = llm_flight.do(key, lambda: llm_cache.get_or_compute(key, generate))
 
     # Convert the response to a list of dictionaries
-    response = json.loads(response.text)
+    response = json.loads(response_text)
     # Return the result
     return response
 
 
+async def word_extraction_async(role: str, text: str) -> list[dict]:
+    """
+    Same as word_extraction, through the async Gemini API
+    :param text: str
+    :return: response: list[dict]
+    """
+    ask_sentence = _build_prompt(role, text)
+    model = get_model()
+
+    async def generate() -> str:
+        return await model_calls.call_async(
+            model.name,
+            lambda: model.generate_json_async(ask_sentence, response_schema),
+            llm.WORD_EXTRACTION_TIMEOUT_SECONDS,
+        )
+
+    key = cache_key(model.name, PROMPT_VERSION, response_schema, role, text)
+    response_text = await llm_flight.do_async(key, lambda: llm_cache.get_or_compute_async(key, generate))
+
+    return json.loads(response_text)
+
+
 def main():
     # Sample sentence
     text = """
@@ -0,0 +1,33 @@
+import asyncio
+import threading
+from typing import Any, Coroutine, Optional
+
+# One event loop for the whole process: async gRPC clients (Vertex AI) are bound
+# to the loop they were created on, so every request thread submits to this one
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the shared event loop, starting its thread on first use
+    :return: asyncio.AbstractEventLoop
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-runner", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """
+    Run a coroutine on the shared event loop and wait for its result from a (request) thread
+    :param coro: Coroutine
+    :param timeout: float (seconds to wait for the result)
+    :return: result of the coroutine
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
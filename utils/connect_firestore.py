@@ -1,80 +1,276 @@
 import os
+import threading
 
-import firebase_admin
-from firebase_admin import credentials, firestore
+from utils.local_repository import MemoryRepository, SQLiteRepository
+from utils.logging import log_payload, logger
+from utils.repository import Repository, WriteConflict  # noqa: F401
 
+# Storage of the app: firestore, memory (lost on exit) or sqlite (STORAGE_SQLITE_PATH, single node)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firestore")
 
-# Initialize Firestore DB
+_client = None
+_client_lock = threading.Lock()
+
+
+# Initialize Firestore DB once per process; the client and its gRPC channel are shared by every thread
+# The Firestore SDK is imported here, on first use, to keep it out of the cold start
 def init_firestore():
-    if not firebase_admin._apps:
-        cred = credentials.ApplicationDefault()
-        firebase_admin.initialize_app(
-            cred,
-            {
-                "projectId": os.getenv("GOOGLE_CLOUD_PROJECT"),
-            },
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import firebase_admin
+                from firebase_admin import credentials, firestore
+
+                if not firebase_admin._apps:
+                    cred = credentials.ApplicationDefault()
+                    firebase_admin.initialize_app(
+                        cred,
+                        {
+                            "projectId": os.getenv("GOOGLE_CLOUD_PROJECT"),
+                        },
+                    )
+                _client = firestore.client()
+    return _client
+
+
+class FirestoreRepository(Repository):
+    """
+    Firestore data access bound to a single client
+    :param client: google.cloud.firestore.Client (the shared process client if None)
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def db(self):
+        if self._client is None:
+            self._client = init_firestore()
+        return self._client
+
+    def warm_up(self):
+        self.db
+
+    # Add data to Firestore
+    def add_data(self, collection_name, document_id, data):
+        db = self.db
+        db.collection(collection_name).document(document_id).set(data, merge=True)
+        logger.debug("Data added", path=f"{collection_name}/{document_id}")
+
+    # Get data from Firestore
+    def get_data(self, collection_name, document_id):
+        db = self.db
+        doc = db.collection(collection_name).document(document_id).get()
+        if doc.exists:
+            # Decode the document once; it is only rendered to the log when DEBUG is enabled
+            data = doc.to_dict()
+            log_payload("Data read", data, path=f"{collection_name}/{document_id}")
+            return data
+        else:
+            logger.debug("No such document", path=f"{collection_name}/{document_id}")
+            return None
+
+    # Get data and its update time (the version to pass to set_if_unchanged)
+    def get_data_with_update_time(self, collection_name, document_id):
+        db = self.db
+        doc = db.collection(collection_name).document(document_id).get()
+        if doc.exists:
+            data = doc.to_dict()
+            log_payload("Data read", data, path=f"{collection_name}/{document_id}")
+            return data, doc.update_time
+        logger.debug("No such document", path=f"{collection_name}/{document_id}")
+        return None, None
+
+    # Set fields of a document, together with other writes, only if the document is unchanged since
+    # update_time (or still does not exist if update_time is None); raises WriteConflict otherwise
+    def set_if_unchanged(self, collection_name, document_id, data, update_time, writes=()):
+        from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+
+        db = self.db
+        batch = db.batch()
+        for write_collection, write_document_id, write_data in writes:
+            batch.set(db.collection(write_collection).document(write_document_id), write_data, merge=True)
+        reference = db.collection(collection_name).document(document_id)
+        if update_time is None:
+            batch.create(reference, data)
+        else:
+            batch.update(reference, data, option=db.write_option(last_update_time=update_time))
+        try:
+            results = batch.commit()
+        except (AlreadyExists, FailedPrecondition, NotFound) as e:
+            raise WriteConflict(f"{collection_name}/{document_id} was changed") from e
+        logger.debug("Guarded batch committed", path=f"{collection_name}/{document_id}", writes=len(results))
+        return results[-1].update_time
+
+    # Update data in Firestore
+    def update_data(self, collection_name, document_id, data):
+        db = self.db
+        db.collection(collection_name).document(document_id).update(data)
+        logger.debug("Data updated", path=f"{collection_name}/{document_id}")
+
+    # Write several documents with batched writes (merged into existing documents)
+    def batch_set(self, writes):
+        db = self.db
+        # A batch holds at most 500 writes
+        for start in range(0, len(writes), 500):
+            batch = db.batch()
+            for collection_name, document_id, data in writes[start : start + 500]:
+                batch.set(db.collection(collection_name).document(document_id), data, merge=True)
+            batch.commit()
+        logger.debug("Batch committed", writes=len(writes))
+
+    # Stream the documents of a collection ordered by a field, starting at start_at
+    def stream_data(self, collection_name, order_by, start_at=None):
+        db = self.db
+        query = db.collection(collection_name).order_by(order_by)
+        if start_at is not None:
+            query = query.start_at({order_by: start_at})
+        for doc in query.stream():
+            yield doc.to_dict()
+
+    # Get the document with the largest order_by value in a collection
+    def get_latest_data(self, collection_name, order_by):
+        from firebase_admin import firestore
+
+        db = self.db
+        query = db.collection(collection_name).order_by(order_by, direction=firestore.Query.DESCENDING).limit(1)
+        for doc in query.stream():
+            data = doc.to_dict()
+            log_payload("Data read", data, path=f"{collection_name}/{doc.id}")
+            return data
+        logger.debug("No document", path=collection_name)
+        return None
+
+    # Delete fields (top-level keys) from a document
+    def delete_fields(self, collection_name, document_id, field_names):
+        from firebase_admin import firestore
+        from google.cloud.firestore_v1.field_path import FieldPath
+
+        db = self.db
+        db.collection(collection_name).document(document_id).update(
+            {FieldPath(field_name).to_api_repr(): firestore.DELETE_FIELD for field_name in field_names}
         )
-    return firestore.client()
+        logger.debug("Fields deleted", path=f"{collection_name}/{document_id}", fields=len(field_names))
+
+    # Delete every document of a collection (e.g. a subcollection) with batched writes
+    def delete_collection(self, collection_name):
+        db = self.db
+        deleted = 0
+        while True:
+            docs = list(db.collection(collection_name).limit(500).stream())
+            if not docs:
+                break
+            batch = db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+            deleted += len(docs)
+        logger.debug("Collection deleted", path=collection_name, deleted=deleted)
+
+    # Get document list from Firestore
+    def get_document_list(self, collection_name):
+        db = self.db
+        docs = db.collection(collection_name).list_documents()
+        doc_list = []
+        for doc in docs:
+            doc_list.append(doc.id)
+        log_payload("Document list read", doc_list, path=collection_name)
+        return doc_list
+
+    # Get the key list in the selected document_id from Firestore
+    def get_word_list(self, collection_name, document_id):
+        db = self.db
+        doc = db.collection(collection_name).document(document_id).get()
+        word_list = []
+        if doc.exists:
+            # Get the key list in the selected document_id
+            word_list = list(doc.to_dict().keys())
+            logger.debug("Word list read", path=f"{collection_name}/{document_id}", words=len(word_list))
+        else:
+            logger.debug("No such document", path=f"{collection_name}/{document_id}")
+        return word_list
+
+    # Delete data from Firestore
+    def delete_data(self, collection_name, document_id):
+        db = self.db
+        db.collection(collection_name).document(document_id).delete()
+        logger.debug("Data deleted", path=f"{collection_name}/{document_id}")
+
+
+def create_repository(backend=STORAGE_BACKEND):
+    """
+    Repository of a storage backend
+    :param backend: str (firestore, memory or sqlite)
+    :return: Repository
+    """
+    if backend == "firestore":
+        return FirestoreRepository()
+    if backend == "memory":
+        return MemoryRepository()
+    if backend == "sqlite":
+        return SQLiteRepository()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+repository = create_repository()
+
+
+# Module-level helpers using the shared repository
+def warm_up():
+    repository.warm_up()
 
 
-# Add data to Firestore
 def add_data(collection_name, document_id, data):
-    # Initialize Firestore DB
-    db = init_firestore()
-    db.collection(collection_name).document(document_id).set(data, merge=True)
-    print(f"Data added to {collection_name}/{document_id}")
+    repository.add_data(collection_name, document_id, data)
 
 
-# Get data from Firestore
 def get_data(collection_name, document_id):
-    db = init_firestore()
-    doc = db.collection(collection_name).document(document_id).get()
-    if doc.exists:
-        print(f"Data from {collection_name}/{document_id}: {doc.to_dict()}")
-        return doc.to_dict()
-    else:
-        print(f"No such document: {collection_name}/{document_id}")
-        return None
+    return repository.get_data(collection_name, document_id)
+
+
+def get_data_with_update_time(collection_name, document_id):
+    return repository.get_data_with_update_time(collection_name, document_id)
+
+
+def set_if_unchanged(collection_name, document_id, data, update_time, writes=()):
+    return repository.set_if_unchanged(collection_name, document_id, data, update_time, writes)
 
 
-# Update data in Firestore
 def update_data(collection_name, document_id, data):
-    db = init_firestore()
-    db.collection(collection_name).document(document_id).update(data)
-    print(f"Data updated in {collection_name}/{document_id}")
+    repository.update_data(collection_name, document_id, data)
+
+
+def batch_set(writes):
+    repository.batch_set(writes)
+
+
+def stream_data(collection_name, order_by, start_at=None):
+    return repository.stream_data(collection_name, order_by, start_at)
+
+
+def get_latest_data(collection_name, order_by):
+    return repository.get_latest_data(collection_name, order_by)
+
+
+def delete_fields(collection_name, document_id, field_names):
+    repository.delete_fields(collection_name, document_id, field_names)
+
+
+def delete_collection(collection_name):
+    repository.delete_collection(collection_name)
 
 
-# Get document list from Firestore
 def get_document_list(collection_name):
-    db = init_firestore()
-    docs = db.collection(collection_name).list_documents()
-    doc_list = []
-    for doc in docs:
-        doc_list.append(doc.id)
-    print(f"Document list from {collection_name}: {doc_list}")
-    return doc_list
+    return repository.get_document_list(collection_name)
 
 
-# Get the key list in the selected document_id from Firestore
 def get_word_list(collection_name, document_id):
-    db = init_firestore()
-    doc = db.collection(collection_name).document(document_id).get()
-    word_list = []
-    if doc.exists:
-        # Get the key list in the selected document_id
-        word_list = list(doc.to_dict().keys())
-
-        print(f"Word list from {collection_name}/{document_id}: {word_list}")
-    else:
-        print(f"No such document: {collection_name}/{document_id}")
-    return word_list
+    return repository.get_word_list(collection_name, document_id)
 
 
-# Delete data from Firestore
 def delete_data(collection_name, document_id):
-    db = init_firestore()
-    db.collection(collection_name).document(document_id).delete()
-    print(f"Data deleted from {collection_name}/{document_id}")
+    repository.delete_data(collection_name, document_id)
 
 
 # Example usage
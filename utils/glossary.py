@@ -0,0 +1,64 @@
+"""
+Saved supplement words of each user.
+users/{userName} maps each word to its description; get_supplement only needs
+the set of words, which is cached per user and updated on every write.
+"""
+
+import os
+import threading
+from typing import Optional
+
+import utils.connect_firestore as connect_firestore
+from utils.ttl_cache import TTLCache
+
+GLOSSARY_COLLECTION = "users"
+# Words saved by another instance show up after at most this long
+GLOSSARY_TTL_SECONDS = float(os.getenv("GLOSSARY_CACHE_TTL_SECONDS", "600"))
+MAX_GLOSSARIES = int(os.getenv("GLOSSARY_CACHE_MAX", "1024"))
+
+
+class GlossaryStore:
+    """
+    Write-through cache of the saved words of each user with TTL/LRU eviction
+    """
+
+    def __init__(self, max_users: int = MAX_GLOSSARIES, ttl_seconds: float = GLOSSARY_TTL_SECONDS):
+        self._cache = TTLCache(max_size=max_users, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+
+    def cached_words(self, user_name: str) -> Optional[frozenset[str]]:
+        return self._cache.get(user_name)
+
+    def words(self, user_name: str) -> frozenset[str]:
+        """
+        Saved words of a user, read from Firestore on a cache miss
+        :param user_name: str
+        :return: frozenset[str]
+        """
+        words = self._cache.get(user_name)
+        if words is None:
+            loaded = frozenset(connect_firestore.get_word_list(GLOSSARY_COLLECTION, user_name))
+            with self._lock:
+                # Keep the words added while the list was read
+                words = loaded | (self._cache.get(user_name) or frozenset())
+                self._cache.put(user_name, words)
+        return words
+
+    def add(self, user_name: str, words: dict[str, str]) -> None:
+        """
+        Save words (word -> description) for a user in a single merged write
+        """
+        if not words:
+            return
+        connect_firestore.add_data(GLOSSARY_COLLECTION, user_name, words)
+        with self._lock:
+            cached = self._cache.get(user_name)
+            # An uncached glossary is read whole on the next lookup
+            if cached is not None:
+                self._cache.put(user_name, cached | words.keys())
+
+    def invalidate(self, user_name: str) -> None:
+        self._cache.pop(user_name)
+
+
+glossaries = GlossaryStore()
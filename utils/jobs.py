@@ -0,0 +1,257 @@
+"""
+Background jobs.
+Slow LLM work (/summarize_meeting, /get_supplement with "Prefer: respond-async")
+is queued as a job instead of holding a request thread: the request returns the
+job id at once, and GET /jobs/{jobId} returns the result once the job is done.
+Jobs are delivered by the task queue selected with JOB_BACKEND:
+- local: a worker pool in the process (JOB_WORKERS threads)
+- cloud_tasks: a Cloud Tasks queue posting each job to POST /jobs/run of the
+  service (requires google-cloud-tasks). The tasks carry an OIDC token of
+  CLOUD_TASKS_SERVICE_ACCOUNT, verified by the route, which exists only with this
+  backend. Job records are then stored through utils.connect_firestore, so that
+  any instance can answer the status requests.
+Job records expire JOB_RESULT_TTL_SECONDS after their last update.
+"""
+
+import abc
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+import uuid
+
+import utils.connect_firestore as connect_firestore
+from utils.logging import logger
+from utils.ttl_cache import TTLCache
+
+JOB_BACKEND = os.getenv("JOB_BACKEND", "local")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Jobs waiting for a local worker before new jobs are refused
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "1000"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "600"))
+JOB_MAX_RECORDS = int(os.getenv("JOB_MAX_RECORDS", "10000"))
+JOB_COLLECTION = "jobs"
+
+# Cloud Tasks: queue (projects/{project}/locations/{location}/queues/{queue}), URL of POST /jobs/run,
+# and service account of the OIDC token authenticating the tasks to the service
+CLOUD_TASKS_QUEUE = os.getenv("CLOUD_TASKS_QUEUE", "")
+JOB_HANDLER_URL = os.getenv("JOB_HANDLER_URL", "")
+CLOUD_TASKS_SERVICE_ACCOUNT = os.getenv("CLOUD_TASKS_SERVICE_ACCOUNT", "")
+# Audience of the OIDC tokens of the tasks
+JOB_OIDC_AUDIENCE = os.getenv("JOB_OIDC_AUDIENCE", "") or JOB_HANDLER_URL
+
+# A handler takes the job parameters and returns (HTTP status, response body) of the job
+Handler = Callable[[dict], tuple[int, Any]]
+
+
+class JobQueueFull(Exception):
+    """Too many jobs are waiting for a worker"""
+
+
+class TaskQueue(abc.ABC):
+    """
+    Delivers each task once or more (like Cloud Tasks) to JobManager.run
+    """
+
+    @abc.abstractmethod
+    def create_task(self, task: dict) -> None:
+        """
+        Queue a task ({"jobId", "kind", "params"})
+        :raises JobQueueFull: if the queue cannot take more tasks
+        """
+
+
+class LocalTaskQueue(TaskQueue):
+    """
+    Runs the tasks on a pool of worker threads in the process
+    :param handler: Callable (run with each task)
+    """
+
+    def __init__(self, handler: Callable[[dict], None], workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING):
+        self.handler = handler
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    def create_task(self, task: dict) -> None:
+        if not self._pending.acquire(blocking=False):
+            raise JobQueueFull("Too many jobs waiting")
+        future = self._pool.submit(self.handler, task)
+        future.add_done_callback(lambda _: self._pending.release())
+
+
+class CloudTasksQueue(TaskQueue):
+    """
+    Creates a Cloud Tasks HTTP task posting each task as JSON to JOB_HANDLER_URL (POST /jobs/run).
+    The task is named after the job, so that a job is queued once.
+    """
+
+    def __init__(
+        self,
+        queue_path: str = CLOUD_TASKS_QUEUE,
+        handler_url: str = JOB_HANDLER_URL,
+        service_account: str = CLOUD_TASKS_SERVICE_ACCOUNT,
+        audience: str = JOB_OIDC_AUDIENCE,
+    ):
+        self.queue_path = queue_path
+        self.handler_url = handler_url
+        self.service_account = service_account
+        self.audience = audience
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google.cloud import tasks_v2
+
+                    self._client = tasks_v2.CloudTasksClient()
+        return self._client
+
+    def create_task(self, task: dict) -> None:
+        from google.api_core.exceptions import ResourceExhausted
+
+        http_request = {
+            "http_method": "POST",
+            "url": self.handler_url,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(task, ensure_ascii=False).encode(),
+        }
+        if self.service_account:
+            http_request["oidc_token"] = {"service_account_email": self.service_account, "audience": self.audience}
+        try:
+            self._get_client().create_task(
+                parent=self.queue_path,
+                task={"name": f"{self.queue_path}/tasks/{task['jobId']}", "http_request": http_request},
+            )
+        except ResourceExhausted as e:
+            raise JobQueueFull(str(e)) from e
+
+
+def verify_task_token(
+    authorization: str, service_account: Optional[str] = None, audience: Optional[str] = None
+) -> bool:
+    """
+    Whether a request to POST /jobs/run carries a Google-signed OIDC token of the service account of the tasks
+    :param authorization: str (Authorization header)
+    :param service_account: str (CLOUD_TASKS_SERVICE_ACCOUNT if None)
+    :param audience: str (JOB_OIDC_AUDIENCE if None)
+    :return: bool (False if either is not configured)
+    """
+    service_account = CLOUD_TASKS_SERVICE_ACCOUNT if service_account is None else service_account
+    audience = JOB_OIDC_AUDIENCE if audience is None else audience
+    if not service_account or not audience or not authorization.startswith("Bearer "):
+        return False
+    from google.auth.transport import requests as google_requests
+    from google.oauth2 import id_token
+
+    try:
+        claims = id_token.verify_oauth2_token(
+            authorization.removeprefix("Bearer "), google_requests.Request(), audience=audience
+        )
+    except ValueError as e:
+        logger.warning(f"Invalid task token: {e}")
+        return False
+    return claims.get("email") == service_account and claims.get("email_verified") is True
+
+
+class MemoryJobStore:
+    """Job records of this process"""
+
+    def __init__(self, ttl_seconds: float = JOB_RESULT_TTL_SECONDS, max_records: int = JOB_MAX_RECORDS):
+        self._records = TTLCache(max_size=max_records, ttl_seconds=ttl_seconds)
+
+    def put(self, record: dict) -> None:
+        self._records.put(record["jobId"], dict(record))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        record = self._records.get(job_id)
+        return dict(record) if record is not None else None
+
+
+class RepositoryJobStore:
+    """Job records shared by the instances, stored as documents jobs/{jobId}"""
+
+    def __init__(self, ttl_seconds: float = JOB_RESULT_TTL_SECONDS, collection: str = JOB_COLLECTION):
+        self.ttl_seconds = ttl_seconds
+        self.collection = collection
+
+    def put(self, record: dict) -> None:
+        connect_firestore.add_data(self.collection, record["jobId"], {**record, "expires_at": time.time() + self.ttl_seconds})
+
+    def get(self, job_id: str) -> Optional[dict]:
+        record = connect_firestore.get_data(self.collection, job_id)
+        if record is None or record.pop("expires_at", 0) <= time.time():
+            return None
+        return record
+
+
+class JobManager:
+    """
+    Queues jobs of registered kinds and keeps their records:
+    {"jobId", "kind", "status" (queued, running, done or failed), "statusCode", "result"}
+    """
+
+    def __init__(self, backend: str = JOB_BACKEND):
+        self._handlers: dict[str, Handler] = {}
+        if backend == "local":
+            self.store = MemoryJobStore()
+            self.queue: TaskQueue = LocalTaskQueue(self.run)
+        elif backend == "cloud_tasks":
+            self.store = RepositoryJobStore()
+            self.queue = CloudTasksQueue()
+        else:
+            raise ValueError(f"Unknown JOB_BACKEND: {backend}")
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, params: dict) -> dict:
+        """
+        Queue a job
+        :param kind: str (registered kind)
+        :param params: dict (passed to the handler)
+        :return: dict (job record)
+        :raises JobQueueFull: if the queue cannot take more jobs
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        record = {"jobId": uuid.uuid4().hex, "kind": kind, "status": "queued", "statusCode": None, "result": None}
+        # Stored first, so that a worker taking the task at once finds it
+        self.store.put(record)
+        try:
+            self.queue.create_task({"jobId": record["jobId"], "kind": kind, "params": params})
+        except Exception:
+            # The job will never run: it must not be reported as queued
+            self.store.put({**record, "status": "failed", "statusCode": 503, "result": {"message": "job not queued"}})
+            raise
+        return record
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Record of a job, or None if it is unknown or expired"""
+        return self.store.get(job_id)
+
+    def run(self, task: dict) -> None:
+        """
+        Run a queued task and store the outcome in its job record
+        A task delivered again after its job finished is ignored
+        """
+        job_id = task["jobId"]
+        record = self.store.get(job_id) or {"jobId": job_id, "kind": task["kind"]}
+        if record.get("status") in ("done", "failed"):
+            return
+        self.store.put({**record, "status": "running", "statusCode": None, "result": None})
+        began = time.perf_counter()
+        try:
+            status_code, result = self._handlers[task["kind"]](task["params"])
+            record.update(status="done", statusCode=status_code, result=result)
+        except Exception as e:
+            logger.error(f"Job failed: {e}", job_id=job_id, kind=task["kind"])
+            record.update(status="failed", statusCode=500, result={"message": "error running job"})
+        self.store.put(record)
+        logger.info("Job finished", job_id=job_id, kind=task["kind"], seconds=round(time.perf_counter() - began, 3))
+
+
+jobs = JobManager()
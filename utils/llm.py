@@ -0,0 +1,243 @@
+"""
+LLM models of the app.
+Word extraction (ask_gemini) and summaries (meeting_summarizer) ask a model for a
+JSON response following a schema, through the LLMModel of the provider selected
+with LLM_PROVIDER:
+- vertex: Gemini on Vertex AI
+- fake: a deterministic local stand-in, with configurable latency, jitter,
+  failures and concurrency limit, to measure the endpoints without network
+"""
+
+import abc
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Iterator, Optional
+
+import utils.vertex_ai as vertex_ai
+
+PROVIDER = os.getenv("LLM_PROVIDER", "vertex")
+WORD_EXTRACTION_MODEL = os.getenv("LLM_WORD_EXTRACTION_MODEL", "gemini-1.5-flash-002")
+SUMMARY_MODEL = os.getenv("LLM_SUMMARY_MODEL", "gemini-1.5-pro-002")
+# Deadline of a model call, retries included (utils.model_calls)
+WORD_EXTRACTION_TIMEOUT_SECONDS = float(os.getenv("LLM_WORD_EXTRACTION_TIMEOUT_SECONDS", "20"))
+SUMMARY_TIMEOUT_SECONDS = float(os.getenv("LLM_SUMMARY_TIMEOUT_SECONDS", "120"))
+
+# Fake provider: latency of a call (uniform within +/- jitter)
+FAKE_LATENCY_SECONDS = float(os.getenv("LLM_FAKE_LATENCY_SECONDS", "1.0"))
+FAKE_JITTER_SECONDS = float(os.getenv("LLM_FAKE_JITTER_SECONDS", "0.2"))
+# Share of calls failing with 429 (ResourceExhausted) or 503 (ServiceUnavailable)
+FAKE_FAILURE_RATE = float(os.getenv("LLM_FAKE_FAILURE_RATE", "0"))
+# Calls beyond this many in flight are rejected with 429, like an exhausted quota (0: unlimited)
+FAKE_MAX_CONCURRENCY = int(os.getenv("LLM_FAKE_MAX_CONCURRENCY", "0"))
+FAKE_SEED = int(os.getenv("LLM_FAKE_SEED", "0"))
+# Characters per chunk of a streamed fake response
+FAKE_STREAM_CHUNK_CHARS = 20
+
+# Words of a prompt used in fake responses: katakana, kanji or latin words
+TERM = re.compile(r"[ァ-ヶー]{3,}|[一-龥]{2,}|[A-Za-z][A-Za-z0-9]{2,}")
+
+
+class LLMModel(abc.ABC):
+    """
+    A model generating JSON responses
+    :param name: str (model name, also part of the cache keys of the responses)
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def warm_up(self) -> None:
+        """Set up the client ahead of the first request"""
+
+    @abc.abstractmethod
+    def generate_json(self, prompt: str, response_schema: dict) -> str:
+        """JSON response text to prompt following response_schema"""
+
+    @abc.abstractmethod
+    async def generate_json_async(self, prompt: str, response_schema: dict) -> str:
+        """Same as generate_json, without blocking the event loop"""
+
+    @abc.abstractmethod
+    def generate_json_stream(self, prompt: str, response_schema: dict) -> Iterator[str]:
+        """Same as generate_json, as chunks of the response text in the order they are generated"""
+
+
+class VertexModel(LLMModel):
+    """Gemini on Vertex AI (the SDK is imported and initialised on first use)"""
+
+    def warm_up(self) -> None:
+        vertex_ai.warm_up(self.name)
+
+    def generate_json(self, prompt: str, response_schema: dict) -> str:
+        model = vertex_ai.get_model(self.name)
+        return model.generate_content(prompt, generation_config=vertex_ai.json_config(response_schema)).text
+
+    async def generate_json_async(self, prompt: str, response_schema: dict) -> str:
+        model = vertex_ai.get_model(self.name)
+        response = await model.generate_content_async(prompt, generation_config=vertex_ai.json_config(response_schema))
+        return response.text
+
+    def generate_json_stream(self, prompt: str, response_schema: dict) -> Iterator[str]:
+        model = vertex_ai.get_model(self.name)
+        for response in model.generate_content(
+            prompt, generation_config=vertex_ai.json_config(response_schema), stream=True
+        ):
+            yield response.text
+
+
+def fake_response(response_schema: Optional[dict], prompt: str) -> Any:
+    """
+    A response following response_schema made of words of the prompt, always the same for the same prompt
+    """
+    rng = random.Random(hashlib.sha256(prompt.encode()).digest())
+    terms = TERM.findall(prompt) or ["テスト"]
+
+    def build(schema: dict, name: str) -> Any:
+        schema_type = schema.get("type")
+        if schema_type == "object":
+            return {key: build(value, key) for key, value in schema.get("properties", {}).items()}
+        if schema_type == "array":
+            return [build(schema.get("items", {}), name) for _ in range(rng.randint(1, 3))]
+        if schema_type in ("integer", "number"):
+            return rng.randint(0, 100)
+        if schema_type == "boolean":
+            return rng.random() < 0.5
+        return f"{rng.choice(terms)}の{name}"
+
+    return build(response_schema or {"type": "string"}, "text")
+
+
+class FakeGenerativeModel(LLMModel):
+    """
+    Local stand-in for a model: answers fake_response after a random latency, and fails like Vertex AI
+    (google.api_core exceptions) at random or when too many calls are in flight.
+    Latencies and failures follow a seeded random sequence, so a sequential run is reproducible.
+    A streamed response starts after half the latency and spreads the rest over its chunks.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        latency_seconds: float = FAKE_LATENCY_SECONDS,
+        jitter_seconds: float = FAKE_JITTER_SECONDS,
+        failure_rate: float = FAKE_FAILURE_RATE,
+        max_concurrency: int = FAKE_MAX_CONCURRENCY,
+        seed: int = FAKE_SEED,
+    ):
+        # Kept apart from the responses of the real model in the response cache
+        super().__init__(f"fake:{name}")
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.failure_rate = failure_rate
+        self.max_concurrency = max_concurrency
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _start(self) -> tuple[float, Optional[Exception]]:
+        """
+        Admit a call
+        :return: (latency, exception to raise after it, if the call fails)
+        """
+        from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+
+        with self._lock:
+            self.calls += 1
+            if self.max_concurrency and self._in_flight >= self.max_concurrency:
+                raise ResourceExhausted(f"{self.name}: too many requests in flight")
+            self._in_flight += 1
+            latency = max(0.0, self.latency_seconds + self._rng.uniform(-self.jitter_seconds, self.jitter_seconds))
+            error = None
+            if self._rng.random() < self.failure_rate:
+                error = (
+                    ResourceExhausted(f"{self.name}: quota exceeded")
+                    if self._rng.random() < 0.5
+                    else ServiceUnavailable(f"{self.name}: service unavailable")
+                )
+        return latency, error
+
+    def _finish(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def _response_text(self, prompt: str, response_schema: dict) -> str:
+        return json.dumps(fake_response(response_schema, prompt), ensure_ascii=False)
+
+    def generate_json(self, prompt: str, response_schema: dict) -> str:
+        latency, error = self._start()
+        try:
+            time.sleep(latency)
+            if error is not None:
+                raise error
+            return self._response_text(prompt, response_schema)
+        finally:
+            self._finish()
+
+    async def generate_json_async(self, prompt: str, response_schema: dict) -> str:
+        latency, error = self._start()
+        try:
+            await asyncio.sleep(latency)
+            if error is not None:
+                raise error
+            return self._response_text(prompt, response_schema)
+        finally:
+            self._finish()
+
+    def generate_json_stream(self, prompt: str, response_schema: dict) -> Iterator[str]:
+        latency, error = self._start()
+        try:
+            time.sleep(latency / 2)
+            if error is not None:
+                raise error
+            text = self._response_text(prompt, response_schema)
+            chunks = [text[i : i + FAKE_STREAM_CHUNK_CHARS] for i in range(0, len(text), FAKE_STREAM_CHUNK_CHARS)]
+            for chunk in chunks:
+                time.sleep(latency / 2 / len(chunks))
+                yield chunk
+        finally:
+            self._finish()
+
+
+_lock = threading.Lock()
+_models: dict[str, LLMModel] = {}
+
+
+def create_model(model_name: str, provider: Optional[str] = None) -> LLMModel:
+    """
+    Model of a provider, with the current configuration
+    :param model_name: str
+    :param provider: str (vertex or fake; LLM_PROVIDER if None)
+    :return: LLMModel
+    """
+    provider = provider or PROVIDER
+    if provider == "vertex":
+        return VertexModel(model_name)
+    if provider == "fake":
+        return FakeGenerativeModel(
+            model_name, FAKE_LATENCY_SECONDS, FAKE_JITTER_SECONDS, FAKE_FAILURE_RATE, FAKE_MAX_CONCURRENCY, FAKE_SEED
+        )
+    raise ValueError(f"Unknown LLM_PROVIDER: {provider}")
+
+
+def get_model(model_name: str) -> LLMModel:
+    """Shared model of the configured provider for model_name"""
+    model = _models.get(model_name)
+    if model is None:
+        with _lock:
+            model = _models.get(model_name)
+            if model is None:
+                model = _models[model_name] = create_model(model_name)
+    return model
+
+
+def warm_up(*model_names: str) -> None:
+    """Set up the models ahead of the first request"""
+    for model_name in model_names:
+        get_model(model_name).warm_up()
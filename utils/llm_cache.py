@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import utils.connect_firestore as connect_firestore
+from utils.logging import logger
+from utils.ttl_cache import TTLCache
+
+CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX", "1024"))
+# Set to a collection name (e.g. "llm_cache") to share responses between instances through Firestore
+CACHE_FIRESTORE_COLLECTION = os.getenv("LLM_CACHE_FIRESTORE_COLLECTION", "")
+
+
+def cache_key(model_name: str, prompt_version: str, schema: Any, *inputs: Any) -> str:
+    """
+    Content address of an LLM call
+    :param model_name: str
+    :param prompt_version: str (bump when the prompt template changes)
+    :param schema: response schema
+    :param inputs: prompt inputs
+    :return: sha256 hex digest
+    """
+    payload = json.dumps([model_name, prompt_version, schema, inputs], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache of LLM response texts: an in-process LRU, then optionally a Firestore collection
+    :param max_entries: int
+    :param ttl_seconds: float
+    :param firestore_collection: str (Firestore tier disabled if empty)
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        firestore_collection: str = CACHE_FIRESTORE_COLLECTION,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.firestore_collection = firestore_collection
+        self._memory = TTLCache(max_size=max_entries, ttl_seconds=ttl_seconds)
+        self._stats_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "firestore_hits": 0, "misses": 0}
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def get(self, key: str) -> Optional[str]:
+        text = self._memory.get(key)
+        if text is not None:
+            self._count("memory_hits")
+            return text
+        if self.firestore_collection:
+            try:
+                data = connect_firestore.get_data(self.firestore_collection, key)
+            except Exception as e:
+                logger.error(f"Error reading LLM cache: {e}")
+                data = None
+            if data and data["expires_at"] > time.time():
+                self._count("firestore_hits")
+                self._memory.put(key, data["text"])
+                return data["text"]
+        self._count("misses")
+        return None
+
+    def put(self, key: str, text: str) -> None:
+        self._memory.put(key, text)
+        if self.firestore_collection:
+            try:
+                connect_firestore.add_data(
+                    self.firestore_collection, key, {"text": text, "expires_at": time.time() + self.ttl_seconds}
+                )
+            except Exception as e:
+                logger.error(f"Error writing LLM cache: {e}")
+
+    def get_or_compute(self, key: str, compute: Callable[[], str]) -> str:
+        """
+        Cached response text for key, calling compute() on a miss
+        """
+        text = self.get(key)
+        if text is None:
+            text = compute()
+            self.put(key, text)
+        return text
+
+    async def get_or_compute_async(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """
+        Same as get_or_compute for a coroutine; the Firestore tier is accessed off the event loop
+        """
+        text = await asyncio.to_thread(self.get, key) if self.firestore_collection else self.get(key)
+        if text is None:
+            text = await compute()
+            if self.firestore_collection:
+                await asyncio.to_thread(self.put, key, text)
+            else:
+                self.put(key, text)
+        return text
+
+    def clear(self) -> None:
+        self._memory.clear()
+        with self._stats_lock:
+            self._stats = dict.fromkeys(self._stats, 0)
+
+
+llm_cache = LLMResponseCache()
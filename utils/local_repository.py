@@ -0,0 +1,343 @@
+"""
+Local storage backends, for running the app without GCP credentials (development,
+load tests, single-node deployments):
+- MemoryRepository (STORAGE_BACKEND=memory): documents in process memory, lost on exit
+- SQLiteRepository (STORAGE_BACKEND=sqlite): documents in a SQLite database file in WAL
+  mode (STORAGE_SQLITE_PATH), shared by the threads and processes of a single node
+"""
+
+import contextlib
+import copy
+from datetime import datetime, timezone
+import itertools
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Iterable, Iterator, Optional
+
+from utils.logging import logger
+from utils.repository import Repository, Write, WriteConflict
+
+SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", "storage.db")
+# Longest wait for the write lock of the database held by another connection
+SQLITE_BUSY_TIMEOUT_SECONDS = 30
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS documents (
+        collection TEXT NOT NULL,
+        id TEXT NOT NULL,
+        data TEXT NOT NULL,
+        update_time INTEGER NOT NULL,
+        PRIMARY KEY (collection, id)
+    ) WITHOUT ROWID
+    """,
+    # Source of the update times, shared by every connection to the database
+    "CREATE TABLE IF NOT EXISTS clock (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO clock VALUES (0, 0)",
+]
+
+
+def merge(document: dict, data: dict) -> dict:
+    """A copy of document with data merged into it, nested maps included (Firestore set with merge=True)"""
+    merged = dict(document)
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def missing(collection_name: str, document_id: str) -> KeyError:
+    return KeyError(f"No document {collection_name}/{document_id}")
+
+
+class MemoryRepository(Repository):
+    """
+    Documents in process memory. Stored documents are never modified in place, and
+    are copied when read, so that callers can modify what they write and read.
+    """
+
+    def __init__(self) -> None:
+        # collection name -> document id -> (data, update time)
+        self._collections: dict[str, dict[str, tuple[dict, int]]] = {}
+        self._clock = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def _document(self, collection_name: str, document_id: str) -> tuple[Optional[dict], Optional[int]]:
+        return self._collections.get(collection_name, {}).get(document_id, (None, None))
+
+    def _put(self, collection_name: str, document_id: str, data: dict) -> int:
+        update_time = next(self._clock)
+        self._collections.setdefault(collection_name, {})[document_id] = (data, update_time)
+        return update_time
+
+    def _merge(self, collection_name: str, document_id: str, data: dict) -> int:
+        document, _ = self._document(collection_name, document_id)
+        return self._put(collection_name, document_id, merge(document or {}, data))
+
+    def add_data(self, collection_name: str, document_id: str, data: dict) -> None:
+        with self._lock:
+            self._merge(collection_name, document_id, data)
+
+    def get_data(self, collection_name: str, document_id: str) -> Optional[dict]:
+        document, _ = self._document(collection_name, document_id)
+        return copy.deepcopy(document)
+
+    def get_data_with_update_time(self, collection_name: str, document_id: str) -> tuple[Optional[dict], Any]:
+        document, update_time = self._document(collection_name, document_id)
+        return copy.deepcopy(document), update_time
+
+    def set_if_unchanged(
+        self, collection_name: str, document_id: str, data: dict, update_time: Any, writes: Iterable[Write] = ()
+    ) -> Any:
+        with self._lock:
+            document, current_update_time = self._document(collection_name, document_id)
+            if current_update_time != update_time:
+                raise WriteConflict(f"{collection_name}/{document_id} was changed")
+            for write in writes:
+                self._merge(*write)
+            return self._put(collection_name, document_id, {**(document or {}), **copy.deepcopy(data)})
+
+    def update_data(self, collection_name: str, document_id: str, data: dict) -> None:
+        with self._lock:
+            document, _ = self._document(collection_name, document_id)
+            if document is None:
+                raise missing(collection_name, document_id)
+            self._put(collection_name, document_id, {**document, **copy.deepcopy(data)})
+
+    def batch_set(self, writes: list[Write]) -> None:
+        with self._lock:
+            for write in writes:
+                self._merge(*write)
+
+    def stream_data(self, collection_name: str, order_by: str, start_at: Any = None) -> Iterator[dict]:
+        documents = [
+            document
+            for document, _ in list(self._collections.get(collection_name, {}).values())
+            if order_by in document and (start_at is None or document[order_by] >= start_at)
+        ]
+        for document in sorted(documents, key=lambda document: document[order_by]):
+            yield copy.deepcopy(document)
+
+    def get_latest_data(self, collection_name: str, order_by: str) -> Optional[dict]:
+        documents = [
+            document
+            for document, _ in list(self._collections.get(collection_name, {}).values())
+            if order_by in document
+        ]
+        if not documents:
+            return None
+        return copy.deepcopy(max(documents, key=lambda document: document[order_by]))
+
+    def delete_fields(self, collection_name: str, document_id: str, field_names: list[str]) -> None:
+        with self._lock:
+            document, _ = self._document(collection_name, document_id)
+            if document is None:
+                raise missing(collection_name, document_id)
+            self._put(
+                collection_name,
+                document_id,
+                {key: value for key, value in document.items() if key not in field_names},
+            )
+
+    def delete_collection(self, collection_name: str) -> None:
+        with self._lock:
+            self._collections.pop(collection_name, None)
+
+    def get_document_list(self, collection_name: str) -> list[str]:
+        return list(self._collections.get(collection_name, {}))
+
+    def get_word_list(self, collection_name: str, document_id: str) -> list[str]:
+        document, _ = self._document(collection_name, document_id)
+        return list(document or {})
+
+    def delete_data(self, collection_name: str, document_id: str) -> None:
+        with self._lock:
+            self._collections.get(collection_name, {}).pop(document_id, None)
+
+
+def encode_value(value: Any) -> Any:
+    """
+    JSON form of the values json cannot encode: datetimes (e.g. Firestore timestamps)
+    become {"$datetime": ISO 8601 UTC}, which sorts like the datetimes
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return {"$datetime": value.astimezone(timezone.utc).isoformat(timespec="microseconds")}
+    raise TypeError(f"Cannot store a {type(value).__name__}")
+
+
+def decode_object(value: dict) -> Any:
+    if value.keys() == {"$datetime"}:
+        return datetime.fromisoformat(value["$datetime"])
+    return value
+
+
+def encode(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=encode_value)
+
+
+def decode(text: str) -> Any:
+    return json.loads(text, object_hook=decode_object)
+
+
+def field_path(field_name: str) -> str:
+    """JSON path of a top-level field"""
+    return '$."' + field_name.replace('"', '""') + '"'
+
+
+def sql_value(value: Any) -> Any:
+    """A field value as json_extract returns it, for comparisons in SQL"""
+    return value if isinstance(value, (str, int, float)) else encode(value)
+
+
+class SQLiteRepository(Repository):
+    """
+    Documents stored as JSON in a SQLite database in WAL mode: reads do not wait for writes, and
+    writes (each in one transaction) are serialised across the threads and processes using the file.
+    :param path: str (path of the database file, created if needed)
+    """
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        # One connection per thread
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_SECONDS, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Durable on commit up to a power loss (not an application crash) in WAL mode, and much faster
+            connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            logger.debug("SQLite storage opened", path=self.path)
+        return connection
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connection()
+        # Take the write lock up front, so that read-modify-write transactions cannot deadlock
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _document(
+        self, connection: sqlite3.Connection, collection_name: str, document_id: str
+    ) -> tuple[Optional[dict], Optional[int]]:
+        row = connection.execute(
+            "SELECT data, update_time FROM documents WHERE collection = ? AND id = ?", (collection_name, document_id)
+        ).fetchone()
+        return (decode(row[0]), row[1]) if row is not None else (None, None)
+
+    def _put(self, connection: sqlite3.Connection, collection_name: str, document_id: str, data: dict) -> int:
+        connection.execute("UPDATE clock SET value = value + 1")
+        (update_time,) = connection.execute("SELECT value FROM clock").fetchone()
+        connection.execute(
+            "INSERT INTO documents (collection, id, data, update_time) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (collection, id) DO UPDATE SET data = excluded.data, update_time = excluded.update_time",
+            (collection_name, document_id, encode(data), update_time),
+        )
+        return update_time
+
+    def _merge(self, connection: sqlite3.Connection, collection_name: str, document_id: str, data: dict) -> int:
+        document, _ = self._document(connection, collection_name, document_id)
+        return self._put(connection, collection_name, document_id, merge(document or {}, data))
+
+    def warm_up(self) -> None:
+        self._connection()
+
+    def add_data(self, collection_name: str, document_id: str, data: dict) -> None:
+        with self._transaction() as connection:
+            self._merge(connection, collection_name, document_id, data)
+
+    def get_data(self, collection_name: str, document_id: str) -> Optional[dict]:
+        document, _ = self._document(self._connection(), collection_name, document_id)
+        return document
+
+    def get_data_with_update_time(self, collection_name: str, document_id: str) -> tuple[Optional[dict], Any]:
+        return self._document(self._connection(), collection_name, document_id)
+
+    def set_if_unchanged(
+        self, collection_name: str, document_id: str, data: dict, update_time: Any, writes: Iterable[Write] = ()
+    ) -> Any:
+        with self._transaction() as connection:
+            document, current_update_time = self._document(connection, collection_name, document_id)
+            if current_update_time != update_time:
+                raise WriteConflict(f"{collection_name}/{document_id} was changed")
+            for write in writes:
+                self._merge(connection, *write)
+            return self._put(connection, collection_name, document_id, {**(document or {}), **data})
+
+    def update_data(self, collection_name: str, document_id: str, data: dict) -> None:
+        with self._transaction() as connection:
+            document, _ = self._document(connection, collection_name, document_id)
+            if document is None:
+                raise missing(collection_name, document_id)
+            self._put(connection, collection_name, document_id, {**document, **data})
+
+    def batch_set(self, writes: list[Write]) -> None:
+        with self._transaction() as connection:
+            for write in writes:
+                self._merge(connection, *write)
+
+    def stream_data(self, collection_name: str, order_by: str, start_at: Any = None) -> Iterator[dict]:
+        path = field_path(order_by)
+        query = "SELECT data FROM documents WHERE collection = ? AND json_type(data, ?) IS NOT NULL"
+        parameters = [collection_name, path]
+        if start_at is not None:
+            query += " AND json_extract(data, ?) >= ?"
+            parameters += [path, sql_value(start_at)]
+        rows = self._connection().execute(query + " ORDER BY json_extract(data, ?)", [*parameters, path]).fetchall()
+        for (text,) in rows:
+            yield decode(text)
+
+    def get_latest_data(self, collection_name: str, order_by: str) -> Optional[dict]:
+        path = field_path(order_by)
+        row = (
+            self._connection()
+            .execute(
+                "SELECT data FROM documents WHERE collection = ? AND json_type(data, ?) IS NOT NULL "
+                "ORDER BY json_extract(data, ?) DESC LIMIT 1",
+                (collection_name, path, path),
+            )
+            .fetchone()
+        )
+        return decode(row[0]) if row is not None else None
+
+    def delete_fields(self, collection_name: str, document_id: str, field_names: list[str]) -> None:
+        with self._transaction() as connection:
+            document, _ = self._document(connection, collection_name, document_id)
+            if document is None:
+                raise missing(collection_name, document_id)
+            self._put(
+                connection,
+                collection_name,
+                document_id,
+                {key: value for key, value in document.items() if key not in field_names},
+            )
+
+    def delete_collection(self, collection_name: str) -> None:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM documents WHERE collection = ?", (collection_name,))
+
+    def get_document_list(self, collection_name: str) -> list[str]:
+        rows = self._connection().execute("SELECT id FROM documents WHERE collection = ?", (collection_name,))
+        return [document_id for (document_id,) in rows]
+
+    def get_word_list(self, collection_name: str, document_id: str) -> list[str]:
+        return list(self.get_data(collection_name, document_id) or {})
+
+    def delete_data(self, collection_name: str, document_id: str) -> None:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM documents WHERE collection = ? AND id = ?", (collection_name, document_id))
@@ -0,0 +1,171 @@
+import itertools
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Optional, TextIO
+
+import structlog
+
+# Log events waiting for the writer thread
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Once the queue is this full, only one DEBUG/INFO event in SAMPLE_EVERY is kept
+PRESSURE_RATIO = float(os.getenv("LOG_PRESSURE_RATIO", "0.8"))
+SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "10"))
+# Longest time a WARNING/ERROR event waits for room in a full queue before it is dropped
+BLOCK_SECONDS = float(os.getenv("LOG_BLOCK_SECONDS", "0.1"))
+# Longest string field (message included) written to a log line
+MAX_FIELD_LENGTH = int(os.getenv("LOG_MAX_FIELD_LENGTH", "2000"))
+# Lines written at once by the writer thread
+MAX_BATCH = 256
+
+_IMPORTANT = {"warning", "error", "critical", "exception"}
+
+
+def truncate_fields(event_dict: dict, max_length: int = MAX_FIELD_LENGTH) -> dict:
+    """Cuts the string fields of an event to max_length characters"""
+    for key, value in event_dict.items():
+        if isinstance(value, str) and len(value) > max_length:
+            event_dict[key] = f"{value[:max_length]}... ({len(value)} chars)"
+    return event_dict
+
+
+class AsyncLogWriter:
+    """
+    Renders and writes log events to stdout on a background thread.
+    The queue is bounded: under pressure DEBUG/INFO events are sampled, then dropped
+    when it is full, while WARNING/ERROR events wait briefly for room. The number of
+    dropped events is reported in the log.
+    :param stream: file written to (sys.stdout at the time of writing if None)
+    """
+
+    def __init__(
+        self,
+        max_queue: int = QUEUE_SIZE,
+        sample_every: int = SAMPLE_EVERY,
+        pressure_ratio: float = PRESSURE_RATIO,
+        block_seconds: float = BLOCK_SECONDS,
+        stream: Optional[TextIO] = None,
+    ):
+        self.stream = stream
+        self.sample_every = sample_every
+        self.block_seconds = block_seconds
+        self._pressure_size = max(1, int(max_queue * pressure_ratio))
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._renderer = structlog.processors.JSONRenderer()
+        self._sample_counter = itertools.count()
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, event_dict: dict) -> None:
+        important = event_dict.get("severity") in _IMPORTANT
+        if (
+            not important
+            and self._queue.qsize() >= self._pressure_size
+            and next(self._sample_counter) % self.sample_every
+        ):
+            self._drop()
+            return
+        self._ensure_started()
+        try:
+            if important:
+                self._queue.put(event_dict, timeout=self.block_seconds)
+            else:
+                self._queue.put_nowait(event_dict)
+        except queue.Full:
+            self._drop()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until the events submitted so far are written
+        :return: bool (False if the writer did not catch up within timeout)
+        """
+        if self._thread is not None and self._thread.is_alive():
+            marker = threading.Event()
+            try:
+                self._queue.put(marker, timeout=timeout)
+            except queue.Full:
+                return False
+            if not marker.wait(timeout):
+                return False
+        (self.stream or sys.stdout).flush()
+        return True
+
+    def dropped(self) -> int:
+        with self._lock:
+            return self._dropped
+
+    def _drop(self) -> None:
+        with self._lock:
+            self._dropped += 1
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        reported_drops = 0
+        while True:
+            items = [self._queue.get()]
+            while len(items) < MAX_BATCH:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            markers = []
+            for item in items:
+                if isinstance(item, threading.Event):
+                    markers.append(item)
+                else:
+                    lines.append(self._render(item))
+            dropped = self.dropped()
+            if dropped != reported_drops:
+                lines.append(
+                    self._render(
+                        {
+                            "severity": "warning",
+                            "message": "Log events dropped",
+                            "dropped": dropped - reported_drops,
+                            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                        }
+                    )
+                )
+                reported_drops = dropped
+            if lines:
+                stream = self.stream or sys.stdout
+                try:
+                    stream.write("".join(lines))
+                    stream.flush()
+                except Exception:
+                    pass
+            # Markers are set after the lines queued before them are written
+            for marker in markers:
+                marker.set()
+
+    def _render(self, event_dict: dict) -> str:
+        try:
+            return self._renderer(None, None, truncate_fields(event_dict)) + "\n"
+        except Exception as e:
+            return self._renderer(None, None, {"severity": "error", "message": f"Unrenderable log event: {e}"}) + "\n"
+
+
+class QueueLogger:
+    """
+    structlog logger handing the processed event dict (passed as keyword arguments
+    when the last processor returns a dict) to an AsyncLogWriter
+    """
+
+    def __init__(self, writer: AsyncLogWriter):
+        self._writer = writer
+
+    def msg(self, **event_dict: object) -> None:
+        self._writer.submit(event_dict)
+
+    debug = info = warning = warn = error = critical = exception = fatal = log = msg
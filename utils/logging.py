@@ -12,12 +12,37 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Dict
-
-from flask import request
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from flask import has_request_context, request
 import structlog
 
-from utils import metadata
+from utils.log_writer import AsyncLogWriter, QueueLogger, truncate_fields
+
+# Events below this level are dropped before rendering
+LOG_LEVEL = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper())
+# Longest payload (document, transcript...) written to a log line
+MAX_PAYLOAD_LENGTH = int(os.getenv("LOG_MAX_PAYLOAD_LENGTH", "500"))
+# Render and write log lines on a background thread (LOG_ASYNC=false writes them on the calling thread)
+ASYNC_LOGGING = os.getenv("LOG_ASYNC", "true").lower() == "true"
+# A failed lookup of the project of the traces is retried after this many seconds
+TRACE_PROJECT_RETRY_SECONDS = float(os.getenv("LOG_TRACE_PROJECT_RETRY_SECONDS", "60"))
+
+log_writer = AsyncLogWriter()
+
+
+def level_filter(
+    logger: structlog.PrintLogger, log_method: str, event_dict: Dict
+) -> Dict:
+    """Drops events below LOG_LEVEL"""
+    if structlog.stdlib.NAME_TO_LEVEL.get(log_method, logging.NOTSET) < LOG_LEVEL:
+        raise structlog.DropEvent
+    return event_dict
 
 
 def field_name_modifier(
@@ -39,6 +64,46 @@ def field_name_modifier(
     return event_dict
 
 
+_trace_prefix: Optional[str] = None
+_trace_prefix_retry_at = 0.0
+_trace_prefix_lock = threading.Lock()
+
+
+def _lookup_project() -> Optional[str]:
+    project = os.getenv("GOOGLE_CLOUD_PROJECT")
+    if not project:
+        # google.auth is only imported when the project has to be discovered
+        from utils import metadata
+
+        try:
+            project = metadata.get_project_id()
+        except Exception:
+            return None
+    return project or None
+
+
+def trace_prefix() -> Optional[str]:
+    """Prefix of the trace field, "projects/{project}/traces/", resolved once per process:
+    from GOOGLE_CLOUD_PROJECT, else with a credential discovery (metadata server or ADC).
+    None while the project cannot be found, in which case no trace is added; the lookup
+    is then retried at most every TRACE_PROJECT_RETRY_SECONDS."""
+    global _trace_prefix, _trace_prefix_retry_at
+    if _trace_prefix is not None or time.monotonic() < _trace_prefix_retry_at:
+        return _trace_prefix
+    # A single thread looks the project up; the others log without a trace meanwhile
+    if _trace_prefix_lock.acquire(blocking=False):
+        try:
+            if _trace_prefix is None and time.monotonic() >= _trace_prefix_retry_at:
+                project = _lookup_project()
+                if project is not None:
+                    _trace_prefix = f"projects/{project}/traces/"
+                else:
+                    _trace_prefix_retry_at = time.monotonic() + TRACE_PROJECT_RETRY_SECONDS
+        finally:
+            _trace_prefix_lock.release()
+    return _trace_prefix
+
+
 def trace_modifier(
     logger: structlog.PrintLogger, log_method: str, event_dict: Dict
 ) -> Dict:
@@ -46,32 +111,49 @@ def trace_modifier(
     https://cloud.google.com/run/docs/logging#correlate-logs
     """
     # Only attempt to get the context if in a request
-    if request:
+    if has_request_context():
 
         trace_header = request.headers.get("X-Cloud-Trace-Context")
         # Only append the trace if it exists in the request
         if trace_header:
-            trace = trace_header.split("/")
-            project = metadata.get_project_id()
-            event_dict[
-                "logging.googleapis.com/trace"
-            ] = f"projects/{project}/traces/{trace[0]}"
+            prefix = trace_prefix()
+            if prefix is not None:
+                # TRACE_ID/SPAN_ID;o=TRACE_TRUE
+                event_dict["logging.googleapis.com/trace"] = prefix + trace_header.partition("/")[0]
     return event_dict
 
 
+def field_truncator(
+    logger: structlog.PrintLogger, log_method: str, event_dict: Dict
+) -> Dict:
+    """Cuts long string fields (e.g. whole transcripts in a message)"""
+    return truncate_fields(event_dict)
+
+
 def getJSONLogger() -> structlog._config.BoundLoggerLazyProxy:
     """Create a JSON logger using the field name and trace modifiers created above"""
     # extend using https://www.structlog.org/en/stable/processors.html
+    # The request-bound fields (trace, timestamp) are added on the calling thread
+    processors = [
+        level_filter,
+        structlog.stdlib.add_log_level,
+        structlog.stdlib.PositionalArgumentsFormatter(),
+        field_name_modifier,
+        trace_modifier,
+        structlog.processors.TimeStamper("iso"),
+    ]
+    if ASYNC_LOGGING:
+        # The event dict is handed to the log writer thread, which truncates, renders and writes it
+        logger_factory = lambda *args: QueueLogger(log_writer)  # noqa: E731
+    else:
+        processors += [field_truncator, structlog.processors.JSONRenderer()]
+        logger_factory = structlog.PrintLoggerFactory()
     structlog.configure(
-        processors=[
-            structlog.stdlib.add_log_level,
-            structlog.stdlib.PositionalArgumentsFormatter(),
-            field_name_modifier,
-            trace_modifier,
-            structlog.processors.TimeStamper("iso"),
-            structlog.processors.JSONRenderer(),
-        ],
+        processors=processors,
+        logger_factory=logger_factory,
         wrapper_class=structlog.stdlib.BoundLogger,
+        # Build the processor chain once instead of on every log call
+        cache_logger_on_first_use=True,
     )
     return structlog.get_logger()
 
@@ -79,11 +161,30 @@ def getJSONLogger() -> structlog._config.BoundLoggerLazyProxy:
 logger = getJSONLogger()
 
 
+def is_enabled_for(level: int) -> bool:
+    return level >= LOG_LEVEL
+
+
+def truncate(value: Any, max_length: int = MAX_PAYLOAD_LENGTH) -> str:
+    """Renders value for a log line, cut to max_length characters"""
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) > max_length:
+        return f"{text[:max_length]}... ({len(text)} chars)"
+    return text
+
+
+def log_payload(message: str, payload: Any, **fields: Any) -> None:
+    """Logs a (possibly large) payload at DEBUG level.
+    The payload is only rendered, and truncated, when DEBUG is enabled."""
+    if is_enabled_for(logging.DEBUG):
+        logger.debug(message, payload=truncate(payload), **fields)
+
+
 def flush() -> None:
-    # Setting PYTHONUNBUFFERED in Dockerfile/Buildpack ensured no buffering
+    """Writes the log lines still queued for the log writer thread"""
+    # Setting PYTHONUNBUFFERED in Dockerfile/Buildpack ensured no buffering of stdout itself
+    log_writer.flush()
+
 
-    # https://docs.python.org/3/library/logging.html#logging.shutdown
-    # When the logging module is imported, it registers this
-    # function as an exit handler (see atexit), so normally
-    # there’s no need to do that manually.
-    pass
+# The writer thread is a daemon: drain it when the interpreter exits
+atexit.register(flush)
@@ -0,0 +1,51 @@
+from dataclasses import dataclass
+import os
+from typing import Optional
+
+from utils.striped_lock import StripedLock
+from utils.ttl_cache import TTLCache
+
+# Sessions idle for longer than this are reloaded from Firestore
+SESSION_TTL_SECONDS = float(os.getenv("MEETING_SESSION_TTL_SECONDS", "3600"))
+MAX_SESSIONS = int(os.getenv("MEETING_SESSION_MAX", "1024"))
+# Transcript merges of a meeting hold one of these locks
+LOCK_STRIPES = int(os.getenv("MEETING_LOCK_STRIPES", "64"))
+
+
+@dataclass
+class MeetingSession:
+    """
+    Process-local state of a meeting, mirrored from the meeting/{meetId} document
+    :param archive_text: str (latest caption window, not confirmed yet)
+    :param segment_count: int (number of confirmed transcript segments)
+    :param update_time: update time of the meeting document when it was read or written (None if unknown)
+    :param generation: str (id written when the meeting document is created, as meet codes are reused;
+        None for meetings created before it was written)
+    """
+
+    archive_text: str = ""
+    segment_count: int = 0
+    update_time: Optional[object] = None
+    generation: Optional[str] = None
+
+
+class MeetingSessionStore:
+    """
+    MeetingSession cache keyed by meetId with TTL/LRU eviction
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self._cache = TTLCache(max_size=max_sessions, ttl_seconds=ttl_seconds)
+
+    def get(self, meet_id: str) -> Optional[MeetingSession]:
+        return self._cache.get(meet_id)
+
+    def put(self, meet_id: str, session: MeetingSession) -> None:
+        self._cache.put(meet_id, session)
+
+    def invalidate(self, meet_id: str) -> None:
+        self._cache.pop(meet_id)
+
+
+meeting_sessions = MeetingSessionStore()
+meeting_locks = StripedLock(LOCK_STRIPES)
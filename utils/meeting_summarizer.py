@@ -1,11 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
 import json
+import os
+import re
+from typing import Iterator, Optional
 
-import vertexai
-from vertexai.generative_models import GenerationConfig, GenerativeModel
+import utils.llm as llm
+from utils.llm_cache import cache_key, llm_cache
+from utils.model_calls import model_calls
+from utils.single_flight import llm_flight
 
-# Vertex AI の初期化
-PROJECT_ID = "ykongrs-zenn-hackathon-2025"
-vertexai.init(project=PROJECT_ID, location="us-central1")
+MODEL_NAME = llm.SUMMARY_MODEL
+# プロンプトを変更したら更新する（キャッシュ済みの応答を再利用しないため）
+PROMPT_VERSION = "1"
 
 # 応答のスキーマ定義
 response_schema = {
@@ -26,21 +32,188 @@ response_schema = {
 }
 
 
-class MeetingSummarizer:
+# 長い会議は文の区切りでこの文字数以下のチャンクに分割し、並列に要約してから統合する
+CHUNK_CHARS = int(os.getenv("SUMMARY_CHUNK_CHARS", "8000"))
+# チャンクの要約を並列に実行する数
+MAX_WORKERS = int(os.getenv("SUMMARY_MAX_WORKERS", "4"))
+
+SENTENCE_END = re.compile(r"(?<=[。！？\n])")
+
+
+def split_sentences(text: str, chunk_size: int) -> list[str]:
+    """
+    文の区切りで、chunk_size 文字以下のチャンクに分割する
+
+    Args:
+        text: 分割するテキスト
+        chunk_size: チャンクの最大文字数（chunk_size より長い文はその長さで分割する）
+
+    Returns:
+        list[str]: チャンクのリスト
+    """
+    chunks = []
+    current = ""
+    for sentence in SENTENCE_END.split(text):
+        while len(sentence) > chunk_size:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:chunk_size])
+            sentence = sentence[chunk_size:]
+        if current and len(current) + len(sentence) > chunk_size:
+            chunks.append(current)
+            current = ""
+        current += sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class SummaryStreamParser:
+    """
+    ストリーミングで届く要約 JSON から、書き終わった箇条書きを順に取り出す
+
+    トップレベルのオブジェクト直下の配列（bullet_points, action_items）の文字列要素を
+    閉じ引用符が届いた時点で返す。JSON 全体の検証は最後に json.loads で行う
+    """
+
     def __init__(self):
-        self.model = GenerativeModel("gemini-1.5-pro-002")
+        # 開いているオブジェクト・配列の括弧
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False
+        self._raw: list[str] = []
+        # トップレベルで最後に読んだキーと、現在の配列のキー
+        self._key: Optional[str] = None
+        self._array_key: Optional[str] = None
+
+    def feed(self, text: str) -> Iterator[tuple[str, str]]:
+        """
+        Args:
+            text: 応答テキストの続き
+
+        Yields:
+            tuple[str, str]: (配列のキー, 書き終わった要素)
+        """
+        for char in text:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    value = json.loads('"' + "".join(self._raw) + '"')
+                    if self._stack == ["{"]:
+                        self._key = value
+                    elif self._stack == ["{", "["] and self._array_key is not None:
+                        yield self._array_key, value
+                    continue
+                self._raw.append(char)
+            elif char == '"':
+                self._in_string = True
+                self._raw = []
+            elif char in "{[":
+                self._stack.append(char)
+                if self._stack == ["{", "["]:
+                    self._array_key = self._key
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+
+
+class MeetingSummarizer:
+    def __init__(self, chunk_size: int = CHUNK_CHARS, max_workers: int = MAX_WORKERS):
+        # 設定された LLM プロバイダのモデル（最初に要約するときに作成する）
+        self.model = None
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
 
     def summarize(self, meeting_text: str) -> dict:
         """
         会議内容を要約する
+        chunk_size より長い会議は、チャンクごとの要約を並列に作成してから統合する (map-reduce)
 
         Args:
             meeting_text: 会議の内容テキスト
 
         Returns:
             dict: 生成された要約（箇条書き、アクションアイテム）
+
+        Raises:
+            ModelUnavailable: モデルが期限内に応答しなかった場合（サーキットが開いている場合を含む）
+        """
+        if len(meeting_text) <= self.chunk_size:
+            return self._summarize_chunk(meeting_text)
+
+        chunks = split_sentences(meeting_text, self.chunk_size)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            partial_summaries = list(executor.map(self._summarize_chunk, chunks))
+        return self._reduce(partial_summaries)
+
+    def summarize_stream(self, meeting_text: str) -> Iterator[tuple[str, object]]:
+        """
+        会議内容を要約し、生成された箇条書きから順に返す
+        長い会議はチャンクの要約までを summarize と同様に行い、最後の統合だけをストリーミングする
+
+        Args:
+            meeting_text: 会議の内容テキスト
+
+        Yields:
+            tuple[str, object]: ("bullet_points" または "action_items", 要素) を生成された順に、
+                最後に ("summary", 要約全体の dict)
+        """
+        if len(meeting_text) <= self.chunk_size:
+            yield from self._generate_stream(self._summary_prompt(meeting_text), "summary", meeting_text)
+            return
+
+        chunks = split_sentences(meeting_text, self.chunk_size)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            partial_summaries = list(executor.map(self._summarize_chunk, chunks))
+            groups = self._group(partial_summaries)
+            while len(groups) > 1 and len(groups) < len(partial_summaries):
+                partial_summaries = list(executor.map(self._reduce_group, groups))
+                groups = self._group(partial_summaries)
+        summaries_text = _format_summaries(partial_summaries)
+        yield from self._generate_stream(self._reduce_prompt(summaries_text), "reduce", summaries_text)
+
+    def update(self, summary: Optional[dict], meeting_text: str) -> dict:
         """
+        これまでの要約に、その後の会議内容を反映する
+
+        Args:
+            summary: これまでの要約（None の場合は meeting_text だけを要約する）
+            meeting_text: まだ要約に反映していない会議の内容テキスト
+
+        Returns:
+            dict: 更新された要約（箇条書き、アクションアイテム）
+        """
+        if summary is None:
+            return self.summarize(meeting_text)
+        if len(meeting_text) > self.chunk_size:
+            return self._reduce([summary, self.summarize(meeting_text)])
+
+        summary_text = _format_summaries([summary])
         prompt = f"""
+        以下はこれまでの会議の要約と、その後の会議内容です。その後の会議内容を反映して要約を更新してください。
+        - 重要なポイントは箇条書きで
+        - アクションアイテムは具体的なTodoとして
+        - 簡潔な回答を心がけてください
+
+        これまでの要約:
+        {summary_text}
+
+        その後の会議内容:
+        {meeting_text}
+        """
+        return self._generate(prompt, "update", summary_text, meeting_text)
+
+    def _summarize_chunk(self, meeting_text: str) -> dict:
+        return self._generate(self._summary_prompt(meeting_text), "summary", meeting_text)
+
+    @staticmethod
+    def _summary_prompt(meeting_text: str) -> str:
+        return f"""
         以下の会議内容を要約してください。
         - 重要なポイントは箇条書きで
         - アクションアイテムは具体的なTodoとして
@@ -50,9 +223,96 @@ class MeetingSummarizer:
         {meeting_text}
         """
 
-        response = self.model.generate_content(
-            prompt,
-            generation_config=GenerationConfig(response_mime_type="application/json", response_schema=response_schema),
-        )
+    def _reduce(self, partial_summaries: list[dict]) -> dict:
+        """
+        部分要約を統合する（統合する内容が chunk_size を超える場合は段階的に統合する）
+        """
+        groups = self._group(partial_summaries)
+
+        # 1 つにまとまる（またはこれ以上まとめられない）場合は 1 回で統合する
+        if len(groups) == 1 or len(groups) == len(partial_summaries):
+            return self._reduce_group(partial_summaries)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(groups))) as executor:
+            return self._reduce(list(executor.map(self._reduce_group, groups)))
+
+    def _group(self, partial_summaries: list[dict]) -> list[list[dict]]:
+        """
+        部分要約を、まとめた内容が chunk_size 以下になるグループに分ける
+        """
+        groups = []
+        current = []
+        for partial_summary in partial_summaries:
+            if current and len(_format_summaries(current + [partial_summary])) > self.chunk_size:
+                groups.append(current)
+                current = []
+            current.append(partial_summary)
+        groups.append(current)
+        return groups
+
+    def _reduce_group(self, partial_summaries: list[dict]) -> dict:
+        summaries_text = _format_summaries(partial_summaries)
+        return self._generate(self._reduce_prompt(summaries_text), "reduce", summaries_text)
+
+    @staticmethod
+    def _reduce_prompt(summaries_text: str) -> str:
+        return f"""
+        以下は長い会議を分割して要約した部分要約です。これらを統合して会議全体の要約を作成してください。
+        - 重複するポイントはまとめてください
+        - アクションアイテムは具体的なTodoとして
+        - 簡潔な回答を心がけてください
+
+        部分要約:
+        {summaries_text}
+        """
+
+    def _get_model(self) -> llm.LLMModel:
+        if self.model is None:
+            self.model = llm.get_model(MODEL_NAME)
+        return self.model
+
+    def _generate(self, prompt: str, *inputs: str) -> dict:
+        model = self._get_model()
+
+        def generate() -> str:
+            # 期限・同時実行数・リトライ・サーキットブレーカーは model_calls が管理する
+            return model_calls.call(
+                model.name, lambda: model.generate_json(prompt, response_schema), llm.SUMMARY_TIMEOUT_SECONDS
+            )
+
+        # 同じ内容の要約はキャッシュから返す（実行中の同じ要約があればその結果を待つ）
+        key = cache_key(model.name, PROMPT_VERSION, response_schema, *inputs)
+        response_text = llm_flight.do(key, lambda: llm_cache.get_or_compute(key, generate))
+
+        return json.loads(response_text)
+
+    def _generate_stream(self, prompt: str, *inputs: str) -> Iterator[tuple[str, object]]:
+        model = self._get_model()
+        key = cache_key(model.name, PROMPT_VERSION, response_schema, *inputs)
+        response_text = llm_cache.get(key)
+        if response_text is not None:
+            # キャッシュ済みの要約はそのまま順に返す
+            summary = json.loads(response_text)
+            for name in ("bullet_points", "action_items"):
+                for item in summary[name]:
+                    yield name, item
+            yield "summary", summary
+            return
+
+        parser = SummaryStreamParser()
+        texts = []
+        for text in model_calls.stream(
+            model.name, lambda: model.generate_json_stream(prompt, response_schema), llm.SUMMARY_TIMEOUT_SECONDS
+        ):
+            texts.append(text)
+            yield from parser.feed(text)
+        response_text = "".join(texts)
+        summary = json.loads(response_text)
+        # 最後まで生成できた要約だけをキャッシュする
+        llm_cache.put(key, response_text)
+        yield "summary", summary
+
 
-        return json.loads(response.text)
+def _format_summaries(summaries: list[dict]) -> str:
+    bullet_points = "\n".join(f"- {point}" for summary in summaries for point in summary["bullet_points"])
+    action_items = "\n".join(f"- {item}" for summary in summaries for item in summary["action_items"])
+    return f"重要なポイント:\n{bullet_points}\nアクションアイテム:\n{action_items}"
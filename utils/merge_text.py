@@ -1,35 +1,83 @@
-import difflib
+"""
+Merge overlapping Google Meet caption windows.
+The new window is matched against the archive text with a KMP automaton, which
+runs in O(len(original_text) + len(new_text)).
+"""
 
-def merge(original_text, new_text):
-    archive_text = ""
-    confirmed_text = ""
+# Punctuation marks are ignored for comparison
+PUNCTUATION_MARKS = "、。！？"
+_TRANSLATION_TABLE = str.maketrans("", "", PUNCTUATION_MARKS)
 
-    # Remove punctuation marks from the texts for comparison
-    punctuation_marks = "、。！？"
-    translation_table = str.maketrans("", "", punctuation_marks)
-    original_text_no_punctuation = original_text.translate(translation_table)
-    new_text_no_punctuation = new_text.translate(translation_table)
+# Overlaps shorter than this are treated as coincidental (single kana etc.)
+MIN_OVERLAP = 2
 
 
-    matcher = difflib.SequenceMatcher(None, original_text_no_punctuation, new_text_no_punctuation)
-    longest_match = matcher.find_longest_match(0, len(original_text_no_punctuation), 0, len(new_text_no_punctuation))
-    print("longest_match: {}".format(longest_match))
+def _prefix_function(pattern: str) -> list[int]:
+    """
+    KMP failure function: fail[i] is the length of the longest proper prefix of
+    pattern[:i + 1] that is also its suffix
+    """
+    fail = [0] * len(pattern)
+    k = 0
+    for i in range(1, len(pattern)):
+        char = pattern[i]
+        while k and pattern[k] != char:
+            k = fail[k - 1]
+        if pattern[k] == char:
+            k += 1
+        fail[i] = k
+    return fail
 
-    if longest_match.b != 0:
-        archive_text = new_text_no_punctuation
-        confirmed_text = original_text_no_punctuation
 
+def find_overlap(original_text: str, new_text: str) -> tuple[int, int]:
+    """
+    Find the longest prefix of new_text that occurs in original_text
+    :param original_text: str (without punctuation)
+    :param new_text: str (without punctuation)
+    :return: (start index in original_text, overlap length); ties prefer the latest occurrence
+    """
+    if not original_text or not new_text:
+        return 0, 0
+
+    fail = _prefix_function(new_text)
+    pattern_length = len(new_text)
+    best_start, best_size = 0, 0
+    k = 0
+    for i, char in enumerate(original_text):
+        while k and (k == pattern_length or new_text[k] != char):
+            k = fail[k - 1]
+        if new_text[k] == char:
+            k += 1
+        if k and k >= best_size:
+            best_start, best_size = i - k + 1, k
+    return best_start, best_size
+
+
+def merge(original_text: str, new_text: str, min_overlap: int = MIN_OVERLAP) -> tuple[str, str]:
+    """
+    Merge a new caption window into the previous one
+    :param original_text: str (previous window, i.e. the archive text)
+    :param new_text: str (new caption window)
+    :param min_overlap: int (shortest overlap accepted as an anchor)
+    :return: (confirmed_text, archive_text)
+    """
+    # Remove punctuation marks from the texts for comparison
+    original_text_no_punctuation = original_text.translate(_TRANSLATION_TABLE)
+    new_text_no_punctuation = new_text.translate(_TRANSLATION_TABLE)
+
+    index_match_head, match_size = find_overlap(original_text_no_punctuation, new_text_no_punctuation)
+
+    archive_text = new_text_no_punctuation
+    if match_size == 0 or match_size < min(min_overlap, len(new_text_no_punctuation)):
+        # The new window does not continue the previous one: confirm all of it
+        confirmed_text = original_text_no_punctuation
     else:
-        # Extract matching text only first block
-        index_match_head = longest_match.a
-        index_match_tail = longest_match.a + longest_match.size
-        print("match: {}".format(original_text_no_punctuation[index_match_head:index_match_tail]))
-        
-        archive_text = new_text_no_punctuation
+        # Confirm the text before the point where the new window starts
         confirmed_text = original_text_no_punctuation[:index_match_head]
 
     return confirmed_text, archive_text
 
+
 if __name__ == "__main__":
     # Test list
     original_text = ""
@@ -52,11 +100,11 @@ if __name__ == "__main__":
 
         # print("original_text: {}, new_text: {}".format(original_text, new_text))
         confirmed_text, archive_text = merge(original_text, new_text)
-        
+
         # print("confirmed_text: {}".format(confirmed_text))
         # print("archive_text: {}".format(archive_text))
 
         confirmed_buffer += confirmed_text
         original_text = archive_text
 
-    print("confirmed_buffer: {}".format(confirmed_buffer))
\ No newline at end of file
+    print("confirmed_buffer: {}".format(confirmed_buffer))
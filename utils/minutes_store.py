@@ -0,0 +1,71 @@
+"""
+Meeting minutes storage.
+Each meeting of a user is a document minutes/{userName}/meetings/{meetingId}
+({"timestamp", "content"}), so the latest one is fetched with an indexed
+order_by("timestamp", DESCENDING).limit(1) query.
+Minutes written in the previous layout (one minutes/{userName} document mapping
+meeting ids to {"timestamp", "content"}) are still read: the minutes are written
+by another service, which may keep using that layout after a user was migrated
+with migrate_minutes (python -m utils.minutes_store).
+"""
+
+import sys
+from typing import Optional
+
+import utils.connect_firestore as connect_firestore
+from utils.logging import logger
+
+MINUTES_COLLECTION = "minutes"
+
+
+def meetings_collection(user_name: str) -> str:
+    return f"{MINUTES_COLLECTION}/{user_name}/meetings"
+
+
+def add_minutes(user_name: str, meeting_id: str, content: str, timestamp: object) -> None:
+    connect_firestore.add_data(meetings_collection(user_name), meeting_id, {"timestamp": timestamp, "content": content})
+
+
+def migrate_minutes(user_name: str, legacy_meetings: Optional[dict] = None) -> int:
+    """
+    Move the meetings of a legacy minutes/{userName} document to minutes/{userName}/meetings
+    :param user_name: str
+    :param legacy_meetings: dict (the legacy document, read from Firestore if None)
+    :return: number of migrated meetings
+    """
+    if legacy_meetings is None:
+        legacy_meetings = connect_firestore.get_data(MINUTES_COLLECTION, user_name) or {}
+    meetings = {meeting_id: data for meeting_id, data in legacy_meetings.items() if isinstance(data, dict)}
+    if not meetings:
+        return 0
+    # Copy first, then remove the copied fields: an interrupted migration can simply be run again
+    connect_firestore.batch_set(
+        [(meetings_collection(user_name), meeting_id, data) for meeting_id, data in meetings.items()]
+    )
+    connect_firestore.delete_fields(MINUTES_COLLECTION, user_name, list(meetings))
+    logger.info("Minutes migrated", user=user_name, meetings=len(meetings))
+    return len(meetings)
+
+
+def get_latest_minutes(user_name: str) -> Optional[dict]:
+    """
+    Get the latest meeting of a user
+    :param user_name: str
+    :return: dict ({"timestamp", "content"}), or None if the user has no meeting with a timestamp
+    """
+    meetings = []
+    latest = connect_firestore.get_latest_data(meetings_collection(user_name), "timestamp")
+    if latest is not None:
+        meetings.append(latest)
+    # Meetings written in the legacy document, before or after a migration, left untouched for its other readers
+    legacy_meetings = connect_firestore.get_data(MINUTES_COLLECTION, user_name) or {}
+    meetings += [data for data in legacy_meetings.values() if isinstance(data, dict) and "timestamp" in data]
+    return max(meetings, key=lambda data: data["timestamp"], default=None)
+
+
+if __name__ == "__main__":
+    # Migrate every user, or the users given as arguments:
+    # python -m utils.minutes_store [userName ...]
+    user_names = sys.argv[1:] or connect_firestore.get_document_list(MINUTES_COLLECTION)
+    for user_name in user_names:
+        print(f"{user_name}: {migrate_minutes(user_name)} meetings migrated")
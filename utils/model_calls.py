@@ -0,0 +1,389 @@
+"""
+Guarded model calls.
+A slow or failing model must not take up the request threads of the instance
+(gunicorn runs 8 threads with --timeout 0), so every model call goes through
+ModelCallExecutor:
+- at most LLM_MAX_CONCURRENCY calls of each model run at once, on threads of their
+  own; a call waits for a free slot only until its deadline. Models do not share
+  their slots, so that long summaries (background folds and map-reduce fan-out on the
+  summary model) cannot starve the word extractions of /get_supplement
+- the caller stops waiting at the deadline (a late call keeps its slot until it returns,
+  so that slow calls keep counting against the limit)
+- 429 and 5xx errors are retried with exponential backoff and full jitter, within the
+  deadline and a retry budget shared by all calls, so that retries cannot multiply the
+  load of a failing model
+- a circuit breaker per model fails calls fast after repeated failures, then lets one
+  trial call through after LLM_BREAKER_OPEN_SECONDS
+- a streamed response is read into a queue on a call thread, so that its slot is freed
+  when the model is done (or at the deadline), however slowly the client reads the stream
+Calls that cannot be answered raise ModelUnavailable; callers answer from their
+caches, or with an empty result.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+from utils.logging import logger
+
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# Attempts of a call failing with a retryable error
+MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "0.5"))
+# Each call earns this many retries, up to RETRY_BUDGET_MAX saved retries
+RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MAX = float(os.getenv("LLM_RETRY_BUDGET_MAX", "10"))
+# Consecutive failed attempts (retryable errors, timeouts) opening the circuit of a model
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+# Longest wait for the next chunk of a streamed response
+STREAM_CHUNK_TIMEOUT_SECONDS = float(os.getenv("LLM_STREAM_CHUNK_TIMEOUT_SECONDS", "30"))
+
+# HTTP status of the retryable errors (google.api_core.exceptions.GoogleAPICallError.code)
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+# Polling interval of an async call waiting for a free slot
+SLOT_POLL_SECONDS = 0.01
+
+
+class ModelUnavailable(Exception):
+    """The model could not answer: busy, too slow, failing, or its circuit is open"""
+
+
+class ModelBusy(ModelUnavailable):
+    """No call slot was freed before the deadline"""
+
+
+class ModelCallTimeout(ModelUnavailable):
+    """The call did not return before the deadline"""
+
+
+class CircuitOpen(ModelUnavailable):
+    """The model failed repeatedly, calls fail fast for a while"""
+
+
+def retryable(error: BaseException) -> bool:
+    return getattr(error, "code", None) in RETRYABLE_CODES
+
+
+class CircuitBreaker:
+    """
+    Closed: calls pass. Opened by failure_threshold consecutive failures: calls fail fast.
+    Half-open after open_seconds: one trial call passes, and closes or opens the circuit again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURES, open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._trial or time.monotonic() - self._opened_at >= self.open_seconds:
+                return "half_open"
+            return "open"
+
+    def rejects(self) -> bool:
+        """Whether a call would fail fast now (checked before waiting for a slot)"""
+        with self._lock:
+            return self._opened_at is not None and (
+                self._trial or time.monotonic() - self._opened_at < self.open_seconds
+            )
+
+    def allow(self) -> bool:
+        """Admit a call, as the trial call if the circuit is half-open"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Model circuit closed", model=self.name)
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial or (self._opened_at is None and self._failures >= self.failure_threshold):
+                logger.warning("Model circuit opened", model=self.name, failures=self._failures)
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+class RetryBudget:
+    """
+    Token bucket of retries: every call deposits ratio tokens, every retry takes one
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, max_tokens: float = RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CallSlots:
+    """
+    Call slots of a model, and the threads running its calls
+    """
+
+    def __init__(self, name: str, max_concurrency: int):
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"model-call-{name}")
+
+
+class ModelCallExecutor:
+    """
+    Runs model calls with a concurrency limit, deadlines, retries and a circuit breaker per model
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        max_attempts: int = MAX_ATTEMPTS,
+        backoff_seconds: float = BACKOFF_SECONDS,
+        retry_budget: Optional[RetryBudget] = None,
+        failure_threshold: int = BREAKER_FAILURES,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+        chunk_timeout: float = STREAM_CHUNK_TIMEOUT_SECONDS,
+    ):
+        self.max_attempts = max_attempts
+        self.chunk_timeout = chunk_timeout
+        self.backoff_seconds = backoff_seconds
+        self.retry_budget = retry_budget or RetryBudget()
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_concurrency = max_concurrency
+        self._slots: dict[str, CallSlots] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def slots(self, name: str) -> CallSlots:
+        with self._lock:
+            slots = self._slots.get(name)
+            if slots is None:
+                slots = self._slots[name] = CallSlots(name, self.max_concurrency)
+            return slots
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name, self.failure_threshold, self.open_seconds)
+            return breaker
+
+    def call(self, name: str, fn: Callable[[], Any], timeout: float) -> Any:
+        """
+        Call fn (a blocking model call) within timeout seconds, retrying it on 429/5xx
+        :param name: str (model name, one circuit per model)
+        :param fn: Callable
+        :param timeout: float (deadline of the call, retries included)
+        :return: result of fn
+        :raises ModelUnavailable: if the model did not answer in time, or its circuit is open
+        """
+        deadline = time.monotonic() + timeout
+        breaker = self.breaker(name)
+        slots = self.slots(name)
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            self._admit(name, slots, breaker, deadline)
+            future = slots.pool.submit(fn)
+            # The slot is freed when the call returns, even after the caller stopped waiting
+            future.add_done_callback(lambda _: slots.semaphore.release())
+            try:
+                result = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except TimeoutError:
+                breaker.record_failure()
+                raise ModelCallTimeout(f"{name} did not answer within {timeout:.0f} s") from None
+            except Exception as e:
+                error = e
+            else:
+                breaker.record_success()
+                return result
+            attempt += 1
+            time.sleep(self._retry_delay(name, breaker, error, attempt, deadline))
+
+    async def call_async(self, name: str, fn: Callable[[], Awaitable[Any]], timeout: float) -> Any:
+        """
+        Same as call for a coroutine function, run on the event loop and cancelled at the deadline
+        """
+        deadline = time.monotonic() + timeout
+        breaker = self.breaker(name)
+        slots = self.slots(name)
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            if breaker.rejects():
+                raise CircuitOpen(f"{name}: circuit open")
+            # Polled, so that an abandoned wait cannot take a slot
+            while not slots.semaphore.acquire(blocking=False):
+                if time.monotonic() >= deadline:
+                    raise ModelBusy(f"{name}: no free call slot before the deadline")
+                await asyncio.sleep(SLOT_POLL_SECONDS)
+            try:
+                if not breaker.allow():
+                    raise CircuitOpen(f"{name}: circuit open")
+                result = await asyncio.wait_for(fn(), max(0.0, deadline - time.monotonic()))
+            except CircuitOpen:
+                raise
+            except TimeoutError:
+                breaker.record_failure()
+                raise ModelCallTimeout(f"{name} did not answer within {timeout:.0f} s") from None
+            except Exception as e:
+                error = e
+            else:
+                breaker.record_success()
+                return result
+            finally:
+                slots.semaphore.release()
+            attempt += 1
+            await asyncio.sleep(self._retry_delay(name, breaker, error, attempt, deadline))
+
+    def stream(self, name: str, fn: Callable[[], Iterator[Any]], timeout: float) -> Iterator[Any]:
+        """
+        Same as call for a streamed response: the chunks are read on a call thread, which frees the slot
+        as soon as the response is complete. Waiting more than chunk_timeout seconds for a chunk, or reaching
+        the deadline, raises ModelCallTimeout. The call is retried only if it fails before its first chunk.
+        """
+        deadline = time.monotonic() + timeout
+        breaker = self.breaker(name)
+        slots = self.slots(name)
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            self._admit(name, slots, breaker, deadline)
+            chunks: queue.SimpleQueue = queue.SimpleQueue()
+            stop = threading.Event()
+            slots.pool.submit(self._pump, name, fn, chunks, stop, deadline, slots)
+            started = False
+            try:
+                for chunk in self._read(name, chunks, deadline):
+                    started = True
+                    yield chunk
+            except GeneratorExit:
+                # The consumer stopped reading a response that was coming
+                breaker.record_success()
+                raise
+            except ModelCallTimeout:
+                breaker.record_failure()
+                raise
+            except Exception as e:
+                if started:
+                    self._record(breaker, e)
+                    raise
+                error = e
+            else:
+                breaker.record_success()
+                return
+            finally:
+                stop.set()
+            attempt += 1
+            time.sleep(self._retry_delay(name, breaker, error, attempt, deadline))
+
+    def _pump(
+        self,
+        name: str,
+        fn: Callable[[], Iterator[Any]],
+        chunks: queue.SimpleQueue,
+        stop: threading.Event,
+        deadline: float,
+        slots: CallSlots,
+    ) -> None:
+        """Read a streamed response into chunks, holding the call slot taken for it until the response ends"""
+        try:
+            response = fn()
+            try:
+                for chunk in response:
+                    if stop.is_set():
+                        return
+                    if time.monotonic() >= deadline:
+                        chunks.put(("error", ModelCallTimeout(f"{name} did not finish its response in time")))
+                        return
+                    chunks.put(("chunk", chunk))
+            finally:
+                close = getattr(response, "close", None)
+                if close is not None:
+                    close()
+            chunks.put(("done", None))
+        except Exception as e:
+            chunks.put(("error", e))
+        finally:
+            slots.semaphore.release()
+
+    def _read(self, name: str, chunks: queue.SimpleQueue, deadline: float) -> Iterator[Any]:
+        """Chunks read by _pump, waiting chunk_timeout seconds at most for each one, until the deadline"""
+        while True:
+            try:
+                kind, value = chunks.get(timeout=max(0.0, min(self.chunk_timeout, deadline - time.monotonic())))
+            except queue.Empty:
+                raise ModelCallTimeout(f"{name} sent no chunk in time") from None
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield value
+
+    def _admit(self, name: str, slots: CallSlots, breaker: CircuitBreaker, deadline: float) -> None:
+        """Take a call slot of the model, waiting until the deadline at most, and pass the circuit breaker"""
+        if breaker.rejects():
+            raise CircuitOpen(f"{name}: circuit open")
+        if not slots.semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise ModelBusy(f"{name}: no free call slot before the deadline")
+        if not breaker.allow():
+            slots.semaphore.release()
+            raise CircuitOpen(f"{name}: circuit open")
+
+    @staticmethod
+    def _record(breaker: CircuitBreaker, error: BaseException) -> None:
+        # A model answering with a non-retryable error (e.g. 400) is up
+        if retryable(error):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def _retry_delay(self, name: str, breaker: CircuitBreaker, error: Exception, attempt: int, deadline: float) -> float:
+        """
+        Backoff before the next attempt of a failed call
+        :raises: error if it is not retryable, ModelUnavailable if it cannot be retried
+        """
+        self._record(breaker, error)
+        if not retryable(error):
+            raise error
+        delay = random.uniform(0, self.backoff_seconds * 2 ** (attempt - 1))
+        if attempt >= self.max_attempts or time.monotonic() + delay >= deadline or not self.retry_budget.withdraw():
+            raise ModelUnavailable(f"{name} failed after {attempt} attempt(s): {error}") from error
+        logger.info("Model call retried", model=name, attempt=attempt, error=str(error))
+        return delay
+
+
+model_calls = ModelCallExecutor()
@@ -0,0 +1,92 @@
+"""
+Document storage interface.
+Meetings (transcript_store), minutes (minutes_store) and user glossaries (glossary)
+are stored as documents {collection}/{documentId} through the helpers of
+utils.connect_firestore, which delegate to the Repository selected by STORAGE_BACKEND:
+FirestoreRepository, or one of the local backends of utils.local_repository.
+Collection names are paths, so a subcollection is just another collection
+(e.g. meeting/{meetId}/segments).
+"""
+
+import abc
+from typing import Any, Iterable, Iterator, Optional
+
+# (collection name, document id, data)
+Write = tuple[str, str, dict]
+
+
+class WriteConflict(Exception):
+    """A guarded document was changed (or created) by someone else since it was read"""
+
+
+class Repository(abc.ABC):
+    """
+    Document storage of the app. Documents are dicts of JSON-like values;
+    writes on missing documents raise KeyError in the local backends
+    (google.api_core.exceptions.NotFound with Firestore).
+    """
+
+    def warm_up(self) -> None:
+        """Open the connection ahead of the first request"""
+
+    @abc.abstractmethod
+    def add_data(self, collection_name: str, document_id: str, data: dict) -> None:
+        """Create a document, or merge data into it (nested maps are merged too)"""
+
+    @abc.abstractmethod
+    def get_data(self, collection_name: str, document_id: str) -> Optional[dict]:
+        """The document, or None if it does not exist"""
+
+    @abc.abstractmethod
+    def get_data_with_update_time(self, collection_name: str, document_id: str) -> tuple[Optional[dict], Any]:
+        """
+        The document and its update time (the version to pass to set_if_unchanged)
+        :return: (dict, update time), or (None, None) if the document does not exist
+        """
+
+    @abc.abstractmethod
+    def set_if_unchanged(
+        self, collection_name: str, document_id: str, data: dict, update_time: Any, writes: Iterable[Write] = ()
+    ) -> Any:
+        """
+        Set fields of a document, together with other (merged) writes, only if the document is unchanged since
+        update_time, or still does not exist if update_time is None
+        :return: the new update time of the document
+        :raises WriteConflict: if the document changed
+        """
+
+    @abc.abstractmethod
+    def update_data(self, collection_name: str, document_id: str, data: dict) -> None:
+        """Replace fields of an existing document"""
+
+    @abc.abstractmethod
+    def batch_set(self, writes: list[Write]) -> None:
+        """Merge data into several documents"""
+
+    @abc.abstractmethod
+    def stream_data(self, collection_name: str, order_by: str, start_at: Any = None) -> Iterator[dict]:
+        """The documents of a collection that have the order_by field, in its order, from start_at on"""
+
+    @abc.abstractmethod
+    def get_latest_data(self, collection_name: str, order_by: str) -> Optional[dict]:
+        """The document with the largest order_by value of a collection, or None"""
+
+    @abc.abstractmethod
+    def delete_fields(self, collection_name: str, document_id: str, field_names: list[str]) -> None:
+        """Delete top-level fields of an existing document"""
+
+    @abc.abstractmethod
+    def delete_collection(self, collection_name: str) -> None:
+        """Delete every document of a collection"""
+
+    @abc.abstractmethod
+    def get_document_list(self, collection_name: str) -> list[str]:
+        """Ids of the documents of a collection"""
+
+    @abc.abstractmethod
+    def get_word_list(self, collection_name: str, document_id: str) -> list[str]:
+        """Top-level field names of a document (empty if it does not exist)"""
+
+    @abc.abstractmethod
+    def delete_data(self, collection_name: str, document_id: str) -> None:
+        """Delete a document (its subcollections are kept)"""
@@ -0,0 +1,139 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import threading
+import time
+from typing import Optional
+
+from utils.logging import logger
+from utils.meeting_summarizer import MeetingSummarizer
+import utils.transcript_store as transcript_store
+from utils.ttl_cache import TTLCache
+
+# The confirmed transcript is folded into the running summary once this many characters
+# are waiting, or when this many seconds have passed since the last fold
+FOLD_CHARS = int(os.getenv("ROLLING_SUMMARY_FOLD_CHARS", "2000"))
+FOLD_SECONDS = float(os.getenv("ROLLING_SUMMARY_FOLD_SECONDS", "60"))
+MAX_WORKERS = int(os.getenv("ROLLING_SUMMARY_WORKERS", "2"))
+# Summaries are kept after /end_meet so that they can still be returned
+STATE_TTL_SECONDS = float(os.getenv("ROLLING_SUMMARY_TTL_SECONDS", "14400"))
+
+
+class _RollingSummaryState:
+    def __init__(self, generation: Optional[str]):
+        # Generation of the meeting summarised (meet codes are reused)
+        self.generation = generation
+        self.lock = threading.Lock()
+        # Serialises folds of the same meeting
+        self.fold_lock = threading.Lock()
+        self.summary: Optional[dict] = None
+        # First segment not folded into the summary (None: nothing folded, legacy transcript included)
+        self.folded_seq: Optional[int] = None
+        # Characters fed since the last fold
+        self.pending_chars = 0
+        self.last_fold = time.monotonic()
+        self.folding: Optional[Future] = None
+
+
+class RollingSummarizer:
+    """
+    Maintains a running summary per meeting while it is transcribed.
+    Newly confirmed text is folded into the summary in the background, so that
+    finalize() only has to summarise the small tail that is left.
+    Folds read the segments after the last folded one from storage: the text fed to
+    this process only schedules them, so the summary also covers what other instances
+    (or this one before a restart) saved.
+    A summary is kept for one generation of the meeting: it is dropped once the meetId
+    is reused for a new meeting, even if another instance ended the earlier one.
+    """
+
+    def __init__(
+        self,
+        summarizer: MeetingSummarizer,
+        fold_chars: int = FOLD_CHARS,
+        fold_seconds: float = FOLD_SECONDS,
+        max_workers: int = MAX_WORKERS,
+    ):
+        self.summarizer = summarizer
+        self.fold_chars = fold_chars
+        self.fold_seconds = fold_seconds
+        self._states = TTLCache(max_size=1024, ttl_seconds=STATE_TTL_SECONDS)
+        self._states_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rolling-summary")
+
+    def feed(self, meet_id: str, confirmed_text: str, generation: Optional[str] = None) -> None:
+        """
+        Add newly confirmed transcript of a meeting, scheduling a fold when a threshold is reached
+        :param generation: str (generation of the meeting the text was saved to)
+        """
+        with self._states_lock:
+            state = self._states.get(meet_id)
+            if state is not None and state.generation != generation:
+                # A new meeting with the same meetId: drop the summary of the earlier one
+                state = None
+                self._states.pop(meet_id)
+            if not confirmed_text:
+                return
+            if state is None:
+                state = _RollingSummaryState(generation)
+            # Refresh the TTL of active meetings
+            self._states.put(meet_id, state)
+        with state.lock:
+            state.pending_chars += len(confirmed_text)
+            due = state.pending_chars >= self.fold_chars or time.monotonic() - state.last_fold >= self.fold_seconds
+            if due and state.folding is None:
+                state.folding = self._executor.submit(self._fold_in_background, meet_id, state)
+
+    def finalize(self, meet_id: str) -> Optional[dict]:
+        """
+        Running summary of a meeting, with the not yet folded tail and the unconfirmed caption window folded in
+        :return: dict (summary), or None if nothing was transcribed for the meeting on this instance
+        """
+        state = self._states.get(meet_id)
+        if state is None:
+            return None
+        with state.fold_lock:
+            session, text, next_seq = transcript_store.read_delta(meet_id, state.folded_seq)
+            if session is None:
+                # The meeting ended: its summary is complete
+                return state.summary
+            if session.generation != state.generation:
+                # Another instance ended the meeting and a new one reuses its meetId
+                self._drop(meet_id, state)
+                return None
+            if session.archive_text:
+                # Not kept: the window and the tail are folded again once the window is confirmed
+                return self.summarizer.update(state.summary, text + session.archive_text)
+            if text:
+                state.summary = self.summarizer.update(state.summary, text)
+                state.folded_seq = next_seq
+            return state.summary
+
+    def _fold(self, meet_id: str, state: _RollingSummaryState) -> None:
+        with state.fold_lock:
+            with state.lock:
+                state.pending_chars = 0
+            try:
+                session, text, next_seq = transcript_store.read_delta(meet_id, state.folded_seq)
+                if session is None or session.generation != state.generation:
+                    # Ended, or replaced by a new meeting: nothing of this meeting to fold
+                    return
+                if text:
+                    state.summary = self.summarizer.update(state.summary, text)
+                    state.folded_seq = next_seq
+            finally:
+                with state.lock:
+                    state.last_fold = time.monotonic()
+
+    def _drop(self, meet_id: str, state: _RollingSummaryState) -> None:
+        with self._states_lock:
+            if self._states.get(meet_id) is state:
+                self._states.pop(meet_id)
+
+    def _fold_in_background(self, meet_id: str, state: _RollingSummaryState) -> None:
+        try:
+            self._fold(meet_id, state)
+        except Exception as e:
+            logger.error(f"Error folding the summary of {meet_id}: {e}")
+        finally:
+            with state.lock:
+                state.folding = None
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+# Longest time a caller waits for a call started by another caller
+WAIT_TIMEOUT_SECONDS = float(os.getenv("SINGLE_FLIGHT_TIMEOUT_SECONDS", "120"))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function, the others wait for it and get its result (or its exception).
+    """
+
+    def __init__(self, timeout: float = WAIT_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._calls: dict[Hashable, _Call] = {}
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run fn() once for all the threads calling with the same key at the same time
+        :param key: Hashable
+        :param fn: Callable
+        :param timeout: float (seconds a waiting caller waits; the instance default if None)
+        :return: result of fn()
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(self.timeout if timeout is None else timeout):
+            raise TimeoutError(f"Timed out waiting for the in-flight call {key!r}")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def do_async(
+        self, key: Hashable, fn: Callable[[], Awaitable[Any]], timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Same as do for coroutines running on one event loop
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # shield: a waiter timing out must not cancel the call the others are waiting for
+        return await asyncio.wait_for(asyncio.shield(task), self.timeout if timeout is None else timeout)
+
+
+llm_flight = SingleFlight()
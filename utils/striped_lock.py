@@ -0,0 +1,20 @@
+import threading
+from typing import Hashable, Iterable
+
+
+class StripedLock:
+    """
+    Fixed pool of locks shared between keys by hash: work on one key is serialised,
+    while different keys mostly run in parallel, without a lock per key to clean up
+    :param stripes: int (number of locks)
+    """
+
+    def __init__(self, stripes: int):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def lock(self, key: Hashable) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+    def locks(self, keys: Iterable[Hashable]) -> list[threading.Lock]:
+        """Locks of several keys, each once and in a fixed order, so that taking them in turn cannot deadlock"""
+        return [self._locks[stripe] for stripe in sorted({hash(key) % len(self._locks) for key in keys})]
@@ -0,0 +1,75 @@
+from dataclasses import dataclass, field
+import os
+import threading
+from typing import Optional
+
+from utils.ttl_cache import TTLCache
+
+# Tail of the already analysed transcript sent along with the new text
+CONTEXT_CHARS = int(os.getenv("SUPPLEMENT_CONTEXT_CHARS", "200"))
+CURSOR_TTL_SECONDS = float(os.getenv("SUPPLEMENT_CURSOR_TTL_SECONDS", "7200"))
+MAX_CURSORS = int(os.getenv("SUPPLEMENT_CURSOR_MAX", "4096"))
+
+
+@dataclass
+class SupplementCursor:
+    """
+    How much of a meeting transcript has been analysed for a (meetId, userName, role)
+    :param next_seq: int (first segment not analysed yet; None before the first analysis)
+    :param context_text: str (tail of the analysed transcript)
+    :param supplements: dict (word -> description extracted so far)
+    :param generation: str (generation of the meeting analysed, see utils.transcript_store)
+    """
+
+    next_seq: Optional[int] = None
+    context_text: str = ""
+    supplements: dict[str, str] = field(default_factory=dict)
+    generation: Optional[str] = None
+
+    def advance(self, next_seq: int, analysed_text: str, supplements: dict[str, str]) -> "SupplementCursor":
+        """
+        Cursor after analysing the transcript up to next_seq
+        """
+        return SupplementCursor(
+            next_seq,
+            (self.context_text + analysed_text)[-CONTEXT_CHARS:] if CONTEXT_CHARS else "",
+            {**self.supplements, **supplements},
+            self.generation,
+        )
+
+
+class SupplementCursorStore:
+    """
+    SupplementCursor cache keyed by (meetId, userName, role) with TTL/LRU eviction.
+    An evicted cursor only means the next poll analyses the whole transcript again.
+    Meet codes are reused: the cursors of a meeting are dropped when it ends, and a cursor
+    of another generation of the meeting (ended on another instance) is not resumed.
+    """
+
+    def __init__(self, max_cursors: int = MAX_CURSORS, ttl_seconds: float = CURSOR_TTL_SECONDS):
+        self._cache = TTLCache(max_size=max_cursors, ttl_seconds=ttl_seconds)
+        # meetId -> (userName, role) of its cursors, refreshed with them so that it outlives them
+        self._meetings = TTLCache(max_size=max_cursors, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+
+    def get(self, meet_id: str, user_name: str, role: str) -> SupplementCursor:
+        return self._cache.get((meet_id, user_name, role)) or SupplementCursor()
+
+    def put(self, meet_id: str, user_name: str, role: str, cursor: SupplementCursor) -> None:
+        # Concurrent polls may finish out of order: never move a cursor backwards
+        with self._lock:
+            current = self._cache.get((meet_id, user_name, role))
+            if current is None or current.generation != cursor.generation or (current.next_seq or 0) <= cursor.next_seq:
+                self._cache.put((meet_id, user_name, role), cursor)
+                self._meetings.put(meet_id, self._meetings.get(meet_id, frozenset()) | {(user_name, role)})
+
+    def invalidate(self, meet_id: str) -> None:
+        """
+        Drop the cursors of a meeting, so that a new meeting with the same meetId is analysed from its start
+        """
+        with self._lock:
+            for user_name, role in self._meetings.pop(meet_id, frozenset()):
+                self._cache.pop((meet_id, user_name, role))
+
+
+supplement_cursors = SupplementCursorStore()
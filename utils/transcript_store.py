@@ -0,0 +1,201 @@
+"""
+Segmented transcript storage.
+meeting/{meetId} holds the archive text, the number of confirmed segments and the
+generation of the meeting (an id written when the document is created, so that the
+per-meeting state cached by an instance can tell a new meeting reusing the meet code
+from the one it was built for), each confirmed text is appended as meeting/{meetId}/segments/{seq}, so a write
+costs O(chunk) instead of rewriting the whole transcript.
+
+Each save is committed at once, only if the meeting document is unchanged since
+its session was read, and the caller merges again on connect_firestore.WriteConflict,
+so that instances serving the same meeting cannot overwrite each other's segments.
+With TRANSCRIPT_OPTIMISTIC_COMMITS=false (a single instance per meeting, e.g.
+session affinity with max instances 1), writes are queued on the write-behind
+transcript_writer instead, saving a round trip per save.
+"""
+
+import os
+import random
+import time
+from typing import Iterator, Optional
+import uuid
+
+import utils.connect_firestore as connect_firestore
+from utils.meeting_session import MeetingSession
+from utils.transcript_writer import transcript_writer
+
+MEETING_COLLECTION = "meeting"
+
+OPTIMISTIC_COMMITS = os.getenv("TRANSCRIPT_OPTIMISTIC_COMMITS", "true").lower() == "true"
+# Attempts of a save that keeps conflicting with other instances
+COMMIT_ATTEMPTS = int(os.getenv("TRANSCRIPT_COMMIT_ATTEMPTS", "5"))
+COMMIT_BACKOFF_SECONDS = 0.05
+
+
+def segment_collection(meet_id: str) -> str:
+    return f"{MEETING_COLLECTION}/{meet_id}/segments"
+
+
+def segment_id(seq: int) -> str:
+    # Zero padded so that the document ids sort in sequence order
+    return f"{seq:08d}"
+
+
+def new_session() -> MeetingSession:
+    """
+    State of a meeting that is not saved yet, with a new generation
+    """
+    return MeetingSession(generation=uuid.uuid4().hex)
+
+
+def _session(meeting_data: dict, update_time: object) -> MeetingSession:
+    return MeetingSession(
+        meeting_data["archive_text"], meeting_data.get("segment_count", 0), update_time, meeting_data.get("generation")
+    )
+
+
+def _meeting_document(session: MeetingSession, archive_text: str, segment_count: int) -> dict:
+    data = {"archive_text": archive_text, "segment_count": segment_count}
+    if session.generation is not None:
+        data["generation"] = session.generation
+    return data
+
+
+def load_session(meet_id: str) -> Optional[MeetingSession]:
+    """
+    Load the meeting state from Firestore
+    :param meet_id: str
+    :return: MeetingSession, or None if the meeting does not exist
+    """
+    # Pending writes of an evicted session must land before it is reloaded
+    transcript_writer.flush([meet_id])
+    meeting_data, update_time = connect_firestore.get_data_with_update_time(MEETING_COLLECTION, meet_id)
+    if meeting_data is None:
+        return None
+    return _session(meeting_data, update_time)
+
+
+def save(meet_id: str, session: Optional[MeetingSession], confirmed_text: str, archive_text: str) -> MeetingSession:
+    """
+    Save a merge of the meeting: append the confirmed text as a new segment and replace the archive text
+    :param meet_id: str
+    :param session: MeetingSession the merge started from (None for a new meeting)
+    :param confirmed_text: str
+    :param archive_text: str
+    :return: MeetingSession (the saved state)
+    :raises connect_firestore.WriteConflict: with OPTIMISTIC_COMMITS, if the meeting changed since session was read
+    """
+    if OPTIMISTIC_COMMITS:
+        return commit(meet_id, session, confirmed_text, archive_text)
+    if session is None:
+        session = new_session()
+    append(meet_id, session, confirmed_text, archive_text)
+    return session
+
+
+def commit(meet_id: str, session: Optional[MeetingSession], confirmed_text: str, archive_text: str) -> MeetingSession:
+    """
+    Same as save, written at once with a precondition on the update time of the meeting document
+    session is left unchanged, so that it can be discarded on a conflict
+    """
+    # Land writes queued before the mode was enabled ahead of the guarded write
+    transcript_writer.flush([meet_id])
+    if session is None:
+        session = new_session()
+    segment_count = session.segment_count
+    writes = []
+    if confirmed_text:
+        writes.append(
+            (segment_collection(meet_id), segment_id(segment_count), {"seq": segment_count, "text": confirmed_text})
+        )
+        segment_count += 1
+    update_time = connect_firestore.set_if_unchanged(
+        MEETING_COLLECTION,
+        meet_id,
+        _meeting_document(session, archive_text, segment_count),
+        session.update_time,
+        writes,
+    )
+    return MeetingSession(archive_text, segment_count, update_time, session.generation)
+
+
+def backoff(attempt: int) -> None:
+    """
+    Wait before the next attempt of a conflicting save (exponential, with full jitter)
+    """
+    time.sleep(random.uniform(0, COMMIT_BACKOFF_SECONDS * 2**attempt))
+
+
+def append(meet_id: str, session: MeetingSession, confirmed_text: str, archive_text: str) -> None:
+    """
+    Append the confirmed text as a new segment and replace the archive text
+    """
+    if confirmed_text:
+        transcript_writer.enqueue(
+            meet_id,
+            segment_collection(meet_id),
+            segment_id(session.segment_count),
+            {"seq": session.segment_count, "text": confirmed_text},
+        )
+        session.segment_count += 1
+    session.archive_text = archive_text
+    transcript_writer.enqueue(
+        meet_id, MEETING_COLLECTION, meet_id, _meeting_document(session, archive_text, session.segment_count)
+    )
+
+
+def iter_transcript(meet_id: str, start_seq: int = 0) -> Iterator[str]:
+    """
+    Lazily yield the confirmed transcript of a meeting, segment by segment
+    :param meet_id: str
+    :param start_seq: int (first segment to read)
+    :return: Iterator[str]
+    """
+    # Read-your-writes: land this meeting's queued segments first
+    transcript_writer.flush([meet_id])
+    if start_seq == 0:
+        meeting_data = connect_firestore.get_data(MEETING_COLLECTION, meet_id)
+        if meeting_data is None:
+            return
+        # Meetings saved before segmentation keep their transcript in a single field
+        if meeting_data.get("transcript"):
+            yield meeting_data["transcript"]
+    for segment in connect_firestore.stream_data(segment_collection(meet_id), "seq", start_at=start_seq):
+        yield segment["text"]
+
+
+def read_transcript(meet_id: str, start_seq: int = 0) -> str:
+    return "".join(iter_transcript(meet_id, start_seq))
+
+
+def read_delta(meet_id: str, start_seq: Optional[int] = None) -> tuple[Optional[MeetingSession], str, int]:
+    """
+    Read the meeting state and the transcript confirmed since start_seq
+    :param meet_id: str
+    :param start_seq: int (first unread segment; None reads the whole transcript)
+    :return: (MeetingSession, or None if the meeting does not exist; text; next unread segment)
+    """
+    # Read-your-writes: land this meeting's queued segments first
+    transcript_writer.flush([meet_id])
+    texts = []
+    next_seq = start_seq or 0
+    meeting_data, update_time = connect_firestore.get_data_with_update_time(MEETING_COLLECTION, meet_id)
+    if meeting_data is None:
+        return None, "", next_seq
+    # Meetings saved before segmentation keep their transcript in a single field
+    if start_seq is None and meeting_data.get("transcript"):
+        texts.append(meeting_data["transcript"])
+    for segment in connect_firestore.stream_data(segment_collection(meet_id), "seq", start_at=next_seq):
+        texts.append(segment["text"])
+        next_seq = segment["seq"] + 1
+    return _session(meeting_data, update_time), "".join(texts), next_seq
+
+
+def delete(meet_id: str) -> None:
+    """
+    Delete the meeting and its segments
+    """
+    # Flush first so that no queued write lands after the delete
+    transcript_writer.flush([meet_id])
+    connect_firestore.delete_collection(segment_collection(meet_id))
+    connect_firestore.delete_data(MEETING_COLLECTION, meet_id)
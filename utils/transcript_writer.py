@@ -0,0 +1,104 @@
+import atexit
+from contextlib import ExitStack
+import os
+import threading
+from typing import Hashable, Iterable, Optional
+
+import utils.connect_firestore as connect_firestore
+from utils.logging import logger
+from utils.striped_lock import StripedLock
+
+# Pending writes are committed when either threshold is reached
+FLUSH_INTERVAL_SECONDS = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL_SECONDS", "1.0"))
+FLUSH_MAX_PENDING = int(os.getenv("TRANSCRIPT_FLUSH_MAX_PENDING", "100"))
+# Commits of a group hold one of these locks
+COMMIT_LOCK_STRIPES = 64
+
+
+class TranscriptWriter:
+    """
+    Write-behind buffer for Firestore documents.
+    Writes are grouped (per meeting) and deltas for the same document are
+    coalesced. A background thread commits them with batched writes every
+    flush_interval seconds, or as soon as max_pending documents are waiting.
+    Commits of a group are serialised, so that a document is never written out
+    of order; flushing a group with nothing pending returns at once.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL_SECONDS, max_pending: int = FLUSH_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: dict[Hashable, dict[tuple[str, str], dict]] = {}
+        self._pending_documents = 0
+        self._condition = threading.Condition()
+        self._commit_locks = StripedLock(COMMIT_LOCK_STRIPES)
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, group: Hashable, collection_name: str, document_id: str, data: dict) -> None:
+        """
+        Queue a merge-write of data into collection_name/document_id
+        :param group: Hashable (key used to flush related writes together, e.g. the meetId)
+        """
+        with self._condition:
+            documents = self._pending.setdefault(group, {})
+            if (collection_name, document_id) not in documents:
+                self._pending_documents += 1
+            documents.setdefault((collection_name, document_id), {}).update(data)
+            self._ensure_started()
+            if self._pending_documents >= self.max_pending:
+                self._condition.notify()
+
+    def flush(self, groups: Optional[Iterable[Hashable]] = None) -> None:
+        """
+        Commit pending writes synchronously
+        :param groups: groups to flush; all pending writes if None
+        """
+        with self._condition:
+            groups = list(self._pending) if groups is None else [group for group in groups if group in self._pending]
+        if not groups:
+            return
+        with ExitStack() as locks:
+            for lock in self._commit_locks.locks(groups):
+                locks.enter_context(lock)
+            # Taken under the commit locks: a concurrent flush may have committed some groups meanwhile
+            with self._condition:
+                pending = {group: self._pending.pop(group) for group in groups if group in self._pending}
+                self._pending_documents -= sum(len(documents) for documents in pending.values())
+            if not pending:
+                return
+            try:
+                connect_firestore.batch_set(
+                    [
+                        (collection_name, document_id, data)
+                        for documents in pending.values()
+                        for (collection_name, document_id), data in documents.items()
+                    ]
+                )
+            except Exception:
+                # Put the writes back under any newer deltas so nothing is lost
+                with self._condition:
+                    for group, documents in pending.items():
+                        newer = self._pending.setdefault(group, {})
+                        for key, data in documents.items():
+                            if key not in newer:
+                                self._pending_documents += 1
+                            newer[key] = {**data, **newer.get(key, {})}
+                raise
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending_documents >= self.max_pending, timeout=self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing transcript: {e}")
+
+
+transcript_writer = TranscriptWriter()
+atexit.register(transcript_writer.flush)
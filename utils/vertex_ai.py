@@ -0,0 +1,59 @@
+"""
+Lazy Vertex AI setup.
+vertexai (google-cloud-aiplatform) takes seconds to import, so it is only imported,
+and initialised, when the first model is needed (or by warm_up).
+"""
+
+import os
+import threading
+from typing import Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from vertexai.generative_models import GenerationConfig, GenerativeModel
+
+# Default project of the credentials (metadata server or ADC) if not set
+PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
+LOCATION = os.getenv("GOOGLE_CLOUD_REGION") or "us-central1"
+
+_lock = threading.Lock()
+_initialized = False
+_models: dict[str, "GenerativeModel"] = {}
+
+
+def init() -> None:
+    """Initialise Vertex AI once per process"""
+    global _initialized
+    if not _initialized:
+        with _lock:
+            if not _initialized:
+                import vertexai
+
+                vertexai.init(project=PROJECT_ID, location=LOCATION)
+                _initialized = True
+
+
+def get_model(model_name: str) -> "GenerativeModel":
+    """Shared GenerativeModel for model_name, created on first use"""
+    model = _models.get(model_name)
+    if model is None:
+        init()
+        with _lock:
+            model = _models.get(model_name)
+            if model is None:
+                from vertexai.generative_models import GenerativeModel
+
+                model = _models[model_name] = GenerativeModel(model_name)
+    return model
+
+
+def json_config(response_schema: Any) -> "GenerationConfig":
+    """Generation config asking for a JSON response following response_schema"""
+    from vertexai.generative_models import GenerationConfig
+
+    return GenerationConfig(response_mime_type="application/json", response_schema=response_schema)
+
+
+def warm_up(*model_names: str) -> None:
+    """Import and initialise Vertex AI, and create the models, ahead of the first request"""
+    for model_name in model_names:
+        get_model(model_name)